@@ -1,76 +1,162 @@
+from __future__ import annotations
+
+import os
+from importlib import import_module
+
 from flask import Flask, render_template
 from flask_cors import CORS
 
+from . import services
 from .config import Config
-from .database import (
-    ensure_bill_detail_update_time_column,
-    ensure_room_billing_start_temp_column,
-    ensure_room_daily_rate_column,
-    ensure_room_last_temp_update_column,
-    seed_default_ac_config,
-)
+from .database import migrate_schema, seed_default_ac_config
 from .extensions import db
-from .services import room_service, temperature_scheduler
+from .utils.db_pool import apply_engine_options, configure_sqlite_engines
+from .utils.log import configure_logging, get_logger, parse_sample_rates
 from .utils.time_master import clock
 
+# 核心蓝图始终注册；可选蓝图由 OPTIONAL_BLUEPRINTS 控制，未启用时连模块都不导入
+_CORE_BLUEPRINTS = (
+    ("ac_controller", "ac_bp"),
+    ("admin_controller", "admin_bp"),
+    ("bill_controller", "bill_bp"),
+    ("hotel_controller", "hotel_bp"),
+    ("monitor_controller", "monitor_bp"),
+)
+_OPTIONAL_BLUEPRINTS = {
+    "monitoring": ("monitoring_controller", "monitoring_bp"),
+    "report": ("report_controller", "report_bp"),
+    "test": ("test_controller", "test_bp"),
+}
+
+
+def _register_blueprints(app: Flask) -> None:
+    enabled = {
+        name.strip().lower()
+        for name in str(app.config.get("OPTIONAL_BLUEPRINTS", "")).split(",")
+        if name.strip()
+    }
+    modules = list(_CORE_BLUEPRINTS)
+    modules += [spec for name, spec in _OPTIONAL_BLUEPRINTS.items() if name in enabled]
+    for module_name, attr in modules:
+        module = import_module(f"{__name__}.controllers.{module_name}")
+        app.register_blueprint(getattr(module, attr))
+
 
 def create_app(
-    config_class: type[Config] = Config, *, setup_database: bool = True
+    config_class: type[Config] = Config,
+    *,
+    setup_database: bool = True,
+    start_background: bool = True,
 ) -> Flask:
+    """
+    setup_database: 是否写入默认 AC 配置与房间数据
+    start_background: 是否恢复调度队列并启动后台线程（温度 tick、leader IPC）；
+                      CLI 脚本等短生命周期进程传 False
+    """
     app = Flask(__name__, template_folder="templates", static_folder="static")
     app.config.from_object(config_class)
+    configure_logging(
+        level=app.config["HOTEL_LOG_LEVEL"],
+        fmt=app.config["HOTEL_LOG_FORMAT"],
+        sample_rates=parse_sample_rates(app.config["HOTEL_LOG_SAMPLE"]),
+        queue_size=app.config["HOTEL_LOG_QUEUE_SIZE"],
+    )
     
     # 添加CORS支持，允许跨域访问
     CORS(app, resources={r"/*": {"origins": "*"}})
     
+    # 连接池参数在创建 engine 时生效（含后台线程的独立连接池）
+    apply_engine_options(app.config)
     db.init_app(app)
+    with app.app_context():
+        configure_sqlite_engines(db.engines, app.config)
     
     # 初始化时间倍速
     speed = app.config.get("TIME_ACCELERATION_FACTOR", 1.0)
     clock.set_speed(speed)
-    print(f"=== 系统启动: 逻辑时钟倍速 x{speed} ===")
+    get_logger("Startup").info("系统启动: 逻辑时钟倍速 x%s", speed, extra={"speed": speed})
+
+    # 数据库结构按 schema_version 增量迁移：结构已是最新时只有一次查询
+    # 即使 setup_database=False 也要执行，因为 TemperatureScheduler 会立即查询 Room 表
+    with app.app_context():
+        migrate_schema()
 
     if setup_database:
         with app.app_context():
-            db.create_all()
-            # 先确保数据库字段存在，再初始化数据
-            ensure_bill_detail_update_time_column()
-            ensure_room_last_temp_update_column()
-            ensure_room_daily_rate_column()
-            ensure_room_billing_start_temp_column()
             seed_default_ac_config()
-            room_service.ensureRoomsInitialized(
+            services.room_service.ensureRoomsInitialized(
                 total_count=app.config["HOTEL_ROOM_COUNT"],
                 default_temp=app.config["HOTEL_DEFAULT_TEMP"],
             )
     
     # 启动温度自动更新后台任务
-    # === 关键修复：确保在启动 TemperatureScheduler 之前，所有必要的列都已存在 ===
-    # 即使 setup_database=False，也要确保列存在，因为 TemperatureScheduler 会立即查询 Room 表
+    role = app.config.get("SCHEDULER_ROLE", "standalone")
+    if role in ("leader", "worker"):
+        # 未显式设置 IPC 密钥时在启动任何后台线程之前失败
+        from .services.scheduler_ipc import ipc_authkey
+
+        authkey = ipc_authkey(app.config)
     with app.app_context():
-        ensure_bill_detail_update_time_column()
-        ensure_room_last_temp_update_column()
-        ensure_room_daily_rate_column()
-        ensure_room_billing_start_temp_column()
-        temperature_scheduler.start(app)
-
-    from .controllers.ac_controller import ac_bp
-    from .controllers.admin_controller import admin_bp
-    from .controllers.bill_controller import bill_bp
-    from .controllers.hotel_controller import hotel_bp
-    from .controllers.monitor_controller import monitor_bp
-    from .controllers.monitoring_controller import monitoring_bp
-    from .controllers.report_controller import report_bp
-    from .controllers.test_controller import test_bp
-
-    app.register_blueprint(ac_bp)
-    app.register_blueprint(admin_bp)
-    app.register_blueprint(bill_bp)
-    app.register_blueprint(hotel_bp)
-    app.register_blueprint(monitor_bp)
-    app.register_blueprint(monitoring_bp)
-    app.register_blueprint(report_bp)
-    app.register_blueprint(test_bp)
+        # 调度配置/费率只在启动时加载一次，之后通过 /admin/tariff/reload 热更新
+        services.tariff_service.reload()
+        # 温度历史由运行温度 tick 的进程记录（虚拟时钟下由 advance() 驱动，与是否启动后台线程无关）
+        services.temperature_history.configure(
+            size=app.config["HOTEL_TEMP_HISTORY_SIZE"],
+            interval=app.config["HOTEL_TEMP_HISTORY_INTERVAL"],
+            rollup_enabled=app.config["HOTEL_TEMP_ROLLUP_ENABLED"],
+        )
+        if role == "worker":
+            # 工作进程不持有队列，控制命令转发给调度主进程；必须在导入控制器之前切换
+            from .services.scheduler_ipc import RemoteScheduler, parse_address
+
+            remote = RemoteScheduler(
+                parse_address(app.config["SCHEDULER_IPC_ADDRESS"]),
+                authkey,
+                timeout=app.config["SCHEDULER_IPC_TIMEOUT"],
+            )
+            services.use_remote_scheduler(remote)
+            # 逻辑时钟以 leader 为准：入住/退房时间、计费区间与温度 tick 使用同一时间线
+            remote.follow_clock(app.config["SCHEDULER_CLOCK_SYNC_INTERVAL"])
+        elif start_background:
+            if app.config.get("SCHEDULER_ACTOR_ENABLED"):
+                # 控制命令改由单个工作线程合并执行；需在构造 leader、注册控制器之前切换
+                services.scheduler_actor.start(
+                    app,
+                    max_batch=app.config["SCHEDULER_ACTOR_MAX_BATCH"],
+                    timeout=app.config["SCHEDULER_ACTOR_TIMEOUT"],
+                )
+                services.use_scheduler_actor(services.scheduler_actor)
+            if app.config.get("SCHEDULER_JOURNAL_ENABLED"):
+                journal_dir = app.config.get("SCHEDULER_JOURNAL_DIR") or os.path.join(
+                    app.instance_path, "scheduler"
+                )
+                services.queue_journal.open(
+                    journal_dir,
+                    compact_every=app.config["SCHEDULER_JOURNAL_COMPACT_EVERY"],
+                    fsync=app.config["SCHEDULER_JOURNAL_FSYNC"],
+                )
+                # 重启后按日志 + rooms 表恢复调度队列，房间无需重新开机
+                services.scheduler.restoreQueues()
+            if app.config.get("TRANSITION_JOURNAL_ENABLED"):
+                services.transition_journal.start(
+                    app,
+                    batch_size=app.config["TRANSITION_JOURNAL_BATCH"],
+                    flush_interval=app.config["TRANSITION_JOURNAL_FLUSH_SECONDS"],
+                    max_pending=app.config["TRANSITION_JOURNAL_MAX_PENDING"],
+                )
+            if app.config.get("TEMPERATURE_SCHEDULER_ENABLED", True):
+                services.temperature_scheduler.start(app)
+            if role == "leader":
+                services.scheduler_leader.start(app)
+
+    if app.config.get("TRAFFIC_RECORD_ENABLED"):
+        # 控制流量录制：worker 进程也要录，因为控制命令由 worker 接收
+        record_dir = app.config.get("TRAFFIC_RECORD_DIR") or os.path.join(app.instance_path, "traffic")
+        with app.app_context():
+            services.traffic_recorder.open(record_dir, app.config)
+        services.traffic_recorder.install(app)
+
+    _register_blueprints(app)
 
     @app.route("/")
     def index():
@@ -39,5 +39,5 @@ app = create_app()
 
 if __name__ == "__main__":
     from .config import Config
-    app.run(host=Config.SERVER_HOST, port=Config.SERVER_PORT, debug=True)
+    app.run(host=Config.SERVER_HOST, port=Config.SERVER_PORT, debug=Config.SERVER_DEBUG)
 
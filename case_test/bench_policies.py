@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+调度策略对比脚本
+在虚拟时钟 + SQLite 内存库中用同一组随机操作（开机、随机调风）分别驱动各调度策略，
+比较换入换出次数、空调详单条数、最长等待时长、各风速获得的服务份额以及单次调度耗时。
+每个策略在独立子进程中运行（服务单例按进程构造），互不影响。
+
+用法:
+    python case_test/bench_policies.py                                  # 30 间房 / 3 台空调 / 60 逻辑分钟
+    python case_test/bench_policies.py --rooms 300 --capacity 100 --minutes 30
+    python case_test/bench_policies.py --policies priority,aging --quantum 60
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+# === 配置 ===
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = os.path.basename(PROJECT_DIR)  # 通常为 hotel
+SPEEDS = ["LOW", "MEDIUM", "HIGH"]
+
+
+def run_child(args):
+    """子进程：按 args.policy 运行一次模拟，结果以 JSON 写到 stdout 最后一行"""
+    sys.path.insert(0, os.path.dirname(PROJECT_DIR))
+    os.environ.update({
+        "SCHEDULER_JOURNAL_ENABLED": "0",
+        "TEMPERATURE_SCHEDULER_ENABLED": "0",
+        "HOTEL_ROOM_COUNT": str(args.rooms),
+        "HOTEL_AC_TOTAL_COUNT": str(args.capacity),
+        "HOTEL_SCHEDULING_POLICY": args.policy,
+        "HOTEL_MIN_SERVICE_QUANTUM": str(args.quantum),
+        "HOTEL_COMMAND_COALESCE_MS": "0",
+    })
+    package = __import__(PACKAGE_NAME)
+    config = __import__(f"{PACKAGE_NAME}.config", fromlist=["SQLiteConfig"])
+    models = __import__(f"{PACKAGE_NAME}.models", fromlist=["DetailRecord"])
+    clock = __import__(f"{PACKAGE_NAME}.utils.time_master", fromlist=["clock"]).clock
+
+    app = package.create_app(config.SQLiteConfig, start_background=False)
+    services = __import__(f"{PACKAGE_NAME}.services", fromlist=["scheduler"])
+    scheduler, temperature_scheduler = services.scheduler, services.temperature_scheduler
+
+    # 统计 _schedule_queues 耗时
+    scheduler_cls = type(scheduler)
+    original = scheduler_cls._schedule_queues
+    timings = []
+
+    def timed(self, *a, **kw):
+        start = time.perf_counter()
+        try:
+            return original(self, *a, **kw)
+        finally:
+            timings.append(time.perf_counter() - start)
+
+    scheduler_cls._schedule_queues = timed
+
+    rnd = random.Random(args.seed)
+    served = {speed: 0.0 for speed in SPEEDS}
+    max_wait = 0.0
+    stdout, devnull = sys.stdout, open(os.devnull, "w")
+    sys.stdout = devnull  # 屏蔽调度日志
+    try:
+        with app.app_context():
+            clock.set_manual(True)
+            for room_id in range(1, args.rooms + 1):
+                scheduler.PowerOn(room_id, 30.0)
+                scheduler.ChangeSpeed(room_id, rnd.choice(SPEEDS))
+            for _ in range(args.minutes):
+                for _ in range(max(1, args.rooms // 6)):
+                    scheduler.ChangeSpeed(rnd.randint(1, args.rooms), rnd.choice(SPEEDS))
+                temperature_scheduler.advance(60, args.step)
+                status = scheduler.getScheduleStatus()
+                for item in status["servingQueue"]:
+                    served[item["fanSpeed"]] += 60.0
+                for item in status["waitingQueue"]:
+                    max_wait = max(max_wait, item["waitingSeconds"])
+            details = models.DetailRecord.query.filter_by(detail_type="AC").count()
+            counters = scheduler.getScheduleStatus()["counters"]
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+
+    total_served = sum(served.values()) or 1.0
+    timings.sort()
+    print(json.dumps({
+        "policy": args.policy,
+        "swaps": counters["preemptions"] + counters["rotations"],
+        "details": details,
+        "maxWait": max_wait,
+        "share": {speed: round(value / total_served, 3) for speed, value in served.items()},
+        "scheduleCalls": len(timings),
+        "p50Ms": timings[len(timings) // 2] * 1000 if timings else 0.0,
+        "maxMs": timings[-1] * 1000 if timings else 0.0,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比不同调度策略")
+    parser.add_argument("--policies", default="priority,aging,wfq", help="逗号分隔的策略名")
+    parser.add_argument("--rooms", type=int, default=30)
+    parser.add_argument("--capacity", type=int, default=3)
+    parser.add_argument("--minutes", type=int, default=60, help="模拟的逻辑分钟数")
+    parser.add_argument("--step", type=float, default=6.0, help="每个温度 tick 的逻辑秒数")
+    parser.add_argument("--quantum", type=float, default=0.0, help="最短服务时长（逻辑秒）")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--policy", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.policy:
+        run_child(args)
+        return
+
+    print(f"[Bench] {args.rooms} 间房 / {args.capacity} 台空调 / {args.minutes} 逻辑分钟, seed={args.seed}")
+    print(f"{'策略':<10}{'换入换出':>8}{'详单':>6}{'最长等待(s)':>12}{'LOW/MED/HIGH 服务份额':>24}{'调度 p50/max (ms)':>20}")
+    for policy in args.policies.split(","):
+        cmd = [sys.executable, os.path.abspath(__file__), "--policy", policy.strip()]
+        for key in ("rooms", "capacity", "minutes", "step", "quantum", "seed"):
+            cmd += [f"--{key}", str(getattr(args, key))]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr)
+            raise SystemExit(f"策略 {policy} 运行失败")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        share = "/".join(f"{result['share'][speed]:.2f}" for speed in SPEEDS)
+        print(f"{result['policy']:<12}{result['swaps']:>8}{result['details']:>6}{result['maxWait']:>12.0f}"
+              f"{share:>24}{result['p50Ms']:>12.2f}/{result['maxMs']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,11 @@ LOGICAL_ONE_MINUTE = 60.0  # 逻辑上的1分钟
 # 物理上需要等待的时间 = 60 / 6 = 10秒
 PHYSICAL_INTERVAL = LOGICAL_ONE_MINUTE / SPEED_FACTOR 
 
+# 虚拟时钟模式 (VIRTUAL_CLOCK=1)：后端时间只在 /test/time/advance 时前进，
+# 不再 sleep，动作按列表顺序串行执行，结果可完全复现（秒级跑完）
+VIRTUAL_CLOCK = os.getenv("VIRTUAL_CLOCK", "0") == "1"
+VIRTUAL_START = "2025-11-15T08:00:00"
+
 LOG_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "csv", "test_heat.txt")
 
 # 房间配置 (制热)
@@ -81,6 +86,8 @@ def init_env():
     # 1. 设置后端时间流速
     try:
         requests.post(f"{API_BASE}/test/time/set_speed", json={"speed": SPEED_FACTOR})
+        if VIRTUAL_CLOCK:
+            requests.post(f"{API_BASE}/test/time/manual", json={"enabled": True, "start": VIRTUAL_START})
     except Exception as e:
         log(f"[Fatal] 无法设置时间倍速: {e}")
         return
@@ -234,16 +241,25 @@ def main():
         # --- A. 执行本分钟动作 ---
         if minute in actions_map:
             log(f"⚡ Action Trigger (Min {minute})")
-            with ThreadPoolExecutor() as ex:
-                futures = [ex.submit(execute, r, a, v) for r, a, v in actions_map[minute]]
-                for f in as_completed(futures):
-                    log(f"  {f.result()}")
+            if VIRTUAL_CLOCK:
+                for r, a, v in actions_map[minute]:
+                    log(f"  {execute(r, a, v)}")
+            else:
+                with ThreadPoolExecutor() as ex:
+                    futures = [ex.submit(execute, r, a, v) for r, a, v in actions_map[minute]]
+                    for f in as_completed(futures):
+                        log(f"  {f.result()}")
         
         # --- B. 打印状态快照 ---
-        time.sleep(0.2) 
+        if not VIRTUAL_CLOCK:
+            time.sleep(0.2)
         print_dashboard(minute)
         
         # --- C. 精确等待下一分钟 ---
+        if VIRTUAL_CLOCK:
+            if minute < max_minute:
+                requests.post(f"{API_BASE}/test/time/advance", json={"seconds": LOGICAL_ONE_MINUTE})
+            continue
         if minute < max_minute:
             target_physical_time = start_time_physical + ((minute + 1) * PHYSICAL_INTERVAL)
             current_physical_time = time.time()
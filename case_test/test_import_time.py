@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入耗时测试
+- pytest 用例：在独立子进程中检查 `import hotel` 不加载服务与控制器，
+  且 `create_app(..., start_background=False)` 在 OPTIONAL_BLUEPRINTS="" 时不加载可选模块与后台服务
+- 直接运行：使用 `python -X importtime` 测量 `import hotel` 的累计耗时，
+  列出自身耗时最高的模块，超过预算时以非 0 退出码结束。
+
+用法:
+    python -m pytest case_test/test_import_time.py
+    python case_test/test_import_time.py            # 默认预算 1500ms
+    IMPORT_BUDGET_MS=800 python case_test/test_import_time.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+# === 配置 ===
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = os.path.basename(PROJECT_DIR)  # 通常为 hotel
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 1500))
+TOP_N = 15
+
+
+def _subprocess_env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(PROJECT_DIR) + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def loaded_modules(statement: str, **env_overrides) -> set:
+    """在干净的子进程中执行 statement，返回执行后已加载的项目内模块（去掉包名前缀）"""
+    env = _subprocess_env()
+    env.update(env_overrides)
+    script = (
+        "import json, sys\n"
+        f"{statement}\n"
+        f"print(json.dumps(sorted(m for m in sys.modules if m.startswith('{PACKAGE_NAME}.'))))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env)
+    assert proc.returncode == 0, proc.stderr
+    names = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {name[len(PACKAGE_NAME) + 1:] for name in names}
+
+
+# 只在对应功能启用时才应加载的模块
+OPTIONAL_MODULES = {
+    "controllers.monitoring_controller",
+    "controllers.report_controller",
+    "controllers.test_controller",
+    "services.report_service",
+}
+BACKGROUND_MODULES = {
+    "services.temperature_scheduler",
+    "services.scheduler_actor",
+    "services.scheduler_ipc",
+    "services.traffic_recorder",
+}
+
+
+def test_import_does_not_load_services_or_controllers():
+    modules = loaded_modules(f"import {PACKAGE_NAME}")
+    eager = sorted(m for m in modules if m.startswith(("services.", "controllers")))
+    assert not eager, f"import 时被提前加载: {eager}"
+
+
+def test_create_app_skips_optional_and_background_modules():
+    modules = loaded_modules(
+        f"from {PACKAGE_NAME} import create_app\n"
+        f"from {PACKAGE_NAME}.config import SQLiteConfig\n"
+        "create_app(SQLiteConfig, start_background=False)",
+        OPTIONAL_BLUEPRINTS="",
+        SCHEDULER_JOURNAL_ENABLED="0",
+    )
+    eager = sorted(modules & (OPTIONAL_MODULES | BACKGROUND_MODULES))
+    assert not eager, f"未启用的模块被加载: {eager}"
+    # 核心接口仍然注册
+    assert "controllers.ac_controller" in modules
+
+
+def measure(statement: str):
+    """返回 (目标模块累计耗时 ms, [(自身耗时 ms, 模块名), ...])"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        env=_subprocess_env(),
+    )
+    if proc.returncode != 0:
+        print(proc.stderr)
+        raise SystemExit(f"执行失败: {statement}")
+
+    total_us = 0
+    modules = []
+    for line in proc.stderr.splitlines():
+        # 格式: "import time:   self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        name_stripped = name.strip()
+        modules.append((int(self_us) / 1000.0, name_stripped))
+        if name_stripped == PACKAGE_NAME:
+            total_us = int(cumulative_us)
+    return total_us / 1000.0, modules
+
+
+def main():
+    total_ms, modules = measure(f"import {PACKAGE_NAME}")
+    own = [m for m in modules if m[1].startswith(PACKAGE_NAME)]
+
+    print(f"[ImportTime] import {PACKAGE_NAME}: {total_ms:.1f} ms (预算 {BUDGET_MS:.0f} ms)")
+    print(f"[ImportTime] 项目内模块 {len(own)} 个，自身耗时最高的 {TOP_N} 个模块:")
+    for self_ms, name in sorted(modules, reverse=True)[:TOP_N]:
+        print(f"  {self_ms:8.2f} ms  {name}")
+
+    # 服务与控制器应按需导入，import 包本身不应加载它们
+    eager = [name for _, name in own if ".controllers." in name or name.endswith(".scheduler")]
+    if eager:
+        print(f"[ImportTime] 警告: 以下模块在 import 时被提前加载: {eager}")
+
+    if total_ms > BUDGET_MS:
+        print("[ImportTime] 结果: 超出预算")
+        sys.exit(1)
+    print("[ImportTime] 结果: 通过")
+
+
+if __name__ == "__main__":
+    main()
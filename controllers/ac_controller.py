@@ -78,4 +78,16 @@ def change_mode():
         
         return jsonify({"message": message})
     except Exception as exc:
-        return jsonify({"error": str(exc)}), 400
\ No newline at end of file
+        return jsonify({"error": str(exc)}), 400
+
+@ac_bp.post("/batch")
+def batch_control():
+    """批量控制：{ "operations": [{roomId, action, value}, ...] }，整批一次加锁、一次重调度"""
+    payload = request.get_json() or {}
+    operations = payload.get("operations")
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return jsonify({"error": "operations 必须是对象数组"}), 400
+    try:
+        return jsonify({"results": ac.ApplyBatch(operations)})
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 400
@@ -1,15 +1,8 @@
 from flask import Blueprint, jsonify, request, current_app
-from ..services import maintenance_service, scheduler, room_service
+from ..services import customer_service, maintenance_service, scheduler, room_service, tariff_service
 from ..extensions import db
 from ..models import AccommodationFeeBill, Customer, DetailRecord, Room, ACConfig
-from ..database import (
-    ensure_bill_detail_update_time_column,
-    ensure_room_billing_start_temp_column,
-    ensure_room_daily_rate_column,
-    ensure_room_last_temp_update_column,
-    execute_schema_sql,
-    seed_default_ac_config,
-)
+from ..database import execute_schema_sql, migrate_schema, seed_default_ac_config
 
 # 修正前缀
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
@@ -56,6 +49,31 @@ def admin_power():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@admin_bp.post("/control/batch")
+def admin_batch():
+    """批量控制：{ "operations": [{roomId, action, value}, ...] }，action ∈ power/temp/speed/mode"""
+    payload = request.get_json() or {}
+    operations = payload.get("operations")
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return jsonify({"error": "operations 必须是对象数组"}), 400
+    try:
+        return jsonify({"results": scheduler.ApplyBatch(operations)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@admin_bp.post("/control/shutdown-all")
+def admin_shutdown_all():
+    """批量关机：不传 roomIds 时关闭全酒店所有已开机房间（火警/停电/夜间统一关闭）"""
+    payload = request.get_json(silent=True) or {}
+    room_ids = payload.get("roomIds")
+    if room_ids is not None and not isinstance(room_ids, list):
+        return jsonify({"error": "roomIds 必须是数组"}), 400
+    try:
+        result = scheduler.PowerOffMany(room_ids)
+        return jsonify({"message": f"已关闭 {len(result['poweredOff'])} 间房的空调", **result})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 @admin_bp.post("/control/temp")
 def admin_temp():
     payload = request.get_json() or {}
@@ -86,13 +104,27 @@ def admin_mode():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@admin_bp.get("/tariff")
+def get_tariff():
+    """查看调度器当前使用的费率/配置快照"""
+    return jsonify(tariff_service.current.to_dict())
+
+@admin_bp.post("/tariff/reload")
+def reload_tariff():
+    """修改 ac_config 表后热加载费率，无需重启"""
+    try:
+        tariff = tariff_service.reload()
+        return jsonify({"message": "费率配置已重新加载", "tariff": tariff.to_dict()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 @admin_bp.post("/reset-database")
 def reset_database():
     """重置数据库并重新初始化所有数据（调试用）"""
     try:
-        # 1. 清空调度器队列
-        scheduler.serving_queue.clear()
-        scheduler.waiting_queue.clear()
+        # 1. 清空调度器队列与房间-客人缓存
+        scheduler.clearQueues()
+        customer_service.clearRoomCache()
         
         # 2. 删除所有表数据
         db.session.query(DetailRecord).delete()
@@ -109,14 +141,12 @@ def reset_database():
         # 4. 执行 schema.sql
         execute_schema_sql()
         
-        # 5. 确保所有必要的列都存在（包括新添加的字段）
-        ensure_bill_detail_update_time_column()
-        ensure_room_last_temp_update_column()
-        ensure_room_daily_rate_column()
-        ensure_room_billing_start_temp_column()
+        # 5. 表已重建，重新执行全部迁移并登记 schema_version
+        migrate_schema()
         
-        # 6. 初始化 AC 配置
+        # 6. 初始化 AC 配置，并刷新调度器使用的费率快照
         seed_default_ac_config()
+        tariff_service.reload()
         
         # 7. 初始化房间数据
         room_service.ensureRoomsInitialized(
@@ -1,5 +1,10 @@
-from flask import Blueprint, jsonify
-from ..services import scheduler
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request
+from ..extensions import db
+from ..services import scheduler, transition_journal
+from ..utils.db_pool import pool_status
+from ..utils.log import logging_status
 
 # 修正路径前缀
 monitor_bp = Blueprint("monitor", __name__, url_prefix="/monitor")
@@ -11,4 +16,43 @@ def get_monitor_data():
         status = scheduler.getScheduleStatus()
         return jsonify(status)
     except Exception as exc:
-        return jsonify({"error": str(exc)}), 400
\ No newline at end of file
+        return jsonify({"error": str(exc)}), 400
+
+@monitor_bp.get("/rooms/<int:room_id>/history")
+def get_room_history(room_id: int):
+    """房间温度曲线：一次返回环形缓冲区中的全部采样，since 用于增量拉取，rollups=N 附带最近 N 分钟汇总"""
+    try:
+        since = request.args.get("since", type=float)
+        rollups = request.args.get("rollups", default=0, type=int)
+        return jsonify(scheduler.getTemperatureHistory(room_id, since, rollups))
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 400
+
+@monitor_bp.get("/transitions")
+def get_transitions():
+    """调度状态迁移记录：可按 roomId 与逻辑时间范围 [from, to)（ISO 格式）过滤，按时间先后返回"""
+    try:
+        start = request.args.get("from")
+        end = request.args.get("to")
+        rows = transition_journal.query(
+            room_id=request.args.get("roomId", type=int),
+            start=datetime.fromisoformat(start) if start else None,
+            end=datetime.fromisoformat(end) if end else None,
+            limit=request.args.get("limit", default=500, type=int),
+        )
+        return jsonify({"transitions": rows, "journal": transition_journal.status()})
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 400
+
+@monitor_bp.get("/pool")
+def get_pool_status():
+    """连接池占用与取连接等待时间（default: 请求线程, background: 后台温度线程）"""
+    try:
+        return jsonify(pool_status(db.engines))
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 400
+
+@monitor_bp.get("/logging")
+def get_logging_status():
+    """异步日志队列积压、因队列满丢弃与因采样跳过的条数"""
+    return jsonify(logging_status())
@@ -1,3 +1,5 @@
+import math
+
 from flask import Blueprint, jsonify, request
 from datetime import datetime, timedelta
 from ..services import room_service
@@ -80,11 +82,9 @@ def init_room_state():
                 update_dict["cooling_paused"] = False
                 update_dict["pause_start_temp"] = None
                 update_dict["ac_session_start"] = None  # 清理空调会话开始时间，避免时间计算错误
-                # 同时从内存队列中移除（如果存在）- 使用锁保护
+                # 同时从内存队列中移除（如果存在）
                 from ..services import scheduler
-                with scheduler._lock:
-                    scheduler._remove_request(scheduler.serving_queue, room_id)
-                    scheduler._remove_request(scheduler.waiting_queue, room_id)
+                scheduler.dropRoomFromQueues(room_id)
 
             # 4. 使用原子更新，确保 default_temp 被正确保存
             if update_dict:
@@ -131,7 +131,8 @@ def get_time_status():
         "real_time": datetime.utcnow().isoformat(),
         "logical_time": clock.now().isoformat(),
         "speed": clock.speed,
-        "is_paused": clock.paused
+        "is_paused": clock.paused,
+        "is_manual": clock.manual
     })
 
 
@@ -146,4 +147,44 @@ def pause_time():
 def resume_time():
     """恢复时间"""
     clock.resume()
-    return jsonify({"msg": "ok", "is_paused": clock.paused})
\ No newline at end of file
+    return jsonify({"msg": "ok", "is_paused": clock.paused})
+
+
+@test_bp.route('/time/manual', methods=['POST'])
+def manual_time():
+    """
+    切换虚拟时钟模式：{"enabled": true, "start": "2025-01-01T08:00:00"}
+    开启后逻辑时间只在 /test/time/advance 时前进；start 可选，固定起点使回放结果完全一致
+    """
+    data = request.json or {}
+    enabled = bool(data.get('enabled', True))
+    start = data.get('start')
+    try:
+        start_time = datetime.fromisoformat(start) if start else None
+    except ValueError:
+        return jsonify({"error": f"start 格式错误: {start}"}), 400
+    clock.set_manual(enabled, start_time)
+    return jsonify({"msg": "ok", "is_manual": clock.manual, "current_logical_time": clock.now().isoformat()})
+
+
+@test_bp.route('/time/advance', methods=['POST'])
+def advance_time():
+    """
+    虚拟时钟模式下推进时间并同步执行期间所有温度 tick：
+    {"seconds": 60} 或 {"add_minutes": 1}，可选 "step" 指定每个 tick 的逻辑秒数
+    """
+    from ..services import temperature_scheduler
+
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds') or 0) + float(data.get('add_minutes') or 0) * 60.0
+        step = float(data['step']) if data.get('step') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds / add_minutes / step 必须是数字"}), 400
+    if not math.isfinite(seconds) or seconds <= 0 or (step is not None and not math.isfinite(step)):
+        return jsonify({"error": "需要提供有限的正数 seconds 或 add_minutes"}), 400
+    try:
+        result = temperature_scheduler.advance(seconds, step)
+    except (RuntimeError, ValueError) as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"msg": "ok", **result})
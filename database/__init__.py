@@ -1,16 +1,26 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import Callable, List, Optional, Tuple
 
-from sqlalchemy import inspect, text
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
 
 from ..extensions import db
-from ..models import ACConfig
+from ..models import ACConfig, SchemaVersion, StateTransition, TemperatureRollup
+from ..utils.log import get_logger
+
+log = get_logger("Migration")
 
 SCHEMA_PATH = Path(__file__).with_name("schema.sql")
 
 
 def execute_schema_sql() -> None:
+    """按 schema.sql 重建全部表；schema.sql 为 MySQL 语法，其他方言按 ORM 模型重建"""
+    if _dialect() != "mysql":
+        db.drop_all()
+        db.create_all()
+        return
     sql_text = SCHEMA_PATH.read_text(encoding="utf-8")
     statements = [stmt.strip() for stmt in sql_text.split(";") if stmt.strip()]
     for statement in statements:
@@ -30,7 +40,7 @@ def seed_default_ac_config() -> None:
             default_temp=25.0,
             rate=1.0,
             # 修改后：符合 1元/1℃ 的计费逻辑，与物理降温速度一致
-            low_speed_rate=0.333333,  # 对应 Low: 1分钟降1/3度，收1/3元
+            low_speed_rate=1 / 3,     # 对应 Low: 1分钟降1/3度，收1/3元
             mid_speed_rate=0.5,       # 对应 Medium: 1分钟降0.5度，收0.5元
             high_speed_rate=1.0,      # 对应 High: 1分钟降1度，收1元
             default_speed="M",
@@ -43,7 +53,7 @@ def seed_default_ac_config() -> None:
             default_temp=23.0,
             rate=1.0,
             # 制热模式也使用相同的费率逻辑（与物理升温速度一致）
-            low_speed_rate=0.333333,  # 对应 Low: 1分钟升1/3度，收1/3元
+            low_speed_rate=1 / 3,     # 对应 Low: 1分钟升1/3度，收1/3元
             mid_speed_rate=0.5,       # 对应 Medium: 1分钟升0.5度，收0.5元
             high_speed_rate=1.0,      # 对应 High: 1分钟升1度，收1元
             default_speed="M",
@@ -53,109 +63,185 @@ def seed_default_ac_config() -> None:
     db.session.commit()
 
 
-def ensure_bill_detail_update_time_column() -> None:
-    inspector = inspect(db.engine)
-    columns = {column["name"] for column in inspector.get_columns("bill_details")}
-    if "update_time" in columns:
+def _dialect() -> str:
+    return db.engine.dialect.name
+
+
+def _add_column_if_missing(table: str, column: str, mysql_ddl: str, generic_ddl: str) -> None:
+    """
+    表存在但缺少字段时补齐字段（表不存在时由 create_all 建出完整结构，无需处理）。
+    MySQL 使用带 COMMENT / ON UPDATE 的完整定义，其他方言（SQLite 等）使用通用类型。
+    在当前事务中执行、不提交，出错时异常交给 migrate_schema 处理。
+    """
+    inspector = inspect(db.session.connection())
+    if table not in inspector.get_table_names():
         return
-    db.session.execute(
-        text(
-            """
-            ALTER TABLE bill_details
-            ADD COLUMN update_time DATETIME
-            DEFAULT CURRENT_TIMESTAMP
-            ON UPDATE CURRENT_TIMESTAMP
-            """
-        )
+    columns = {c["name"] for c in inspector.get_columns(table)}
+    if column in columns:
+        return
+    ddl = mysql_ddl if _dialect() == "mysql" else generic_ddl
+    db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def ensure_bill_detail_update_time_column() -> None:
+    """确保bill_details表有update_time字段"""
+    _add_column_if_missing(
+        "bill_details",
+        "update_time",
+        "DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP",
+        # SQLite 的 ADD COLUMN 不允许非常量默认值；更新时间由 ORM 的 onupdate 维护
+        "DATETIME",
     )
-    db.session.commit()
 
 
 def ensure_room_last_temp_update_column() -> None:
     """确保rooms表有last_temp_update字段"""
-    inspector = inspect(db.engine)
-    try:
-        # 检查表是否存在
-        if "rooms" not in inspector.get_table_names():
-            # 表不存在，会在create_all时创建，不需要手动添加字段
-            return
-        
-        columns = {column["name"] for column in inspector.get_columns("rooms")}
-        if "last_temp_update" in columns:
-            return
-        
-        # 表存在但字段不存在，添加字段
-        db.session.execute(
-            text(
-                """
-                ALTER TABLE rooms
-                ADD COLUMN last_temp_update DATETIME
-                """
-            )
-        )
-        db.session.commit()
-    except Exception as e:
-        # 如果出错，回滚并打印错误（但不中断程序）
-        db.session.rollback()
-        print(f"警告：添加last_temp_update字段时出错: {e}")
-        # 如果字段已存在或其他非致命错误，继续执行
+    _add_column_if_missing("rooms", "last_temp_update", "DATETIME", "DATETIME")
 
 
 def ensure_room_daily_rate_column() -> None:
     """确保rooms表有daily_rate字段"""
-    inspector = inspect(db.engine)
-    try:
-        # 检查表是否存在
-        if "rooms" not in inspector.get_table_names():
-            # 表不存在，会在create_all时创建，不需要手动添加字段
-            return
-        
-        columns = {column["name"] for column in inspector.get_columns("rooms")}
-        if "daily_rate" in columns:
-            return
-        
-        # 表存在但字段不存在，添加字段
-        db.session.execute(
-            text(
-                """
-                ALTER TABLE rooms
-                ADD COLUMN daily_rate DOUBLE DEFAULT 100.0 COMMENT '房间日房费（元/天）'
-                """
-            )
-        )
-        db.session.commit()
-    except Exception as e:
-        # 如果出错，回滚并打印错误（但不中断程序）
-        db.session.rollback()
-        print(f"警告：添加daily_rate字段时出错: {e}")
-        # 如果字段已存在或其他非致命错误，继续执行
+    _add_column_if_missing(
+        "rooms",
+        "daily_rate",
+        "DOUBLE DEFAULT 100.0 COMMENT '房间日房费（元/天）'",
+        "FLOAT DEFAULT 100.0",
+    )
 
 
 def ensure_room_billing_start_temp_column() -> None:
     """确保rooms表有billing_start_temp字段"""
-    inspector = inspect(db.engine)
+    _add_column_if_missing(
+        "rooms",
+        "billing_start_temp",
+        "DOUBLE COMMENT '计费开始时的温度（用于基于温度变化的计费）'",
+        "FLOAT",
+    )
+
+
+def _create_index_if_missing(table: str, name: str, columns: List[str]) -> None:
+    """表存在但缺少索引时补建索引（表不存在时由 create_all 建出，无需处理）"""
+    inspector = inspect(db.session.connection())
+    if table not in inspector.get_table_names():
+        return
+    if name in {index["name"] for index in inspector.get_indexes(table)}:
+        return
+    db.session.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+
+def _drop_index_if_exists(table: str, name: str) -> None:
+    """删除表上已被取代的索引（表或索引不存在时不做任何事）"""
+    inspector = inspect(db.session.connection())
+    if table not in inspector.get_table_names():
+        return
+    if name not in {index["name"] for index in inspector.get_indexes(table)}:
+        return
+    if _dialect() == "mysql":
+        db.session.execute(text(f"DROP INDEX {name} ON {table}"))
+    else:
+        db.session.execute(text(f"DROP INDEX {name}"))
+
+
+def ensure_customer_room_status_index() -> None:
+    """
+    确保customers表有(current_room_id, status)复合索引，覆盖按房间查在住客人的查询；
+    旧库上的单列索引 idx_room 是它的前缀，一并删除，使升级后的结构与新建库一致。
+    先建后删：MySQL 的外键需要 current_room_id 上始终有可用索引。
+    """
+    _create_index_if_missing("customers", "idx_room_status", ["current_room_id", "status"])
+    _drop_index_if_exists("customers", "idx_room")
+
+
+def _create_table_if_missing(model) -> None:
+    """按 ORM 模型补建缺失的表（已存在时不做任何事）"""
+    model.__table__.create(bind=db.session.connection(), checkfirst=True)
+
+
+def ensure_temperature_rollups_table() -> None:
+    """确保temperature_rollups表存在"""
+    _create_table_if_missing(TemperatureRollup)
+
+
+def ensure_state_transitions_table() -> None:
+    """确保state_transitions表存在"""
+    _create_table_if_missing(StateTransition)
+
+
+def fix_ac_config_low_speed_rate() -> None:
+    """旧版本按 0.333333 写入的低风速率改为精确的 1/3，避免每笔费用的舍入误差"""
+    inspector = inspect(db.session.connection())
+    if "ac_config" not in inspector.get_table_names():
+        return
+    db.session.execute(
+        text("UPDATE ac_config SET low_speed_rate = :third WHERE ABS(low_speed_rate - 0.333333) < 1e-9"),
+        {"third": 1 / 3},
+    )
+
+
+# === 版本化迁移 ===
+# 按版本号升序执行；新增表/字段时在末尾追加一项，不要修改已发布的版本号。
+# 迁移函数需幂等（可能与其他进程并发执行，或在已手工修改过的库上执行），
+# 在 migrate_schema 开启的事务中执行、不自行提交，出错时直接抛出异常。
+MIGRATIONS: List[Tuple[int, str, Callable[[], None]]] = [
+    (1, "bill_details.update_time", ensure_bill_detail_update_time_column),
+    (2, "rooms.last_temp_update", ensure_room_last_temp_update_column),
+    (3, "rooms.daily_rate", ensure_room_daily_rate_column),
+    (4, "rooms.billing_start_temp", ensure_room_billing_start_temp_column),
+    (5, "customers.idx_room_status", ensure_customer_room_status_index),
+    (6, "temperature_rollups", ensure_temperature_rollups_table),
+    (7, "state_transitions", ensure_state_transitions_table),
+    (8, "ac_config.low_speed_rate", fix_ac_config_low_speed_rate),
+]
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _begin_ddl_transaction() -> None:
+    """sqlite3 驱动不会在 DDL 前自动开启事务，显式 BEGIN 使迁移 DDL 与版本登记一起提交或回滚"""
+    if _dialect() == "sqlite":
+        db.session.execute(text("BEGIN"))
+
+
+def current_schema_version() -> Optional[int]:
+    """读取已应用的最高迁移版本；schema_version 表不存在时返回 None"""
     try:
-        # 检查表是否存在
-        if "rooms" not in inspector.get_table_names():
-            # 表不存在，会在create_all时创建，不需要手动添加字段
-            return
-        
-        columns = {column["name"] for column in inspector.get_columns("rooms")}
-        if "billing_start_temp" in columns:
-            return
-        
-        # 表存在但字段不存在，添加字段
-        db.session.execute(
-            text(
-                """
-                ALTER TABLE rooms
-                ADD COLUMN billing_start_temp DOUBLE COMMENT '计费开始时的温度（用于基于温度变化的计费）'
-                """
-            )
-        )
-        db.session.commit()
-    except Exception as e:
-        # 如果出错，回滚并打印错误（但不中断程序）
+        version = db.session.query(func.max(SchemaVersion.version)).scalar()
+    except SQLAlchemyError:
         db.session.rollback()
-        print(f"警告：添加billing_start_temp字段时出错: {e}")
-        # 如果字段已存在或其他非致命错误，继续执行
\ No newline at end of file
+        return None
+    return int(version or 0)
+
+
+def migrate_schema() -> int:
+    """
+    启动时的数据库结构检查：正常情况下只有一次 SELECT MAX(version)。
+    - schema_version 不存在（新库或升级前的旧库）：create_all 建出缺失的表，再执行全部迁移
+    - 版本落后：只执行缺失的迁移
+    每个版本的 DDL 与 schema_version 登记在同一事务中提交（MySQL 的 DDL 会隐式提交，登记紧随其后）；
+    任一步失败时回滚并抛出 RuntimeError，该版本不会被登记，应用启动中止，下次启动重新执行。
+    返回迁移后的版本号。
+    """
+    version = current_schema_version()
+    if version is not None and version >= LATEST_SCHEMA_VERSION:
+        return version
+
+    if version is None:
+        db.create_all()
+        version = 0
+
+    for number, name, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            _begin_ddl_transaction()
+            migrate()
+            db.session.add(SchemaVersion(version=number, name=name))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if (current_schema_version() or 0) >= number:
+                # 另一个进程已执行并登记了该版本
+                continue
+            log.error("迁移 %s (%s) 失败: %s", number, name, e, extra={"version": number})
+            raise RuntimeError(f"数据库迁移 {number} ({name}) 失败: {e}") from e
+        log.info("已应用 %s: %s", number, name, extra={"version": number})
+    return LATEST_SCHEMA_VERSION
@@ -14,26 +14,16 @@ if __package__ is None or __package__ == "":
     __package__ = "hotel.database"
 
 from .. import create_app
-from . import (
-    ensure_bill_detail_update_time_column,
-    ensure_room_billing_start_temp_column,
-    ensure_room_daily_rate_column,
-    ensure_room_last_temp_update_column,
-    execute_schema_sql,
-    seed_default_ac_config,
-)
+from . import execute_schema_sql, migrate_schema, seed_default_ac_config
 from ..services import room_service
 
 
 def main():
-    app = create_app(setup_database=False)
+    app = create_app(setup_database=False, start_background=False)
     with app.app_context():
         execute_schema_sql()
-        # 确保所有必要的列都存在
-        ensure_bill_detail_update_time_column()
-        ensure_room_last_temp_update_column()
-        ensure_room_daily_rate_column()
-        ensure_room_billing_start_temp_column()
+        # schema.sql 会删除 schema_version，这里重新执行全部迁移并登记版本
+        migrate_schema()
         seed_default_ac_config()
         room_service.ensureRoomsInitialized(
             total_count=app.config["HOTEL_ROOM_COUNT"],
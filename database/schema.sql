@@ -5,6 +5,10 @@ DROP TABLE IF EXISTS bills;
 DROP TABLE IF EXISTS customers;
 DROP TABLE IF EXISTS rooms;
 DROP TABLE IF EXISTS ac_config;
+DROP TABLE IF EXISTS temperature_rollups;
+DROP TABLE IF EXISTS state_transitions;
+-- 表结构整体重建后需要重新登记迁移版本
+DROP TABLE IF EXISTS schema_version;
 
 CREATE TABLE rooms (
     id INT PRIMARY KEY,
@@ -42,7 +46,7 @@ CREATE TABLE customers (
     status VARCHAR(20) DEFAULT 'CHECKED_IN',
     create_time DATETIME DEFAULT CURRENT_TIMESTAMP,
     update_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    INDEX idx_room (current_room_id),
+    INDEX idx_room_status (current_room_id, status),
     INDEX idx_status (status)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -101,3 +105,24 @@ CREATE TABLE ac_config (
     default_speed ENUM('L','M','H') NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+CREATE TABLE temperature_rollups (
+    room_id INT NOT NULL,
+    minute DATETIME NOT NULL COMMENT '逻辑时间的整分钟',
+    min_temp DOUBLE NOT NULL,
+    max_temp DOUBLE NOT NULL,
+    avg_temp DOUBLE NOT NULL,
+    samples INT NOT NULL COMMENT '该分钟内的温度 tick 数',
+    PRIMARY KEY (room_id, minute)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE state_transitions (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    room_id INT NOT NULL,
+    from_state VARCHAR(10) NOT NULL COMMENT 'OFF / SERVING / WAITING / PAUSED',
+    to_state VARCHAR(10) NOT NULL,
+    reason VARCHAR(40) NOT NULL COMMENT '迁移原因，如 PRIORITY_PREEMPTION、TIME_SLICE、TARGET_REACHED',
+    fan_speed VARCHAR(10),
+    logical_time DATETIME NOT NULL COMMENT '逻辑时钟时间',
+    INDEX idx_transition_room_time (room_id, logical_time),
+    INDEX idx_transition_time (logical_time)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
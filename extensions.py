@@ -1,4 +1,28 @@
+from contextvars import ContextVar
+from typing import Optional
+
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+# 当前线程/上下文优先使用的 bind（后台线程设置为 "background" 以使用独立连接池）
+_preferred_bind: ContextVar[Optional[str]] = ContextVar("preferred_bind", default=None)
+
+
+class RoutingSession(Session):
+    """未显式指定 bind 的模型查询，按 use_bind() 设置路由到对应连接池"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        key = _preferred_bind.get()
+        if bind is None and key is not None:
+            engine = self._db.engines.get(key)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_bind(key: Optional[str]) -> None:
+    """为当前线程设置首选 bind；未注册该 bind 时回退默认连接池"""
+    _preferred_bind.set(key)
 
-db = SQLAlchemy()
 
+db = SQLAlchemy(session_options={"class_": RoutingSession})
@@ -64,6 +64,10 @@ class Room(db.Model, TimestampMixin):
 
 class Customer(db.Model, TimestampMixin):
     __tablename__ = "customers"
+    __table_args__ = (
+        # 按房间查在住客人（结算、状态查询、退房）走该复合索引
+        db.Index("idx_room_status", "current_room_id", "status"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
@@ -169,6 +173,58 @@ class DetailRecord(db.Model, TimestampMixin):
         }
 
 
+class TemperatureRollup(db.Model):
+    """房间温度的分钟级汇总（HOTEL_TEMP_ROLLUP_ENABLED 开启时由温度 tick 批量写入）"""
+
+    __tablename__ = "temperature_rollups"
+
+    room_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    minute = db.Column(db.DateTime, primary_key=True)
+    min_temp = db.Column(db.Float, nullable=False)
+    max_temp = db.Column(db.Float, nullable=False)
+    avg_temp = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "minute": self.minute.isoformat() if self.minute else None,
+            "min": round(self.min_temp, 2),
+            "max": round(self.max_temp, 2),
+            "avg": round(self.avg_temp, 2),
+            "samples": self.samples,
+        }
+
+
+class StateTransition(db.Model):
+    """房间调度状态迁移日志（只追加），由 TransitionJournal 在后台线程批量写入"""
+
+    __tablename__ = "state_transitions"
+    __table_args__ = (
+        db.Index("idx_transition_room_time", "room_id", "logical_time"),
+        db.Index("idx_transition_time", "logical_time"),
+    )
+
+    # SQLite 只有 INTEGER PRIMARY KEY 才自增
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    room_id = db.Column(db.Integer, nullable=False)
+    from_state = db.Column(db.String(10), nullable=False)
+    to_state = db.Column(db.String(10), nullable=False)
+    reason = db.Column(db.String(40), nullable=False)
+    fan_speed = db.Column(db.String(10))
+    logical_time = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "roomId": self.room_id,
+            "from": self.from_state,
+            "to": self.to_state,
+            "reason": self.reason,
+            "fanSpeed": self.fan_speed,
+            "time": self.logical_time.isoformat() if self.logical_time else None,
+        }
+
+
 class ACConfig(db.Model):
     __tablename__ = "ac_config"
 
@@ -184,15 +240,82 @@ class ACConfig(db.Model):
     default_speed = db.Column(db.String(2), nullable=False)
 
 
-@dataclass
+class SchemaVersion(db.Model):
+    """已应用的数据库迁移（每个版本一行），启动时只读取 MAX(version)"""
+
+    __tablename__ = "schema_version"
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# === 调度器内部使用的整数编码（风速数值越大优先级越高） ===
+SPEED_LOW, SPEED_MEDIUM, SPEED_HIGH = 1, 2, 3
+SPEED_CODES = {"LOW": SPEED_LOW, "MEDIUM": SPEED_MEDIUM, "HIGH": SPEED_HIGH}
+SPEED_NAMES = {code: name for name, code in SPEED_CODES.items()}
+
+MODE_COOLING, MODE_HEATING = 0, 1
+MODE_CODES = {"COOLING": MODE_COOLING, "HEATING": MODE_HEATING}
+MODE_NAMES = {code: name for name, code in MODE_CODES.items()}
+
+# 房间在调度队列中的位置
+QUEUE_NONE, QUEUE_SERVING, QUEUE_WAITING = 0, 1, 2
+
+
+def speed_code(fan_speed: Optional[str]) -> int:
+    return SPEED_CODES.get((fan_speed or "MEDIUM").upper(), SPEED_MEDIUM)
+
+
+def mode_code(mode: Optional[str]) -> int:
+    return MODE_CODES.get((mode or "COOLING").upper(), MODE_COOLING)
+
+
 class RoomRequest:
-    roomId: int
-    fanSpeed: str
-    mode: str = "COOLING"
-    targetTemp: Optional[float] = None
-    servingTime: Optional[datetime] = None
-    waitingTime: Optional[datetime] = None
-    requestTime: datetime = field(default_factory=datetime.utcnow)
+    """
+    调度队列中的房间请求（紧凑记录）。
+    每个房间只保留一个实例，重新入队时原地更新；
+    时间戳为逻辑时钟的浮点秒数 (clock.now_ts())。
+    手写 __slots__（dataclass 的 slots= 需要 Python 3.10+），按身份比较。
+    """
+
+    __slots__ = ("roomId", "speed", "mode", "targetTemp", "servingTime", "waitingTime", "requestTime", "queue")
+
+    def __init__(
+        self,
+        roomId: int,
+        speed: int = SPEED_MEDIUM,
+        mode: int = MODE_COOLING,
+        targetTemp: Optional[float] = None,
+        servingTime: Optional[float] = None,
+        waitingTime: Optional[float] = None,
+        requestTime: float = 0.0,
+        queue: int = QUEUE_NONE,
+    ):
+        self.roomId = roomId
+        self.speed = speed
+        self.mode = mode
+        self.targetTemp = targetTemp
+        self.servingTime = servingTime
+        self.waitingTime = waitingTime
+        self.requestTime = requestTime
+        self.queue = queue
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"RoomRequest({fields})"
+
+    def copy(self) -> "RoomRequest":
+        """字段副本（供锁外使用的队列快照）"""
+        return RoomRequest(*(getattr(self, name) for name in self.__slots__))
+
+    @property
+    def fanSpeed(self) -> str:
+        return SPEED_NAMES.get(self.speed, "MEDIUM")
+
+    @property
+    def modeName(self) -> str:
+        return MODE_NAMES.get(self.mode, "COOLING")
 
 
 @dataclass
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+控制流量回放脚本
+用法:
+    python replay_traffic.py instance/traffic/                  # 回放目录下全部 traffic_*.jsonl
+    python replay_traffic.py traffic_1234.jsonl --step 60       # 每个 tick 1 逻辑分钟，回放更快
+    python replay_traffic.py instance/traffic/ --json report.json
+
+在 SQLite 内存库 + 虚拟时钟中重新执行录制的控制命令，比对每条命令的返回结果与退房账单；
+存在差异时以非 0 退出码结束。
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).resolve().parent
+parent_dir = project_root.parent
+if str(parent_dir) not in sys.path:
+    sys.path.insert(0, str(parent_dir))
+
+from hotel.services.traffic_recorder import replay_traffic
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制的控制命令并比对账单")
+    parser.add_argument("paths", nargs="+", help="录制文件或所在目录")
+    parser.add_argument("--step", type=float, default=None, help="每个温度 tick 的逻辑秒数（默认 1秒 × 倍速）")
+    parser.add_argument("--speed", type=float, default=None, help="覆盖录制时的时钟倍速")
+    parser.add_argument("--json", dest="json_path", default=None, help="把完整差异报告写入该文件")
+    args = parser.parse_args()
+
+    report = replay_traffic(args.paths, step=args.step, speed=args.speed)
+
+    print("=" * 30)
+    print(f"[Replay] 命令数: {report['commands']}，结果差异: {len(report['mismatches'])}")
+    for item in report["mismatches"]:
+        print(f"  #{item['index']} {item['t']} {item['method']} {item['path']} "
+              f"{item['field']}: 录制={item['recorded']!r} 回放={item['replayed']!r}")
+    print(f"[Replay] 账单数: {len(report['bills'])}")
+    for bill in report["bills"]:
+        flag = "一致" if bill["matched"] else "不一致"
+        print(f"  房间 {bill['roomId']} @ {bill['t']}: {flag}")
+        for key, values in bill["diff"].items():
+            print(f"    {key}: 录制={values['recorded']} 回放={values['replayed']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[Replay] 报告已写入 {args.json_path}")
+
+    sys.exit(0 if report["matched"] else 1)
+
+
+if __name__ == "__main__":
+    main()
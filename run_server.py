@@ -39,5 +39,5 @@ if __name__ == "__main__":
     print(f"局域网访问: http://{local_ip}:{Config.SERVER_PORT}")
     print(f"其他电脑请使用上述局域网地址访问")
     print("=" * 30)
-    app.run(host=Config.SERVER_HOST, port=Config.SERVER_PORT, debug=True)
+    app.run(host=Config.SERVER_HOST, port=Config.SERVER_PORT, debug=Config.SERVER_DEBUG)
 
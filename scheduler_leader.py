@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+调度主进程启动脚本（生产模式）
+直接运行: python scheduler_leader.py
+
+主进程负责：数据库初始化、服务/等待队列、温度更新 tick，
+并在 SCHEDULER_IPC_ADDRESS 上接收 WSGI 工作进程（hotel.wsgi）转发的控制命令。
+"""
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).resolve().parent
+parent_dir = project_root.parent
+if str(parent_dir) not in sys.path:
+    sys.path.insert(0, str(parent_dir))
+
+from hotel import create_app
+from hotel.config import LeaderConfig
+from hotel.services import scheduler_leader, temperature_scheduler
+
+if __name__ == "__main__":
+    app = create_app(LeaderConfig)
+    print("=== 调度主进程已启动 ===")
+    print(f"IPC 地址: {LeaderConfig.SCHEDULER_IPC_ADDRESS}")
+    print("=" * 30)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler_leader.stop()
+        temperature_scheduler.stop()
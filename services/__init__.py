@@ -1,28 +1,184 @@
-from .ac_service import AC
-from .bill_detail_service import BillDetailService
-from .bill_service import AccommodationFeeBillService
-from .customer_service import CustomerService
-from .hotel_service import FrontDesk
-from .maintenance_service import MaintenanceService
-from .report_service import ReportService
-from .room_service import RoomService
-from .scheduler import Scheduler
-from .temperature_scheduler import TemperatureScheduler
-
-room_service = RoomService()
-customer_service = CustomerService()
-bill_detail_service = BillDetailService()
-accommodation_fee_bill_service = AccommodationFeeBillService()
-bill_service = accommodation_fee_bill_service  # 别名，方便使用
-scheduler = Scheduler(room_service, bill_detail_service)
-temperature_scheduler = TemperatureScheduler(scheduler)
-ac = AC(room_service, scheduler)
-maintenance_service = MaintenanceService(room_service, scheduler)
-report_service = ReportService()
-front_desk = FrontDesk(
-    room_service=room_service,
-    customer_service=customer_service,
-    accommodation_fee_bill_service=accommodation_fee_bill_service,
-    bill_detail_service=bill_detail_service,
-)
+"""
+服务单例（按需构造）
+`from ..services import scheduler` 等写法保持不变，但各服务只在第一次被访问时才导入模块并实例化，
+CLI 脚本、测试进程只为实际用到的服务付出导入与构造开销。
+"""
+import sys
+import threading
+import types
 
+
+def _tariff_service():
+    from .tariff_service import TariffService
+    return TariffService()
+
+
+def _room_service():
+    from .room_service import RoomService
+    return RoomService()
+
+
+def _customer_service():
+    from .customer_service import CustomerService
+    return CustomerService()
+
+
+def _bill_detail_service():
+    from .bill_detail_service import BillDetailService
+    return BillDetailService(_get("tariff_service"))
+
+
+def _accommodation_fee_bill_service():
+    from .bill_service import AccommodationFeeBillService
+    return AccommodationFeeBillService()
+
+
+def _queue_journal():
+    from .queue_journal import QueueJournal
+    return QueueJournal()
+
+
+def _temperature_history():
+    from .temperature_history import TemperatureHistory
+    return TemperatureHistory()
+
+
+def _transition_journal():
+    from .transition_journal import TransitionJournal
+    return TransitionJournal()
+
+
+def _traffic_recorder():
+    from .traffic_recorder import TrafficRecorder
+    return TrafficRecorder()
+
+
+def _scheduler():
+    from .scheduler import Scheduler
+    return Scheduler(
+        _get("room_service"),
+        _get("bill_detail_service"),
+        _get("tariff_service"),
+        _get("queue_journal"),
+        _get("temperature_history"),
+        _get("transition_journal"),
+    )
+
+
+def _scheduler_actor():
+    from .scheduler_actor import SchedulerActor
+    # 需在 use_scheduler_actor 替换 scheduler 之前构造，包装的是本地 Scheduler
+    return SchedulerActor(_get("scheduler"))
+
+
+def _temperature_scheduler():
+    from .temperature_scheduler import TemperatureScheduler
+    return TemperatureScheduler(_get("scheduler"))
+
+
+def _scheduler_leader():
+    from .scheduler_ipc import SchedulerLeader
+    return SchedulerLeader(_get("scheduler"))
+
+
+def _ac():
+    from .ac_service import AC
+    return AC(_get("room_service"), _get("scheduler"))
+
+
+def _maintenance_service():
+    from .maintenance_service import MaintenanceService
+    return MaintenanceService(_get("room_service"), _get("scheduler"))
+
+
+def _report_service():
+    from .report_service import ReportService
+    return ReportService()
+
+
+def _front_desk():
+    from .hotel_service import FrontDesk
+    return FrontDesk(
+        room_service=_get("room_service"),
+        customer_service=_get("customer_service"),
+        accommodation_fee_bill_service=_get("accommodation_fee_bill_service"),
+        bill_detail_service=_get("bill_detail_service"),
+    )
+
+
+_FACTORIES = {
+    "tariff_service": _tariff_service,
+    "room_service": _room_service,
+    "customer_service": _customer_service,
+    "bill_detail_service": _bill_detail_service,
+    "accommodation_fee_bill_service": _accommodation_fee_bill_service,
+    "bill_service": lambda: _get("accommodation_fee_bill_service"),  # 别名，方便使用
+    "queue_journal": _queue_journal,
+    "temperature_history": _temperature_history,
+    "transition_journal": _transition_journal,
+    "traffic_recorder": _traffic_recorder,
+    "scheduler": _scheduler,
+    "scheduler_actor": _scheduler_actor,
+    "temperature_scheduler": _temperature_scheduler,
+    "scheduler_leader": _scheduler_leader,
+    "ac": _ac,
+    "maintenance_service": _maintenance_service,
+    "report_service": _report_service,
+    "front_desk": _front_desk,
+}
+
+_instances = {}
+_build_lock = threading.RLock()
+
+
+def _get(name: str):
+    instance = _instances.get(name)
+    if instance is None:
+        with _build_lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _FACTORIES[name]()
+                _instances[name] = instance
+    return instance
+
+
+def _service_property(name: str) -> property:
+    def getter(module):
+        return _get(name)
+
+    def setter(module, value):
+        # 导入同名子模块（如 services/scheduler.py）时，导入系统会把子模块赋给包属性，忽略即可
+        if isinstance(value, types.ModuleType):
+            return
+        _instances[name] = value
+
+    return property(getter, setter)
+
+
+class _ServicesModule(types.ModuleType):
+    """单例以 property 挂在模块类型上，优先于同名子模块属性，且首次访问时才构造"""
+
+
+for _name in _FACTORIES:
+    setattr(_ServicesModule, _name, _service_property(_name))
+
+sys.modules[__name__].__class__ = _ServicesModule
+
+
+def _use_scheduler_proxy(proxy, holders) -> None:
+    with _build_lock:
+        _instances["scheduler"] = proxy
+        for name in holders:
+            service = _instances.get(name)
+            if service is not None:
+                service.scheduler = proxy
+
+
+def use_remote_scheduler(remote) -> None:
+    """worker 模式：所有持有调度器引用的服务改为通过 IPC 转发给 leader"""
+    _use_scheduler_proxy(remote, ("ac", "maintenance_service"))
+
+
+def use_scheduler_actor(actor) -> None:
+    """命令队列模式：控制命令（含 leader 收到的 IPC 命令）改为提交给 SchedulerActor 合并执行"""
+    _use_scheduler_proxy(actor, ("ac", "maintenance_service", "scheduler_leader"))
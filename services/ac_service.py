@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import List, Optional
 
 from ..models import Room
 from .room_service import RoomService
@@ -21,12 +21,18 @@ class AC:
     def PowerOff(self, RoomId: int) -> str:
         return self.scheduler.PowerOff(RoomId)
 
+    def PowerOffMany(self, RoomIds: Optional[List[int]] = None) -> dict:
+        return self.scheduler.PowerOffMany(RoomIds)
+
     def ChangeTemp(self, RoomId: int, TargetTemp: float) -> str:
         return self.scheduler.ChangeTemp(RoomId, TargetTemp)
 
     def ChangeSpeed(self, RoomId: int, FanSpeed: str) -> str:
         return self.scheduler.ChangeSpeed(RoomId, FanSpeed)
 
+    def ApplyBatch(self, Operations: List[dict]) -> List[dict]:
+        return self.scheduler.ApplyBatch(Operations)
+
     def RequestState(self, RoomId: int) -> dict:
         return self.scheduler.RequestState(RoomId)
 
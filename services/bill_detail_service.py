@@ -1,14 +1,58 @@
+from __future__ import annotations
+
 from datetime import datetime
 from typing import List
 
-from flask import current_app
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
 from ..extensions import db
 from ..models import DetailRecord
+from ..utils.log import get_logger
+from .tariff_service import TariffService
+
+log = get_logger("BillDetailService")
+
+# MySQL ER_DUP_ENTRY
+_MYSQL_DUP_ENTRY = 1062
+
+
+def _is_duplicate_key(exc: IntegrityError) -> bool:
+    """是否为唯一键冲突（MySQL 按错误码判断，其他方言按错误信息判断）"""
+    args = getattr(exc.orig, "args", ())
+    if args and isinstance(args[0], int):
+        return args[0] == _MYSQL_DUP_ENTRY
+    message = str(exc.orig).lower()
+    return "unique" in message or "duplicate" in message
 
 
 class BillDetailService:
-    def createBillDetail(
+    def __init__(self, tariff_service: TariffService):
+        self.tariff_service = tariff_service
+
+    def _insert_statement(self, rows: List[dict]):
+        """
+        按方言构造「不存在才插入」语句（支持多行 VALUES），冲突键为 uq_bill_detail_room_type_start：
+        - SQLite / PostgreSQL: INSERT ... ON CONFLICT DO NOTHING
+        其他方言（含 MySQL）返回 None，由调用方 INSERT 并只吞掉唯一键冲突：
+        MySQL 的 INSERT IGNORE 会把非空、截断、外键等错误一并降级为警告，不能使用；
+        ON DUPLICATE KEY UPDATE 的空更新在 SQLAlchemy 固定开启的 CLIENT_FOUND_ROWS 下影响行数也是 1，
+        无法区分新建与重复
+        """
+        table = DetailRecord.__table__
+        dialect = db.session.get_bind(mapper=DetailRecord.__mapper__).dialect.name
+        if dialect == "sqlite":
+            return sqlite_insert(table).values(rows).on_conflict_do_nothing(
+                index_elements=["room_id", "detail_type", "start_time"]
+            )
+        if dialect == "postgresql":
+            return postgresql_insert(table).values(rows).on_conflict_do_nothing(
+                constraint="uq_bill_detail_room_type_start"
+            )
+        return None
+
+    def detailValues(
         self,
         room_id: int,
         ac_mode: str,
@@ -19,34 +63,14 @@ class BillDetailService:
         cost: float,
         customer_id: int | None = None,
         detail_type: str = "AC",
-    ) -> DetailRecord:
-        # === 防重复检查：在添加之前再次检查是否存在 ===
-        # 这可以防止并发调用时创建重复记录
-        # 强制刷新数据库会话，确保查询到最新提交的数据
-        from ..extensions import db
-        db.session.expire_all()
-        existing = DetailRecord.query.filter(
-            DetailRecord.room_id == room_id,
-            DetailRecord.detail_type == detail_type,
-            DetailRecord.start_time == start_time
-        ).first()
-        
-        if existing:
-            print(f"[BillDetailService] 发现已存在的详单，Room {room_id}, start_time={start_time}, existing_id={existing.id}, 跳过创建")
-            return existing
-        
-        factor = current_app.config.get("TIME_ACCELERATION_FACTOR", 1.0)
-        try:
-            factor = float(factor)
-        except (TypeError, ValueError):
-            factor = 1.0
-        factor = factor if factor > 0 else 1.0
-
+    ) -> dict:
+        """构造一行 bill_details 的列值（含按时间加速因子折算的时长）"""
+        factor = self.tariff_service.current.time_factor
         scaled_duration = max(
             0, int(((end_time - start_time).total_seconds() / 60.0) * factor)
         )
-
-        detail = DetailRecord(
+        now = datetime.utcnow()
+        return dict(
             room_id=room_id,
             customer_id=customer_id,
             ac_mode=ac_mode,
@@ -58,24 +82,117 @@ class BillDetailService:
             rate=rate,
             cost=cost,
             detail_type=detail_type,
+            create_time=now,
+            update_time=now,
         )
-        db.session.add(detail)
-        try:
+
+    def insertBillDetailsIfAbsent(self, rows: List[dict], commit: bool = True) -> int:
+        """
+        批量幂等写入详单：一条多行 INSERT 落库，已存在的 (room_id, detail_type, start_time) 被跳过。
+        返回实际新建的行数；commit=False 时由调用方与其他写操作一起提交。
+        """
+        if not rows:
+            return 0
+        stmt = self._insert_statement(rows)
+        if stmt is None:
+            created = self._insert_skipping_duplicates(rows)
+            if commit:
+                db.session.commit()
+            return created
+
+        result = db.session.execute(stmt)
+        if commit:
             db.session.commit()
-            return detail
-        except Exception:
-            # 兜底处理并发唯一约束冲突：回滚后返回已存在记录
-            db.session.rollback()
-            db.session.expire_all()
-            existing = DetailRecord.query.filter(
-                DetailRecord.room_id == room_id,
-                DetailRecord.detail_type == detail_type,
-                DetailRecord.start_time == start_time
-            ).first()
-            if existing:
-                print(f"[BillDetailService] 唯一约束命中，返回已存在详单 id={existing.id}")
-                return existing
-            raise
+        return max(0, result.rowcount)
+
+    def _insert_skipping_duplicates(self, rows: List[dict]) -> int:
+        """
+        先用一条多行 INSERT 写入（通常没有重复，一次往返）；
+        命中唯一键时回滚到保存点，逐行重试并跳过重复行。其他完整性错误照常抛出
+        """
+        table = DetailRecord.__table__
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert(), rows)
+            return len(rows)
+        except IntegrityError as exc:
+            if not _is_duplicate_key(exc):
+                raise
+        created = 0
+        for values in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(**values))
+                created += 1
+            except IntegrityError as exc:
+                if not _is_duplicate_key(exc):
+                    raise
+        return created
+
+    def insertBillDetailIfAbsent(
+        self,
+        room_id: int,
+        ac_mode: str,
+        fan_speed: str,
+        start_time: datetime,
+        end_time: datetime,
+        rate: float,
+        cost: float,
+        customer_id: int | None = None,
+        detail_type: str = "AC",
+    ) -> bool:
+        """
+        幂等写入详单：同一 (room_id, detail_type, start_time) 只会落库一次。
+        单条语句完成「检查 + 插入」，并发重复结算由数据库唯一键裁决，无需加锁重查。
+        返回 True 表示本次新建了详单，False 表示详单已存在。
+        """
+        values = self.detailValues(
+            room_id=room_id,
+            ac_mode=ac_mode,
+            fan_speed=fan_speed,
+            start_time=start_time,
+            end_time=end_time,
+            rate=rate,
+            cost=cost,
+            customer_id=customer_id,
+            detail_type=detail_type,
+        )
+        return self.insertBillDetailsIfAbsent([values]) > 0
+
+    def createBillDetail(
+        self,
+        room_id: int,
+        ac_mode: str,
+        fan_speed: str,
+        start_time: datetime,
+        end_time: datetime,
+        rate: float,
+        cost: float,
+        customer_id: int | None = None,
+        detail_type: str = "AC",
+    ) -> DetailRecord:
+        """写入详单并返回对应记录；若已存在则直接返回已有记录"""
+        created = self.insertBillDetailIfAbsent(
+            room_id=room_id,
+            ac_mode=ac_mode,
+            fan_speed=fan_speed,
+            start_time=start_time,
+            end_time=end_time,
+            rate=rate,
+            cost=cost,
+            customer_id=customer_id,
+            detail_type=detail_type,
+        )
+        detail = DetailRecord.query.filter(
+            DetailRecord.room_id == room_id,
+            DetailRecord.detail_type == detail_type,
+            DetailRecord.start_time == start_time
+        ).first()
+        if not created:
+            log.info("发现已存在的详单，Room %s, start_time=%s, existing_id=%s, 跳过创建",
+                     room_id, start_time, detail.id if detail else None,
+                     extra={"room": room_id, "skipped": "duplicate"})
+        return detail
 
     def getBillDetailsByRoomIdAndTimeRange(
         self, room_id: int, start: datetime, end: datetime, customer_id: int | None = None
@@ -1,11 +1,17 @@
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
 
 from ..extensions import db
-from ..models import Customer
+from ..models import Customer, Room
 
 
 class CustomerService:
+    def __init__(self):
+        # 入住房间 -> (客户ID, 入住时间)，由 FrontDesk 在入住/退房时维护。
+        # 入住时间与 rooms.check_in_time 比对校验：其他进程（WSGI worker）办理了换客/退房时，
+        # 本进程缓存的入住时间必然对不上，自动回退到数据库查询并刷新缓存。
+        self._room_customers: Dict[int, Tuple[int, Optional[datetime]]] = {}
+
     def saveCustomer(self, customer: Customer) -> Customer:
         db.session.add(customer)
         db.session.commit()
@@ -21,5 +27,59 @@ class CustomerService:
         return Customer.query.get(customer_id)
 
     def getCustomerByRoomId(self, room_id: int) -> Optional[Customer]:
-        return Customer.query.filter_by(current_room_id=room_id, status="CHECKED_IN").first()
+        cached = self._room_customers.get(room_id)
+        if cached is not None:
+            # 主键读取优先命中 session 身份映射；校验失败（已退房/换房）则回退到条件查询
+            customer = db.session.get(Customer, cached[0])
+            if customer is not None and customer.status == "CHECKED_IN" and customer.current_room_id == room_id:
+                return customer
+            self._room_customers.pop(room_id, None)
+        customer = Customer.query.filter_by(current_room_id=room_id, status="CHECKED_IN").first()
+        if customer is not None:
+            self._room_customers[room_id] = (customer.id, customer.check_in_time)
+        return customer
+
+    def getCustomerIdForRoom(self, room: Room) -> Optional[int]:
+        """
+        调度器热路径：由已加载的房间行取入住客户ID，缓存命中时不查询数据库。
+        仅对 OCCUPIED 房间有意义，其余状态直接返回 None。
+        """
+        if room.status != "OCCUPIED":
+            return None
+        cached = self._room_customers.get(room.id)
+        if cached is not None and cached[1] == room.check_in_time:
+            return cached[0]
+        customer = self.getCustomerByRoomId(room.id)
+        return customer.id if customer is not None else None
+
+    def getCustomerIdsForRooms(self, rooms: Iterable[Room]) -> Dict[int, int]:
+        """批量版本：缓存未命中的房间合并为一次查询"""
+        result: Dict[int, int] = {}
+        missing = []
+        for room in rooms:
+            if room.status != "OCCUPIED":
+                continue
+            cached = self._room_customers.get(room.id)
+            if cached is not None and cached[1] == room.check_in_time:
+                result[room.id] = cached[0]
+            else:
+                missing.append(room.id)
+        if missing:
+            for customer in Customer.query.filter(
+                Customer.current_room_id.in_(missing), Customer.status == "CHECKED_IN"
+            ).all():
+                if customer.current_room_id not in result:
+                    result[customer.current_room_id] = customer.id
+                    self._room_customers[customer.current_room_id] = (customer.id, customer.check_in_time)
+        return result
+
+    # --- 缓存维护（FrontDesk 入住/退房时调用） ---
+
+    def bindRoom(self, room_id: int, customer: Customer) -> None:
+        self._room_customers[room_id] = (customer.id, customer.check_in_time)
+
+    def unbindRoom(self, room_id: int) -> None:
+        self._room_customers.pop(room_id, None)
 
+    def clearRoomCache(self) -> None:
+        self._room_customers.clear()
@@ -0,0 +1,140 @@
+"""
+排队与到温预测（ETA）
+各风速的变温速率、回温速率都是固定配置，服务/等待队列的顺序也已知，
+因此每个房间何时到达目标温度、何时轮到服务、何时等待满一个时间片，都可以在一次遍历中算出，
+不必由前端反复轮询推算：
+- 服务中：距到达目标温度的逻辑秒数（etaTargetSeconds）
+- 等待中：距开始服务（etaServeSeconds）、距等待满一个时间片（timeoutSeconds）、距到达目标温度的逻辑秒数
+
+服务位按"最早空出"用小顶堆模拟：服务者到温即空出服务位；等待者按策略顺序依次占用最早空出的服务位，
+可轮转的等待者最迟在超时时刻换入；后面还有风速不低于自己的等待者时，一个服务位最多被占用一个时间片。
+预测是估计值，不考虑之后的房客操作，被换下的房间按重新排队处理。
+"""
+from __future__ import annotations
+
+import heapq
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional
+
+from ..models import Room, RoomRequest
+from .tariff_service import Tariff
+
+INF = math.inf
+
+
+@dataclass(frozen=True)
+class RoomEta:
+    """单个房间的预测（均为相对 Predictions.computed_at 的逻辑秒数，无法预测时为 inf）"""
+
+    serve: float
+    target: float
+    timeout: Optional[float] = None
+
+
+def _seconds(value: float, elapsed: float) -> Optional[float]:
+    if value is None or math.isinf(value):
+        return None
+    return round(max(0.0, value - elapsed), 1)
+
+
+@dataclass(frozen=True)
+class Predictions:
+    computed_at: float
+    rooms: Dict[int, RoomEta]
+    # 最早的等待超时时刻（只计可以轮转换入的等待者），没有时为 inf
+    next_timeout_ts: float
+
+    def for_room(self, room_id: int, now_ts: float) -> dict:
+        """按 now_ts 折算后的预测，供 RequestState / getScheduleStatus 直接输出"""
+        eta = self.rooms.get(room_id)
+        if eta is None:
+            return {"etaServeSeconds": None, "etaTargetSeconds": None, "timeoutSeconds": None}
+        elapsed = max(0.0, now_ts - self.computed_at)
+        return {
+            "etaServeSeconds": _seconds(eta.serve, elapsed),
+            "etaTargetSeconds": _seconds(eta.target, elapsed),
+            "timeoutSeconds": _seconds(eta.timeout, elapsed),
+        }
+
+
+def time_to_target(tariff: Tariff, room: Room, temp: float) -> float:
+    """以当前风速从 temp 到达目标温度所需的逻辑秒数（已达标为 0）"""
+    mode = (room.ac_mode or "COOLING").upper()
+    target = float(room.target_temp or 25.0)
+    diff = temp - target if mode == "COOLING" else target - temp
+    if diff <= 0:
+        return 0.0
+    rate = tariff.for_mode(mode).speed_rate(room.fan_speed)
+    return diff / rate * 60.0 if rate > 0 else INF
+
+
+def drift(tariff: Tariff, room: Room, temp: float, seconds: float) -> float:
+    """不服务时 seconds 逻辑秒后的温度：按回温速率向 default_temp 靠拢"""
+    if math.isinf(seconds):
+        return float(room.default_temp or 25.0)
+    default_temp = float(room.default_temp or 25.0)
+    delta = tariff.rewarm_rate * seconds / 60.0
+    if temp < default_temp:
+        return min(default_temp, temp + delta)
+    return max(default_temp, temp - delta)
+
+
+def predict(
+    serving: Iterable[RoomRequest],
+    waiting: Iterable[RoomRequest],
+    rooms: Dict[int, Room],
+    tariff: Tariff,
+    now_ts: float,
+    rank_key: Callable[[RoomRequest], object],
+) -> Predictions:
+    """一次遍历两个队列得出全部房间的预测，O(n log n)"""
+    time_slice = float(tariff.time_slice)
+    serving = list(serving)
+    waiting = sorted(waiting, key=rank_key)
+    result: Dict[int, RoomEta] = {}
+    slots = []  # 各服务位空出的时刻
+
+    for req in serving:
+        room = rooms.get(req.roomId)
+        if room is None:
+            continue
+        remaining = time_to_target(tariff, room, float(room.current_temp or 25.0))
+        result[req.roomId] = RoomEta(serve=0.0, target=remaining)
+        heapq.heappush(slots, now_ts + remaining)
+    for _ in range(max(0, tariff.capacity - len(serving))):
+        heapq.heappush(slots, now_ts)
+
+    min_serving_speed = min((req.speed for req in serving), default=None)
+    # 排在后面的等待者中的最高风速：不低于自己时，服务满一个时间片后会被轮转换下
+    later_max_speed = [0] * len(waiting)
+    for index in range(len(waiting) - 2, -1, -1):
+        later_max_speed[index] = max(later_max_speed[index + 1], waiting[index + 1].speed)
+    next_timeout_ts = INF
+    for index, req in enumerate(waiting):
+        room = rooms.get(req.roomId)
+        if room is None:
+            continue
+        waited_since = req.waitingTime if req.waitingTime is not None else now_ts
+        timeout_ts = waited_since + time_slice
+        # 有风速不高于自己的服务者时，超时后可以轮转换入
+        rotatable = min_serving_speed is not None and min_serving_speed <= req.speed
+        if rotatable:
+            next_timeout_ts = min(next_timeout_ts, timeout_ts)
+
+        free_ts = heapq.heappop(slots) if slots else INF
+        start = max(now_ts, min(free_ts, timeout_ts) if rotatable else free_ts)
+        remaining = time_to_target(tariff, room, drift(tariff, room, float(room.current_temp or 25.0), start - now_ts))
+        hold = min(remaining, time_slice) if later_max_speed[index] >= req.speed else remaining
+        heapq.heappush(slots, start + hold)
+        result[req.roomId] = RoomEta(
+            serve=start - now_ts,
+            target=start - now_ts + remaining,
+            timeout=max(0.0, timeout_ts - now_ts),
+        )
+
+    return Predictions(
+        computed_at=now_ts,
+        rooms=result,
+        next_timeout_ts=next_timeout_ts,
+    )
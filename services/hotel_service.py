@@ -7,6 +7,7 @@ from pathlib import Path
 from typing import Dict, List, Optional
 
 from flask import current_app
+from ..utils.log import get_logger
 from ..utils.time_master import clock
 from ..models import (
     AccommodationFeeBill,
@@ -22,6 +23,8 @@ from .bill_service import AccommodationFeeBillService
 from .customer_service import CustomerService
 from .room_service import RoomService
 
+log = get_logger("HotelService")
+
 
 class FrontDesk:
     def __init__(
@@ -99,6 +102,8 @@ class FrontDesk:
         room.associateCustomer(customer)
         room.check_in_time = customer.check_in_time
         self.room_service.updateRoom(room)
+        # 提交后再登记，缓存中的入住时间与数据库保存的精度一致
+        self.customer_service.bindRoom(room.id, customer)
         self._latest_order = AccommodationOrder(
             customer_id=customer.id,
             room_id=room.id,
@@ -142,6 +147,7 @@ class FrontDesk:
         customer.status = "CHECKED_OUT"
         customer.current_room_id = None
         self.customer_service.updateCustomer(customer)
+        self.customer_service.unbindRoom(room_id)
 
         room = self.room_service.getRoomById(room_id)
         if room.ac_on:
@@ -151,7 +157,7 @@ class FrontDesk:
                 scheduler.PowerOff(room_id)
             except Exception as e:
                 # 防止调度器错误阻碍退房，但记录日志
-                print(f"Error powering off AC during checkout: {e}")
+                log.warning("退房时关闭空调失败: %s", e)
                 import traceback
                 traceback.print_exc()
         
@@ -260,7 +266,7 @@ class FrontDesk:
             self._save_details_to_csv(room_id, details, check_out_time)
         except Exception as e:
             # 保存失败不影响退房流程，只记录日志
-            print(f"保存详单到 CSV 失败: {e}")
+            log.warning("保存详单到 CSV 失败: %s", e)
             import traceback
             traceback.print_exc()
         
@@ -312,5 +318,5 @@ class FrontDesk:
                     type_str
                 ])
         
-        print(f"详单已保存到: {filename}")
+        log.info("详单已保存到: %s", filename)
 
@@ -0,0 +1,171 @@
+"""
+调度队列持久化日志
+服务/等待队列只存在于内存中，重启即丢失。这里用「追加日志 + 定期压缩快照」记录队列变化：
+- queue_journal.jsonl: 每行一个事件 (add / promote / demote / remove / clear)，携带请求的完整状态
+- queue_snapshot.json: 压缩后的完整队列快照，记录其对应的事件序号
+
+启动时读取快照并重放其后的事件即可还原两个队列，重放长度不超过 compact_every。
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..models import QUEUE_SERVING, QUEUE_WAITING, RoomRequest
+from ..utils.log import get_logger
+
+log = get_logger("QueueJournal")
+
+JOURNAL_FILE = "queue_journal.jsonl"
+SNAPSHOT_FILE = "queue_snapshot.json"
+
+
+def _encode(req: RoomRequest) -> dict:
+    return {
+        "room": req.roomId,
+        "q": req.queue,
+        "speed": req.speed,
+        "mode": req.mode,
+        "target": req.targetTemp,
+        "st": req.servingTime,
+        "wt": req.waitingTime,
+        "rt": req.requestTime,
+    }
+
+
+def decode_request(record: dict) -> RoomRequest:
+    return RoomRequest(
+        roomId=int(record["room"]),
+        speed=int(record["speed"]),
+        mode=int(record["mode"]),
+        targetTemp=record.get("target"),
+        servingTime=record.get("st"),
+        waitingTime=record.get("wt"),
+        requestTime=record.get("rt") or 0.0,
+        queue=int(record["q"]),
+    )
+
+
+class QueueJournal:
+    def __init__(self):
+        self.directory: Optional[Path] = None
+        self.compact_every = 500
+        self.fsync = False
+        self._fh = None
+        self._seq = 0
+        self._since_snapshot = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._fh is not None
+
+    def open(self, directory: str, compact_every: int = 500, fsync: bool = False) -> None:
+        self.close()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.compact_every = max(1, int(compact_every))
+        self.fsync = fsync
+        snapshot_seq, _, events = self._read()
+        self._seq = max([snapshot_seq] + [e["seq"] for e in events])
+        self._since_snapshot = len(events)
+        self._fh = open(self.directory / JOURNAL_FILE, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    # --- 写入 ---
+
+    def record(self, event: str, req: Optional[RoomRequest] = None, room_id: Optional[int] = None) -> None:
+        if self._fh is None:
+            return
+        with self._lock:
+            self._seq += 1
+            line = {"seq": self._seq, "ev": event}
+            if req is not None:
+                line.update(_encode(req))
+            elif room_id is not None:
+                line["room"] = room_id
+            self._fh.write(json.dumps(line, separators=(",", ":")) + "\n")
+            self._fh.flush()
+            if self.fsync:
+                os.fsync(self._fh.fileno())
+            self._since_snapshot += 1
+
+    def should_compact(self) -> bool:
+        return self._fh is not None and self._since_snapshot >= self.compact_every
+
+    def snapshot(self, serving: Iterable[RoomRequest], waiting: Iterable[RoomRequest]) -> None:
+        """写入压缩快照（原子替换），并清空已被快照覆盖的日志"""
+        if self._fh is None:
+            return
+        with self._lock:
+            data = {
+                "seq": self._seq,
+                "serving": [_encode(r) for r in serving],
+                "waiting": [_encode(r) for r in waiting],
+            }
+            tmp = self.directory / (SNAPSHOT_FILE + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.directory / SNAPSHOT_FILE)
+            self._fh.close()
+            self._fh = open(self.directory / JOURNAL_FILE, "w", encoding="utf-8")
+            self._since_snapshot = 0
+
+    # --- 读取与重放 ---
+
+    def _read(self) -> Tuple[int, dict, List[dict]]:
+        snapshot = {"seq": 0, "serving": [], "waiting": []}
+        snapshot_path = self.directory / SNAPSHOT_FILE
+        if snapshot_path.exists():
+            try:
+                snapshot = json.loads(snapshot_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                log.warning("快照损坏，忽略: %s", e)
+        events = []
+        journal_path = self.directory / JOURNAL_FILE
+        if journal_path.exists():
+            with open(journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # 进程中断时最后一行可能只写了一半
+                        break
+                    if event.get("seq", 0) > snapshot.get("seq", 0):
+                        events.append(event)
+        return int(snapshot.get("seq", 0)), snapshot, events
+
+    def load(self) -> Tuple[List[dict], List[dict]]:
+        """重放快照 + 日志，返回 (服务队列记录, 等待队列记录)，保持原有队列顺序"""
+        if self.directory is None:
+            return [], []
+        _, snapshot, events = self._read()
+        queues: Dict[int, List[dict]] = {
+            QUEUE_SERVING: list(snapshot.get("serving", [])),
+            QUEUE_WAITING: list(snapshot.get("waiting", [])),
+        }
+
+        def detach(room_id):
+            for items in queues.values():
+                items[:] = [r for r in items if r["room"] != room_id]
+
+        for event in events:
+            kind = event["ev"]
+            if kind == "clear":
+                for items in queues.values():
+                    items.clear()
+            elif kind == "remove":
+                detach(event["room"])
+            elif event.get("q") in queues:
+                detach(event["room"])
+                queues[event["q"]].append(event)
+        return queues[QUEUE_SERVING], queues[QUEUE_WAITING]
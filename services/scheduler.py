@@ -1,16 +1,49 @@
 from __future__ import annotations
 
 import threading
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-
-from flask import current_app
-from sqlalchemy import func
-
-from ..models import Room, RoomRequest, DetailRecord
-from ..utils.time_master import clock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..models import (
+    QUEUE_NONE,
+    QUEUE_SERVING,
+    QUEUE_WAITING,
+    DetailRecord,
+    Room,
+    RoomRequest,
+    mode_code,
+    speed_code,
+)
+from ..utils.log import get_logger
+from ..utils.time_master import clock, from_ts, to_ts
 from .bill_detail_service import BillDetailService
+from .eta_predictor import Predictions, predict
+from .queue_journal import QueueJournal, decode_request
 from .room_service import RoomService
+from .scheduling_policy import SchedulingPolicy, create_policy
+from .tariff_service import TariffService
+from .temperature_history import TemperatureHistory
+from .transition_journal import TransitionJournal
+
+log = get_logger("Scheduler")
+# 高频类别，可用 HOTEL_LOG_SAMPLE 单独采样
+schedule_log = get_logger("Schedule")
+settle_log = get_logger("Settle")
+
+# 只涉及单个房间的控制命令（可由 executeCommands 合并执行）
+ROOM_COMMANDS = frozenset({"PowerOn", "PowerOff", "ChangeTemp", "ChangeSpeed", "ChangeMode"})
+# 控制命令执行成功（含"已开启""未开启""未变"这类幂等空操作）时的回复；
+# 其余回复（"错误"、"温度超限 (...)"）表示命令被拒绝
+COMMAND_OK_MESSAGES = frozenset({
+    "空调已开启", "已开启", "空调已关闭", "未开启", "温度已设定", "风速已调整", "模式已切换", "未变",
+})
+
+# 温度 tick 每个房间一条的 UPDATE：语句只构造一次，SET 的字段由执行时传入的参数决定
+_TICK_UPDATE = update(Room.__table__).where(Room.__table__.c.id == bindparam("tick_room_id"))
 
 # =============================================================================
 # 调度器 (Scheduler) - 最终完美版
@@ -21,52 +54,413 @@ from .room_service import RoomService
 # =============================================================================
 
 class Scheduler:
-    def __init__(self, room_service: RoomService, bill_detail_service: BillDetailService):
+    def __init__(
+        self,
+        room_service: RoomService,
+        bill_detail_service: BillDetailService,
+        tariff_service: TariffService,
+        queue_journal: Optional[QueueJournal] = None,
+        temperature_history: Optional[TemperatureHistory] = None,
+        transition_journal: Optional[TransitionJournal] = None,
+    ):
         self.room_service = room_service
         self.bill_detail_service = bill_detail_service
+        self.tariff_service = tariff_service
+        self.queue_journal = queue_journal
+        self.temperature_history = temperature_history
+        self.transition_journal = transition_journal
         
         self.serving_queue: List[RoomRequest] = []
         self.waiting_queue: List[RoomRequest] = []
-        self._lock = threading.Lock()
+        # 房间 -> 请求记录（每个房间一个实例，req.queue 标记所在队列）
+        self._requests: Dict[int, RoomRequest] = {}
+        # === 锁 ===
+        # 队列锁：只保护服务/等待队列及其引发的状态迁移（抢占、轮转、暂停、唤醒），持有时间尽量短。
+        # 可重入：ApplyBatch 持锁期间逐条调用公开命令
+        self._lock = threading.RLock()
+        # 房间锁：串行化同一房间的命令与温度推进，不同房间的命令可并行。
+        # 锁顺序（防死锁）：房间锁（多个时按房间号升序）→ 队列锁。
+        # 持有队列锁时只能 try-acquire 其他房间的锁（_try_lock_rooms），拿不到就放弃本次迁移，
+        # 由下一次 tick 的 _schedule_queues 重试。
+        self._room_locks: Dict[int, threading.RLock] = {}
+        self._room_locks_guard = threading.Lock()
+        # 房间锁释放时递增，温度 tick 据此判断批量查出的房间行是否已被命令修改
+        self._room_versions: Dict[int, int] = {}
+        # 批量命令执行期间推迟 _schedule_queues，结束后统一调度一次
+        self._defer_schedule = 0
+        self._schedule_pending = False
+        # 命令合并：(房间, 命令) -> (上次执行的逻辑时间, 执行后的队列状态)
+        self._recent_commands: Dict[Tuple[int, str], Tuple[float, tuple]] = {}
+        # 调度统计，随 getScheduleStatus 输出
+        # 换入换出统计（preemptions/rotations），以及因抗抖动设置被推迟的次数（held*，按调度轮次计）
+        self.counters: Dict[str, int] = {
+            "coalesced": 0,
+            "preemptions": 0,
+            "rotations": 0,
+            "heldByQuantum": 0,
+            "heldBySwapCap": 0,
+            "heldForSliceBoundary": 0,
+        }
+        # 集中轮转模式下最近一次执行轮转的时间片序号
+        self._rotation_slice: Optional[int] = None
+        # 调度策略（按 tariff 版本懒加载，见 policy 属性）
+        self._policy: Optional[SchedulingPolicy] = None
+        self._policy_version: Optional[int] = None
+        # 队列（及影响到温预测的房间设置）每次变化时递增；ETA 预测按 (该版本, 费率版本) 缓存
+        self._queue_version = 0
+        self._predictions: Optional[Predictions] = None
+        self._predictions_key: Optional[tuple] = None
+        # 上一次 _schedule_queues 是否因拿不到房间锁而未做完（下一次 tick 必须重试）
+        self._schedule_incomplete = False
+        # 房间 -> 当前调度状态（SERVING / WAITING / PAUSED，关机后移除），用于记录状态迁移
+        self._room_states: Dict[int, str] = {}
+
+    # --- 房间锁 ---
+
+    def _room_lock(self, room_id: int) -> threading.RLock:
+        lock = self._room_locks.get(room_id)
+        if lock is None:
+            with self._room_locks_guard:
+                lock = self._room_locks.setdefault(room_id, threading.RLock())
+        return lock
+
+    @contextmanager
+    def _locked_rooms(self, *room_ids: int):
+        """按房间号升序阻塞获取房间锁；不得在持有队列锁时调用"""
+        ids = sorted({int(rid) for rid in room_ids if rid is not None})
+        locks = [self._room_lock(rid) for rid in ids]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for rid in ids:
+                self._room_versions[rid] = self._room_versions.get(rid, 0) + 1
+            for lock in reversed(locks):
+                lock.release()
+
+    @contextmanager
+    def _try_lock_rooms(self, *room_ids: int):
+        """非阻塞获取全部房间锁（持有队列锁时使用），yield 是否成功；失败时不持有任何锁"""
+        acquired = []
+        for rid in sorted(set(room_ids)):
+            lock = self._room_lock(rid)
+            if not lock.acquire(blocking=False):
+                break
+            acquired.append((rid, lock))
+        ok = len(acquired) == len(set(room_ids))
+        try:
+            yield ok
+        finally:
+            for rid, lock in reversed(acquired):
+                if ok:
+                    self._room_versions[rid] = self._room_versions.get(rid, 0) + 1
+                lock.release()
 
     # --- 辅助方法 ---
 
     def _capacity(self) -> int:
-        try:
-            return max(1, int(current_app.config.get("HOTEL_AC_TOTAL_COUNT", 3)))
-        except: return 3
+        return self.tariff_service.current.capacity
 
     def _time_slice(self) -> int:
-        try:
-            return max(1, int(current_app.config.get("HOTEL_TIME_SLICE", 120)))
-        except: return 120
+        return self.tariff_service.current.time_slice
 
     def _get_simulated_duration(self, start_time: datetime, end_time: datetime) -> float:
         if not start_time or not end_time: return 0.0
         return max(0.0, (end_time - start_time).total_seconds())
 
+    def _queue_marker(self, room: Room) -> tuple:
+        return (self._queue_of(room.id), room.serving_start_time, room.waiting_start_time, bool(room.cooling_paused))
+
+    def _within_coalesce_window(self, room: Room, command: str, now_ts: float) -> bool:
+        """
+        同一房间的同类命令在合并窗口内再次到达，且期间房间的队列/计费状态没有被其他操作改变。
+        窗口针对房客连续点按，配置为真实毫秒，按当前倍速换算为逻辑时间（6 倍速下 300ms ≈ 1.8 逻辑秒）；
+        仍以逻辑时间比较，虚拟时钟回放的结果与真实耗时无关
+        """
+        window = self.tariff_service.current.coalesce_window * clock.speed
+        if window <= 0:
+            return False
+        recent = self._recent_commands.get((room.id, command))
+        return recent is not None and now_ts - recent[0] <= window and recent[1] == self._queue_marker(room)
+
+    def _remember_command(self, room: Room, command: str, now_ts: float) -> None:
+        if self.tariff_service.current.coalesce_window > 0:
+            self._recent_commands[(room.id, command)] = (now_ts, self._queue_marker(room))
+
+    @property
+    def policy(self) -> SchedulingPolicy:
+        """当前调度策略；费率配置重新加载（可能切换了策略或参数）后按现有队列重建索引"""
+        tariff = self.tariff_service.current
+        if self._policy is None or self._policy_version != tariff.version:
+            with self._lock:
+                if self._policy is None or self._policy_version != tariff.version:
+                    policy = create_policy(tariff.policy, self.tariff_service, self.counters)
+                    policy.rebuild(self.serving_queue, self.waiting_queue)
+                    self._policy, self._policy_version = policy, tariff.version
+        return self._policy
+
     def _priority_score(self, request: RoomRequest) -> int:
-        mapping = {"HIGH": 3, "MEDIUM": 2, "LOW": 1}
-        return mapping.get((request.fanSpeed or "MEDIUM").upper(), 2)
+        """风速即优先级，HIGH=3, MEDIUM=2, LOW=1"""
+        return request.speed
+
+    # --- 队列维护（通过 _requests 索引实现 O(1) 成员判断） ---
+
+    def _queue_of(self, room_id: int) -> int:
+        req = self._requests.get(room_id)
+        return req.queue if req is not None else QUEUE_NONE
 
-    def _speed_val(self, speed_str: str) -> int:
-        """风速数值化，HIGH=3, MEDIUM=2, LOW=1"""
-        mapping = {"HIGH": 3, "MEDIUM": 2, "LOW": 1}
-        return mapping.get((speed_str or "MEDIUM").upper(), 2)
+    def _is_serving(self, room_id: int) -> bool:
+        return self._queue_of(room_id) == QUEUE_SERVING
+
+    def _is_waiting(self, room_id: int) -> bool:
+        return self._queue_of(room_id) == QUEUE_WAITING
+
+    def _detach(self, room_id: int) -> Optional[RoomRequest]:
+        """从所在队列中摘下请求（不记日志，调用方随后会重新入队）"""
+        req = self._requests.get(room_id)
+        if req is None or req.queue == QUEUE_NONE:
+            return req
+        self.policy.on_dequeue(req)
+        self._queue_version += 1
+        queue = self.serving_queue if req.queue == QUEUE_SERVING else self.waiting_queue
+        try:
+            queue.remove(req)
+        except ValueError:
+            pass
+        req.queue = QUEUE_NONE
+        return req
 
     def _remove_request(self, queue: List[RoomRequest], room_id: int) -> None:
-        for i in range(len(queue) - 1, -1, -1):
-            if queue[i].roomId == room_id:
-                queue.pop(i)
+        req = self._requests.get(room_id)
+        if req is None:
+            return
+        expected = QUEUE_SERVING if queue is self.serving_queue else QUEUE_WAITING
+        if req.queue != expected:
+            return
+        self._detach(room_id)
+        self._journal("remove", room_id=room_id)
+
+    def _push_serving(self, req: RoomRequest, now_ts: float, event: str = "add", reason: str = "REQUEST") -> None:
+        req.waitingTime = None
+        req.servingTime = now_ts
+        req.queue = QUEUE_SERVING
+        self.serving_queue.append(req)
+        self.policy.on_enqueue(req)
+        self._queue_version += 1
+        self._journal(event, req)
+        self._transition(req.roomId, "SERVING", reason, now_ts)
+
+    def _push_waiting(self, req: RoomRequest, now_ts: float, event: str = "add", reason: str = "REQUEST") -> None:
+        req.servingTime = None
+        req.waitingTime = now_ts
+        req.queue = QUEUE_WAITING
+        self.waiting_queue.append(req)
+        self.policy.on_enqueue(req)
+        self._queue_version += 1
+        self._journal(event, req)
+        self._transition(req.roomId, "WAITING", reason, now_ts)
+
+    def _transition(self, room_id: int, to_state: str, reason: str, now_ts: Optional[float] = None) -> None:
+        """记录房间调度状态迁移（持有队列锁调用；只追加到内存缓冲区，由后台线程批量写库）"""
+        from_state = self._room_states.get(room_id, "OFF")
+        if from_state == to_state:
+            return
+        if to_state == "OFF":
+            self._room_states.pop(room_id, None)
+        else:
+            self._room_states[room_id] = to_state
+        journal = self.transition_journal
+        if journal is None or not journal.enabled:
+            return
+        req = self._requests.get(room_id)
+        journal.record(
+            room_id,
+            from_state,
+            to_state,
+            reason,
+            req.fanSpeed if req is not None else None,
+            clock.now_ts() if now_ts is None else now_ts,
+        )
+
+    def _journal(self, event: str, req: Optional[RoomRequest] = None, room_id: Optional[int] = None) -> None:
+        journal = self.queue_journal
+        if journal is None or not journal.enabled:
+            return
+        journal.record(event, req, room_id)
+        if journal.should_compact():
+            journal.snapshot(self.serving_queue, self.waiting_queue)
+
+    def _request_for(self, room: Room, now_ts: float) -> RoomRequest:
+        """取出（或首次创建）房间的请求记录，并按房间最新设置原地刷新"""
+        req = self._requests.get(room.id)
+        if req is None:
+            req = RoomRequest(roomId=room.id)
+            self._requests[room.id] = req
+        req.speed = speed_code(room.fan_speed)
+        req.mode = mode_code(room.ac_mode)
+        req.targetTemp = room.target_temp
+        req.requestTime = now_ts
+        return req
+
+    def clearQueues(self) -> None:
+        """清空服务/等待队列及调度状态（重置数据库时调用），持有队列锁，与温度 tick、轮转互斥"""
+        with self._lock:
+            self.serving_queue.clear()
+            self.waiting_queue.clear()
+            self._requests.clear()
+            self._room_states.clear()
+            if self._policy is not None:
+                self._policy.reset()
+            # 命令合并记录与未完成的调度不能带到重置后的新数据中
+            self._recent_commands.clear()
+            self._schedule_incomplete = False
+            self._queue_version += 1
+            self._journal("clear")
+
+    def dropRoomFromQueues(self, room_id: int) -> None:
+        """将房间从服务/等待队列中移除（不结算、不重新调度）"""
+        with self._lock:
+            self._remove_request(self.serving_queue, room_id)
+            self._remove_request(self.waiting_queue, room_id)
+            self._room_states.pop(room_id, None)
+
+    def restoreQueues(self) -> dict:
+        """
+        启动时从队列日志重建服务/等待队列，并与 rooms 表交叉校验：
+        - 已关机、已暂停或不存在的房间直接丢弃
+        - 服务/等待归属以 rooms 表的计费字段为准，日志提供队列顺序与时间戳
+        - 日志缺失但 rooms 表显示在队列中的房间按表中时间补回
+        - 超出容量的服务者按正常流程降级（结算后进入等待）
+        """
+        with self._lock:
+            records = []
+            if self.queue_journal is not None:
+                serving, waiting = self.queue_journal.load()
+                records = serving + waiting
+            rooms = {room.id: room for room in Room.query.filter_by(ac_on=True).all()}
+            now_ts = clock.now_ts()
+
+            self.serving_queue.clear()
+            self.waiting_queue.clear()
+            self._requests.clear()
+
+            candidates: List[RoomRequest] = []
+            for record in records:
+                room = rooms.get(record["room"])
+                if room is None or room.cooling_paused or room.id in self._requests:
+                    continue
+                req = decode_request(record)
+                self._requests[room.id] = req
+                candidates.append(req)
+            recovered = len(candidates)
+
+            missing = []
+            for room in rooms.values():
+                if room.id in self._requests or room.cooling_paused:
+                    continue
+                started = room.serving_start_time or room.waiting_start_time
+                if started is None:
+                    continue
+                req = self._request_for(room, min(to_ts(started), now_ts))
+                req.servingTime = req.waitingTime = req.requestTime
+                missing.append(req)
+            missing.sort(key=lambda r: r.requestTime)
+            candidates.extend(missing)
+
+            for req in candidates:
+                room = rooms[req.roomId]
+                req.speed = speed_code(room.fan_speed)
+                req.mode = mode_code(room.ac_mode)
+                req.targetTemp = room.target_temp
+                # 逻辑时钟随进程重启重新锚定，日志中的时间戳不能晚于当前时间
+                if room.serving_start_time is not None and room.billing_start_temp is not None:
+                    since = min(req.servingTime if req.servingTime is not None else now_ts, now_ts)
+                    req.queue, req.servingTime, req.waitingTime = QUEUE_SERVING, since, None
+                    self.serving_queue.append(req)
+                else:
+                    since = min(req.waitingTime if req.waitingTime is not None else now_ts, now_ts)
+                    req.queue, req.servingTime, req.waitingTime = QUEUE_WAITING, None, since
+                    self.waiting_queue.append(req)
+            self.policy.rebuild(self.serving_queue, self.waiting_queue)
+            self._queue_version += 1
+            # 恢复出的队列状态作为迁移记录的起点（不记为迁移）
+            self._room_states = {
+                req.roomId: "SERVING" if req.queue == QUEUE_SERVING else "WAITING"
+                for req in candidates
+            }
+            self._room_states.update(
+                (room.id, "PAUSED") for room in rooms.values() if room.cooling_paused
+            )
 
-    def _get_rate(self, fan_speed: str) -> float:
-        """获取单位温差的费率。当前逻辑下，1度温差=1元，不随风速变化。"""
-        return 1.0
+            capacity = self._capacity()
+            while len(self.serving_queue) > capacity:
+                newest = max(self.serving_queue, key=lambda r: r.servingTime)
+                self._demote_serving_room(newest, "RESTORE_OVER_CAPACITY")
+            self._schedule_queues(force=True)
+
+            if self.queue_journal is not None and self.queue_journal.enabled:
+                self.queue_journal.snapshot(self.serving_queue, self.waiting_queue)
+            result = {
+                "serving": len(self.serving_queue),
+                "waiting": len(self.waiting_queue),
+                "fromJournal": recovered,
+                "fromRooms": len(missing),
+            }
+            log.info("队列已恢复: %s", result, extra=result)
+            return result
+
+    def _get_rate(self, mode: str) -> float:
+        """获取单位温差的费率（元/℃），不随风速变化。"""
+        return self.tariff_service.current.for_mode(mode).price_per_degree
 
     # --- 核心逻辑: 温度更新 (修正版) ---
 
+    def _next_temperature(self, room: Room, current_temp: float, sim_minutes: float, is_working: bool) -> float:
+        """
+        纯计算：从 current_temp 经过 sim_minutes 逻辑分钟后的房间温度（不读写数据库）
+        - 主动工作：按模式/风速变温速率向目标温度靠拢
+        - 否则：按回温速率向 default_temp 自然漂移
+        """
+        tariff = self.tariff_service.current
+        if is_working:
+            target_temp = float(room.target_temp or 25.0)
+            mode = (room.ac_mode or "COOLING").upper()
+            # 变温速率由 ACConfig 按模式/风速配置 (默认 High=1.0, Medium=0.5, Low=0.33)
+            delta = tariff.for_mode(mode).speed_rate(room.fan_speed) * sim_minutes
+            if mode == "COOLING":
+                # 制冷：降温
+                return max(target_temp, current_temp - delta)
+            # 制热：升温
+            return min(target_temp, current_temp + delta)
+
+        default_temp = float(room.default_temp or 25.0)
+        delta = tariff.rewarm_rate * sim_minutes
+        # 向 default_temp 靠拢
+        if current_temp < default_temp:
+            return min(default_temp, current_temp + delta)
+        if current_temp > default_temp:
+            return max(default_temp, current_temp - delta)
+        return current_temp
+
+    def _forced_temperature(self, room: Room, now: datetime) -> float:
+        """now 时刻的房间温度，等价于 _updateRoomTemperature(force_update=True) 但不落库（批量路径使用）"""
+        current_temp = float(room.current_temp or 25.0)
+        if not room.last_temp_update:
+            return current_temp
+        sim_minutes = self._get_simulated_duration(room.last_temp_update, now) / 60.0
+        target_temp = float(room.target_temp or 25.0)
+        mode = (room.ac_mode or "COOLING").upper()
+        is_serving = self._is_serving(room.id) or (bool(room.serving_start_time) and not room.cooling_paused)
+        is_working = is_serving and (
+            (mode == "COOLING" and current_temp > target_temp)
+            or (mode == "HEATING" and current_temp < target_temp)
+        )
+        return self._next_temperature(room, current_temp, sim_minutes, is_working)
+
     def _updateRoomTemperature(self, room: Room, force_update: bool = False) -> None:
-        now = clock.now()
+        now_ts = clock.now_ts()
+        now = from_ts(now_ts)
         
         if not room.last_temp_update:
             from ..extensions import db
@@ -74,7 +468,7 @@ class Scheduler:
             db.session.commit()
             return
 
-        sim_minutes = self._get_simulated_duration(room.last_temp_update, now) / 60.0
+        sim_minutes = max(0.0, now_ts - to_ts(room.last_temp_update)) / 60.0
         # 避免调度循环偶发延迟导致一次计算跨越过多“逻辑分钟”，导致温度跳变
         if not force_update:
             sim_minutes = min(sim_minutes, 1.0)
@@ -83,12 +477,10 @@ class Scheduler:
 
         current_temp = float(room.current_temp or 25.0)
         target_temp = float(room.target_temp or 25.0)
-        default_temp = float(room.default_temp or 25.0)
-        fan_speed = (room.fan_speed or "MEDIUM").upper()
         mode = (room.ac_mode or "COOLING").upper()
 
         # 1. 判定是否拥有服务权
-        is_serving = any(r.roomId == room.id for r in self.serving_queue)
+        is_serving = self._is_serving(room.id)
         if not is_serving and room.serving_start_time and not room.cooling_paused:
             is_serving = True
 
@@ -105,17 +497,7 @@ class Scheduler:
         
         if is_working:
             # === 主动制冷/制热逻辑 ===
-            # 变温速率: High=1.0, Medium=0.5, Low=0.33
-            rate_map = {"HIGH": 1.0, "MEDIUM": 0.5, "LOW": 1.0/3.0}
-            rate = rate_map.get(fan_speed, 0.5)
-            delta = rate * sim_minutes
-
-            if mode == "COOLING":
-                # 制冷：降温
-                new_temp = max(target_temp, current_temp - delta)
-            else: 
-                # 制热：升温
-                new_temp = min(target_temp, current_temp + delta)
+            new_temp = self._next_temperature(room, current_temp, sim_minutes, True)
             
             # 到达目标温度检查
             if abs(new_temp - target_temp) < 0.01:
@@ -124,7 +506,8 @@ class Scheduler:
                     from ..extensions import db
                     db.session.refresh(room)
                     if not room.cooling_paused:
-                        self._handle_temp_reached(room, new_temp)
+                        with self._lock:
+                            self._handle_temp_reached(room, new_temp)
         else:
             # === 回温/自然漂移逻辑 ===
             # 进入此逻辑的情况：
@@ -134,41 +517,20 @@ class Scheduler:
             # 如果房间在服务队列中但温度已达标，需要从队列中移除，进入回温待机状态
             # 注意：如果 cooling_paused 已经为 True，说明已经被 _handle_temp_reached 处理过了，不应该重复结算
             if is_serving and not force_update and not room.cooling_paused:
-                # 房间在服务队列中但温度已达标，应该移除并进入回温待机
-                from ..extensions import db
-                db.session.refresh(room)
+                # 离开服务队列属于队列迁移，需持有队列锁
+                with self._lock:
+                    # 房间在服务队列中但温度已达标，应该移除并进入回温待机
+                    from ..extensions import db
+                    db.session.refresh(room)
                 
-                # 再次检查 cooling_paused（可能在刷新后已经设置了）
-                if room.cooling_paused:
-                    # 已经被处理过了，只需要从队列中移除
-                    self._remove_request(self.serving_queue, room.id)
-                    self._remove_request(self.waiting_queue, room.id)
-                    is_serving = False
-                elif room.serving_start_time and room.billing_start_temp is not None:
-                    # 如果有计费字段，先检查是否已经结算过（防止重复结算）
-                    from ..models import DetailRecord
-                    db.session.expire_all()
-                    existing_detail = db.session.query(DetailRecord.id).filter(
-                        DetailRecord.room_id == room.id,
-                        DetailRecord.detail_type == "AC",
-                        DetailRecord.start_time == room.serving_start_time
-                    ).first()
-                    
-                    if existing_detail:
-                        # 已经结算过了，只需要清除计费字段和移除队列
-                        print(f"[Skip Duplicate Settle] Room {room.id}, start={room.serving_start_time}, reason=TEMP_REACHED_AUTO, existing_id={existing_detail}")
-                        db.session.query(Room).filter(Room.id == room.id).update({
-                            "serving_start_time": None,
-                            "billing_start_temp": None,
-                        })
-                        db.session.commit()
-                        room.serving_start_time = None
-                        room.billing_start_temp = None
-                    else:
-                        # 先保存计费字段，避免在结算过程中被清除
-                        saved_serving_start_time = room.serving_start_time
-                        saved_billing_start_temp = room.billing_start_temp
-                        
+                    # 再次检查 cooling_paused（可能在刷新后已经设置了）
+                    if room.cooling_paused:
+                        # 已经被处理过了，只需要从队列中移除
+                        self._remove_request(self.serving_queue, room.id)
+                        self._remove_request(self.waiting_queue, room.id)
+                        self._transition(room.id, "PAUSED", "TARGET_REACHED")
+                        is_serving = False
+                    elif room.serving_start_time and room.billing_start_temp is not None:
                         # 临时保存当前温度
                         original_current_temp = room.current_temp
                         # 如果温度已达标，使用目标温度作为结算终点
@@ -178,46 +540,36 @@ class Scheduler:
                         elif mode == "HEATING" and current_temp > target_temp:
                             # 制热模式，当前温度高于目标，只结算到目标温度
                             room.current_temp = target_temp
-                        
-                        # 结算到目标温度的费用
+
+                        # 结算到目标温度的费用：详单按唯一键幂等写入，已结算过时由 insertBillDetailIfAbsent
+                        # 返回的 created=False 识别并跳过，不再预先查询详单
                         self._settle_current_service_period(room, now, "TEMP_REACHED_AUTO")
-                        
+
                         # 恢复当前温度
                         room.current_temp = original_current_temp
-                        
-                        # 立即清除计费字段，防止重复结算
+
+                        # 清除计费字段（防止重复结算）并进入回温待机，一次 UPDATE + 一次提交
                         db.session.query(Room).filter(Room.id == room.id).update({
                             "serving_start_time": None,
                             "billing_start_temp": None,
-                            "current_temp": original_current_temp  # 恢复当前温度
+                            "current_temp": original_current_temp,
+                            "cooling_paused": True,
+                            "pause_start_temp": current_temp,
+                            "waiting_start_time": None,
                         })
                         db.session.commit()
                         room.serving_start_time = None
                         room.billing_start_temp = None
-                    
-                    # 从服务队列中移除
-                    self._remove_request(self.serving_queue, room.id)
-                    self._remove_request(self.waiting_queue, room.id)
-                    
-                    # 设置暂停状态，进入回温待机
-                    db.session.query(Room).filter(Room.id == room.id).update({
-                        "cooling_paused": True,
-                        "pause_start_temp": current_temp,
-                        "waiting_start_time": None
-                    })
-                    db.session.commit()
-                    room.cooling_paused = True
-                    room.pause_start_temp = current_temp
-                    is_serving = False  # 更新标志，后续不再检查唤醒
-            
-            rewarm_rate = 0.5 # 回温速率
-            delta = rewarm_rate * sim_minutes
+                        room.cooling_paused = True
+                        room.pause_start_temp = current_temp
+
+                        # 从服务队列中移除
+                        self._remove_request(self.serving_queue, room.id)
+                        self._remove_request(self.waiting_queue, room.id)
+                        self._transition(room.id, "PAUSED", "TARGET_REACHED")
+                        is_serving = False  # 更新标志，后续不再检查唤醒
             
-            # 向 default_temp 靠拢
-            if current_temp < default_temp:
-                new_temp = min(default_temp, current_temp + delta)
-            elif current_temp > default_temp:
-                new_temp = max(default_temp, current_temp - delta)
+            new_temp = self._next_temperature(room, current_temp, sim_minutes, False)
             
             # 回温唤醒检查 (仅针对被暂停的房间，且不在服务队列中)
             # 当回温导致温度再次劣于目标时，下一次循环会自动进入 is_working 分支
@@ -225,131 +577,83 @@ class Scheduler:
                 pause_base = room.pause_start_temp if room.pause_start_temp is not None else target_temp
                 # 触发唤醒阈值：偏离1度
                 if abs(new_temp - pause_base) >= 1.0:
-                    self._handle_rewarm_wake(room)
+                    with self._lock:
+                        self._handle_rewarm_wake(room)
 
         # 持久化
         from ..extensions import db
         try:
             # 始终推进 last_temp_update，current_temp 仅在变化时写库
-            room.last_temp_update = now
             update_data = {"last_temp_update": now}
-
             if abs(new_temp - float(room.current_temp or 0)) > 0.0001:
-                room.current_temp = new_temp
                 update_data["current_temp"] = new_temp
 
-            db.session.query(Room).filter(Room.id == room.id).update(update_data)
+            # 表级 UPDATE + set_committed_value：不经 ORM 批量更新与会话同步，
+            # 也不会把对象标脏、在提交时再 flush 一次
+            db.session.execute(_TICK_UPDATE, {"tick_room_id": room.id, **update_data})
+            for key, value in update_data.items():
+                set_committed_value(room, key, value)
             db.session.commit()
         except Exception:
             db.session.rollback()
 
     # --- 核心逻辑: 计费 ---
 
-    def _settle_current_service_period(self, room: Room, end_time: datetime, reason: str) -> None:
-        if not room.serving_start_time or room.billing_start_temp is None:
-            print(f"[Skip Settle] Room {room.id}, no serving_start_time or billing_start_temp, reason={reason}")
-            return
-
-        # === 防重复结算：若已存在相同 start_time 的账单，则跳过 ===
-        # 必须在计算费用之前检查，避免重复计算
-        from ..models import DetailRecord
-        from ..extensions import db
-        # 强制刷新数据库会话，确保查询到最新提交的数据
-        db.session.expire_all()
-        
-        # 使用 SELECT FOR UPDATE 锁定，防止并发重复创建
-        # 如果锁定失败（说明另一个事务正在处理），等待一小段时间后重试
-        try:
-            exists = db.session.query(DetailRecord.id).filter(
-                DetailRecord.room_id == room.id,
-                DetailRecord.detail_type == "AC",
-                DetailRecord.start_time == room.serving_start_time
-            ).with_for_update(nowait=True).first()
-        except Exception as lock_error:
-            # 如果锁定失败，等待一小段时间后再次检查
-            import time
-            time.sleep(0.01)  # 等待10毫秒
-            db.session.expire_all()
-            exists = db.session.query(DetailRecord.id).filter(
-                DetailRecord.room_id == room.id,
-                DetailRecord.detail_type == "AC",
-                DetailRecord.start_time == room.serving_start_time
-            ).first()
-        
-        if exists:
-            print(f"[Skip Duplicate] Room {room.id}, start={room.serving_start_time}, reason={reason}, existing_id={exists}")
-            return
-        
-        print(f"[Settle Start] Room {room.id}, start={room.serving_start_time}, reason={reason}")
-
+    def _settlement_cost(self, room: Room, end_temp: float):
+        """按计费起点温度与 end_temp 计算本段服务费用，返回 (mode, rate, cost)；无需收费时返回 None"""
         start_temp = float(room.billing_start_temp)
-        end_temp = float(room.current_temp)
         mode = room.ac_mode or "COOLING"
-        
+
         temp_diff = 0.0
         if mode == "COOLING":
             if end_temp < start_temp: temp_diff = start_temp - end_temp
         else:
             if end_temp > start_temp: temp_diff = end_temp - start_temp
 
-        if temp_diff < 0.001: return
+        if temp_diff < 0.001: return None
 
-        rate = 1.0  # 费率：1度=1元
-        cost = temp_diff * rate
-        
-        # 调试日志：记录结算详情
-        if reason == "POWER_OFF":
-            print(f"[Scheduler] PowerOff 结算 Room {room.id}: start_temp={start_temp:.2f}, end_temp={end_temp:.2f}, diff={temp_diff:.2f}, cost={cost:.2f}")
-        
-        customer_id = None
-        if room.status == "OCCUPIED":
-            from ..services import customer_service
-            c = customer_service.getCustomerByRoomId(room.id)
-            if c: customer_id = c.id
-
-        # 在创建详单之前，再次检查是否已存在（双重保险）
-        # 防止在检查后、创建前的短暂时间窗口内被并发调用
-        db.session.expire_all()
-        exists_again = db.session.query(DetailRecord.id).filter(
-            DetailRecord.room_id == room.id,
-            DetailRecord.detail_type == "AC",
-            DetailRecord.start_time == room.serving_start_time
-        ).first()
-        if exists_again:
-            print(f"[Skip Duplicate Before Create] Room {room.id}, start={room.serving_start_time}, reason={reason}, existing_id={exists_again}")
-            return
-        
-        # 创建详单（内部也有防重复检查）
-        # 使用 try-except 捕获可能的唯一约束冲突
-        try:
-            detail = self.bill_detail_service.createBillDetail(
-                room_id=room.id,
-                ac_mode=mode,
-                fan_speed=room.fan_speed,
-                start_time=room.serving_start_time,
-                end_time=end_time,
-                rate=rate,
-                cost=cost,
-                customer_id=customer_id,
-                detail_type="AC"
+        rate = self._get_rate(mode)
+        return mode, rate, temp_diff * rate
+
+    def _settle_current_service_period(self, room: Room, end_time: datetime, reason: str) -> bool:
+        """结算当前服务周期，返回是否新建了详单（无计费起点、费用为 0 或详单已存在时为 False）"""
+        if not room.serving_start_time or room.billing_start_temp is None:
+            settle_log.debug("跳过结算 Room %s: 没有计费起点, reason=%s", room.id, reason,
+                             extra={"room": room.id, "reason": reason, "skipped": "no_billing"})
+            return False
+
+        settle_log.debug("开始结算 Room %s, start=%s, reason=%s", room.id, room.serving_start_time, reason,
+                         extra={"room": room.id, "reason": reason})
+
+        settlement = self._settlement_cost(room, float(room.current_temp))
+        if settlement is None: return False
+        mode, rate, cost = settlement
+
+        from ..services import customer_service
+        customer_id = customer_service.getCustomerIdForRoom(room)
+
+        # 单条 insert-if-absent 语句完成防重复：并发/重复结算由唯一键 uq_bill_detail_room_type_start 裁决
+        created = self.bill_detail_service.insertBillDetailIfAbsent(
+            room_id=room.id,
+            ac_mode=mode,
+            fan_speed=room.fan_speed,
+            start_time=room.serving_start_time,
+            end_time=end_time,
+            rate=rate,
+            cost=cost,
+            customer_id=customer_id,
+            detail_type="AC"
+        )
+        if created:
+            settle_log.info(
+                "结算 AC费 Room %s: %.2f元 (%.2f -> %.2f℃, reason=%s)",
+                room.id, cost, float(room.billing_start_temp), float(room.current_temp), reason,
+                extra={"room": room.id, "reason": reason, "cost": round(cost, 2), "fanSpeed": room.fan_speed},
             )
-            print(f"[Scheduler] 结算 AC费 Room {room.id}: {cost:.2f}元, detail_id={detail.id}")
-        except Exception as e:
-            # 如果创建失败（可能是并发冲突），再次检查是否已存在
-            db.session.rollback()
-            db.session.expire_all()
-            existing_detail = DetailRecord.query.filter(
-                DetailRecord.room_id == room.id,
-                DetailRecord.detail_type == "AC",
-                DetailRecord.start_time == room.serving_start_time
-            ).first()
-            if existing_detail:
-                print(f"[Settle Conflict Resolved] Room {room.id}, start={room.serving_start_time}, reason={reason}, using existing_id={existing_detail.id}")
-                return
-            else:
-                # 如果确实不存在，重新抛出异常
-                print(f"[Settle Error] Room {room.id}, start={room.serving_start_time}, reason={reason}, error={e}")
-                raise
+        else:
+            settle_log.info("跳过重复结算 Room %s, start=%s, reason=%s", room.id, room.serving_start_time, reason,
+                            extra={"room": room.id, "reason": reason, "skipped": "duplicate"})
+        return created
 
     # --- 状态迁移 ---
 
@@ -357,15 +661,13 @@ class Scheduler:
         room = self.room_service.getRoomById(request.roomId)
         if not room: return
         now = clock.now()
+        now_ts = clock.now_ts()
         
         # 检查是否已经有计费字段，如果没有则跳过结算
         if not room.serving_start_time or room.billing_start_temp is None:
             # 没有计费字段，直接移除队列
-            self._remove_request(self.serving_queue, request.roomId)
-            self._remove_request(self.waiting_queue, request.roomId)
-            request.servingTime = None
-            request.waitingTime = now
-            self.waiting_queue.append(request)
+            self._detach(request.roomId)
+            self._push_waiting(request, now_ts, "demote", reason)
             from ..extensions import db
             db.session.query(Room).filter(Room.id == room.id).update({
                 "waiting_start_time": now
@@ -389,31 +691,23 @@ class Scheduler:
         room.serving_start_time = None
         room.billing_start_temp = room.current_temp
 
-        self._remove_request(self.serving_queue, request.roomId)
-        self._remove_request(self.waiting_queue, request.roomId)
-        
-        request.servingTime = None
-        request.waitingTime = now
-        self.waiting_queue.append(request)
+        self._detach(request.roomId)
+        self._push_waiting(request, now_ts, "demote", reason)
 
         db.session.query(Room).filter(Room.id == room.id).update({
             "waiting_start_time": now
         })
         db.session.commit()
 
-    def _promote_waiting_room(self, request: RoomRequest) -> None:
+    def _promote_waiting_room(self, request: RoomRequest, reason: str = "CAPACITY_FREE") -> None:
         room = self.room_service.getRoomById(request.roomId)
         if not room: return
         now = clock.now()
 
         self._updateRoomTemperature(room, force_update=True)
         
-        self._remove_request(self.waiting_queue, request.roomId)
-        self._remove_request(self.serving_queue, request.roomId)
-        
-        request.waitingTime = None
-        request.servingTime = now
-        self.serving_queue.append(request)
+        self._detach(request.roomId)
+        self._push_serving(request, clock.now_ts(), "promote", reason)
 
         start_temp = float(room.current_temp or 25.0)
         from ..extensions import db
@@ -434,7 +728,7 @@ class Scheduler:
         
         # 检查是否已经有计费字段，如果没有则说明已经被其他操作（如 ChangeSpeed）处理过了
         if not room.serving_start_time or room.billing_start_temp is None:
-            print(f"[Skip Temp Reached] Room {room.id} 没有计费字段，可能已被其他操作处理")
+            log.debug("到温处理: Room %s 没有计费字段，可能已被其他操作处理", room.id, extra={"room": room.id})
             # 即使没有计费字段，也要设置 cooling_paused 标志并移除队列
             db.session.query(Room).filter(Room.id == room.id).update({
                 "cooling_paused": True,
@@ -447,6 +741,7 @@ class Scheduler:
             # 从队列中移除
             self._remove_request(self.serving_queue, room.id)
             self._remove_request(self.waiting_queue, room.id)
+            self._transition(room.id, "PAUSED", "TARGET_REACHED")
             return
         
         # 使用原子更新：只有当 cooling_paused 为 False 时才更新
@@ -460,7 +755,7 @@ class Scheduler:
         
         # 如果更新失败（result == 0），说明已经被其他线程处理过了
         if result == 0:
-            print(f"[Skip Temp Reached] Room {room.id} 已经被处理过（cooling_paused=True）")
+            log.debug("到温处理: Room %s 已经被处理过（cooling_paused=True）", room.id, extra={"room": room.id})
             return
         
         # 同步内存对象
@@ -485,6 +780,7 @@ class Scheduler:
         
         self._remove_request(self.serving_queue, room.id)
         self._remove_request(self.waiting_queue, room.id)
+        self._transition(room.id, "PAUSED", "TARGET_REACHED")
         
         # 更新其他状态
         db.session.query(Room).filter(Room.id == room.id).update({
@@ -504,7 +800,7 @@ class Scheduler:
         })
         db.session.commit()
         room.cooling_paused = False
-        self._add_request_to_queue(room)
+        self._add_request_to_queue(room, "REWARM_WAKE")
 
     # --- 调度策略（统一入口） ---
 
@@ -512,104 +808,278 @@ class Scheduler:
         """
         统一调度入口：容量填充 + 优先级抢占 + 等待超时轮转。
         """
+        if self._defer_schedule:
+            self._schedule_pending = True
+            return
         capacity = self._capacity()
         time_slice = self._time_slice()
-        now = clock.now()
+        now_ts = clock.now_ts()
+        self._schedule_incomplete = False
+
+        policy = self.policy
 
-        # 1) 未满载：用等待队列填充（高风速优先，等待时间靠前优先）
+        # 1) 未满载：用等待队列填充（由策略选出下一个，默认高风速优先、等待时间靠前优先）
         while len(self.serving_queue) < capacity and self.waiting_queue:
-            self.waiting_queue.sort(key=lambda r: (-self._speed_val(r.fanSpeed), r.waitingTime))
-            candidate = self.waiting_queue[0]
-            self._promote_waiting_room(candidate)
-
-        # 2) 优先级抢占：等待队列中的高优先级房间抢占服务队列中的低优先级房间
-        # 使用循环处理多次抢占，直到没有更多抢占机会
-        max_preemption_rounds = 10  # 防止无限循环
-        preemption_round = 0
-        while self.waiting_queue and len(self.serving_queue) >= capacity and preemption_round < max_preemption_rounds:
-            preemption_round += 1
-            # 找到等待队列中优先级最高的房间
-            self.waiting_queue.sort(key=lambda r: -self._speed_val(r.fanSpeed))
-            highest_waiting = self.waiting_queue[0]
-            waiting_speed = self._speed_val(highest_waiting.fanSpeed)
-            
-            # 找到服务队列中优先级最低的房间
-            serving_speeds = [self._speed_val(r.fanSpeed) for r in self.serving_queue]
-            min_serving_speed = min(serving_speeds)
-            
-            # 如果等待队列中的最高优先级 > 服务队列中的最低优先级，触发抢占
-            if waiting_speed > min_serving_speed:
-                # 找到服务队列中最低优先级中服务时间最长的房间
-                candidates = [r for r in self.serving_queue if self._speed_val(r.fanSpeed) == min_serving_speed]
-                candidates.sort(key=lambda r: -self._get_simulated_duration(r.servingTime, now))
-                victim = candidates[0]
-                print(f"[Schedule] 触发优先级抢占: Room {highest_waiting.roomId} ({highest_waiting.fanSpeed}) 抢占 Room {victim.roomId} ({victim.fanSpeed})")
-                self._demote_serving_room(victim, "PRIORITY_PREEMPTION")
-                self._promote_waiting_room(highest_waiting)
-                # 继续循环，检查是否还有更多抢占机会
-            else:
-                # 没有更多抢占机会，退出循环
+            candidate = policy.select_next(now_ts)
+            if candidate is None:
+                break
+            with self._try_lock_rooms(candidate.roomId) as locked:
+                if not locked:
+                    # 该房间正在执行命令，下一次 tick 再填充
+                    self._schedule_incomplete = True
+                    break
+                self._promote_waiting_room(candidate)
+
+        # 本轮换入换出预算（0 表示不限）
+        max_swaps = self.tariff_service.current.max_swaps_per_tick
+        swaps = 0
+
+        # 2) 抢占：等待队列中最优先的房间换下策略选出的服务者，直到策略不再给出换下对象
+        for _ in range(policy.preemption_rounds(capacity)):
+            if not self.waiting_queue or len(self.serving_queue) < capacity:
                 break
+            challenger = policy.select_next(now_ts)
+            victim = policy.select_victim(challenger, now_ts) if challenger is not None else None
+            if victim is None:
+                break
+            if max_swaps and swaps >= max_swaps:
+                self.counters["heldBySwapCap"] += 1
+                break
+            with self._try_lock_rooms(victim.roomId, challenger.roomId) as locked:
+                if not locked:
+                    self._schedule_incomplete = True
+                    break
+                schedule_log.info(
+                    "触发优先级抢占: Room %s (%s) 抢占 Room %s (%s)",
+                    challenger.roomId, challenger.fanSpeed, victim.roomId, victim.fanSpeed,
+                    extra={"event": "preemption", "room": challenger.roomId, "victim": victim.roomId},
+                )
+                self._demote_serving_room(victim, "PRIORITY_PREEMPTION")
+                self._promote_waiting_room(challenger, "PRIORITY_PREEMPTION")
+                self.counters["preemptions"] += 1
+                swaps += 1
 
-        # 3) 时间片轮转：等待超时的请求尝试踢掉服务时间最长且风速不高于自己的服务者
+        # 3) 时间片轮转：由策略把全部等待超时的请求与可换下的服务者一次配对
         if self.waiting_queue and len(self.serving_queue) >= capacity:
-            timeout_candidates = []
-            for req in self.waiting_queue:
-                wait_duration = self._get_simulated_duration(req.waitingTime, now)
-                if wait_duration >= time_slice:
-                    timeout_candidates.append(req)
-
-            if timeout_candidates:
-                timeout_candidates.sort(key=lambda r: -self._speed_val(r.fanSpeed))
-                challenger = timeout_candidates[0]
-
-                targets = [r for r in self.serving_queue if self._speed_val(r.fanSpeed) <= self._speed_val(challenger.fanSpeed)]
-                if targets:
-                    targets.sort(key=lambda r: -self._get_simulated_duration(r.servingTime, now))
-                    victim = targets[0]
-                    print(f"[Schedule] 触发时间片轮转: Room {challenger.roomId} 替换 Room {victim.roomId}")
-                    self._demote_serving_room(victim, "TIME_SLICE_ROTATION")
-                    self._promote_waiting_room(challenger)
+            limit = len(self.waiting_queue)
+            if self.tariff_service.current.batched_rotation:
+                # 集中轮转：同一时间片内只在跨过边界后轮转一次，届时处理全部超时请求
+                boundary = int(now_ts // time_slice)
+                if boundary == self._rotation_slice:
+                    if policy.on_timeout(now_ts, 1):
+                        self.counters["heldForSliceBoundary"] += 1
+                    limit = 0
+                else:
+                    self._rotation_slice = boundary
+                    limit = len(self.waiting_queue)
+
+            pairs = policy.on_timeout(now_ts, limit) if limit else []
+            if max_swaps and len(pairs) > max_swaps - swaps:
+                self.counters["heldBySwapCap"] += 1
+                pairs = pairs[:max(0, max_swaps - swaps)]
+            if pairs:
+                # 所有轮转对一次加锁（拿不到锁的房间留到下一次 tick）、一次事务完成
+                with ExitStack() as stack:
+                    locked_pairs = [
+                        (challenger, victim) for challenger, victim in pairs
+                        if stack.enter_context(self._try_lock_rooms(victim.roomId, challenger.roomId))
+                    ]
+                    if len(locked_pairs) < len(pairs):
+                        self._schedule_incomplete = True
+                    swaps += self._rotate(locked_pairs, now_ts)
+
+    def _rotate(self, pairs: List[Tuple[RoomRequest, RoomRequest]], now_ts: float) -> int:
+        """
+        一次完成多对时间片轮转（调用方持有相关房间锁与队列锁）：
+        房间温度推进与结算在内存中算好，详单一条多行 INSERT、房间一次批量 UPDATE，整轮只提交一次；
+        提交成功后再迁移内存队列，失败时回滚且队列保持不变。
+        效果与逐对调用 _demote_serving_room + _promote_waiting_room 相同。
+        """
+        from ..extensions import db
+        from ..services import customer_service
+
+        if not pairs:
+            return 0
+        now = from_ts(now_ts)
+        ids = {req.roomId for pair in pairs for req in pair}
+        rooms = {room.id: room for room in Room.query.filter(Room.id.in_(ids)).all()}
+        pairs = [(c, v) for c, v in pairs if c.roomId in rooms and v.roomId in rooms]
+        customer_ids = customer_service.getCustomerIdsForRooms(rooms[v.roomId] for _, v in pairs)
+
+        details, updates = [], []
+        for challenger, victim in pairs:
+            # 被换下者：有计费字段时推进温度并结算本段服务，计费起点重置为当前温度
+            room = rooms[victim.roomId]
+            values = {"id": room.id, "waiting_start_time": now}
+            if room.serving_start_time and room.billing_start_temp is not None:
+                end_temp = self._forced_temperature(room, now)
+                settlement = self._settlement_cost(room, end_temp)
+                if settlement is not None:
+                    mode, rate, cost = settlement
+                    details.append(self.bill_detail_service.detailValues(
+                        room_id=room.id,
+                        ac_mode=mode,
+                        fan_speed=room.fan_speed,
+                        start_time=room.serving_start_time,
+                        end_time=now,
+                        rate=rate,
+                        cost=cost,
+                        customer_id=customer_ids.get(room.id),
+                        detail_type="AC",
+                    ))
+                values.update(
+                    current_temp=end_temp,
+                    last_temp_update=now,
+                    serving_start_time=None,
+                    billing_start_temp=end_temp,
+                )
+            updates.append(values)
+
+            # 换入者：推进温度，从当前温度开始计费
+            room = rooms[challenger.roomId]
+            start_temp = self._forced_temperature(room, now)
+            updates.append({
+                "id": room.id,
+                "current_temp": start_temp,
+                "last_temp_update": now,
+                "serving_start_time": now,
+                "waiting_start_time": None,
+                "billing_start_temp": start_temp,
+            })
+
+        try:
+            settled = self.bill_detail_service.insertBillDetailsIfAbsent(details, commit=False)
+            db.session.execute(update(Room), updates)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        for challenger, victim in pairs:
+            schedule_log.info("触发时间片轮转: Room %s 替换 Room %s", challenger.roomId, victim.roomId,
+                              extra={"event": "rotation", "room": challenger.roomId, "victim": victim.roomId})
+            self._detach(victim.roomId)
+            self._push_waiting(victim, now_ts, "demote", "TIME_SLICE")
+            self._detach(challenger.roomId)
+            self._push_serving(challenger, now_ts, "promote", "TIME_SLICE")
+        self.counters["rotations"] += len(pairs)
+        if len(pairs) > 1:
+            schedule_log.info("批量轮转 %s 对，新增详单 %s 条", len(pairs), settled,
+                              extra={"event": "rotation_batch", "pairs": len(pairs), "details": settled})
+        return len(pairs)
+
+    # --- ETA 预测 ---
+
+    def _predictions_key_now(self) -> tuple:
+        return (self._queue_version, self.tariff_service.current.version)
+
+    def _prediction_snapshot(self) -> tuple:
+        """
+        持有队列锁调用：复制预测所需的队列状态与缓存键。
+        等待者按策略排好序后复制，锁外计算时不再读取策略的内部状态。
+        """
+        serving = [req.copy() for req in self.serving_queue]
+        waiting = [req.copy() for req in sorted(self.waiting_queue, key=self.policy.waiting_rank)]
+        return self._predictions_key_now(), self.tariff_service.current, serving, waiting
+
+    @staticmethod
+    def _compute_predictions(snapshot: tuple, now_ts: float) -> Predictions:
+        """按队列快照查询房间并计算预测（不需要队列锁）"""
+        _, tariff, serving, waiting = snapshot
+        ids = [req.roomId for req in serving] + [req.roomId for req in waiting]
+        rooms = {room.id: room for room in Room.query.filter(Room.id.in_(ids)).all()} if ids else {}
+        order = {req.roomId: index for index, req in enumerate(waiting)}
+        return predict(serving, waiting, rooms, tariff, now_ts, lambda req: order[req.roomId])
+
+    def _current_predictions(self, now_ts: float) -> Predictions:
+        """
+        当前队列的到温/服务/超时预测（不持有队列锁调用）。
+        两次事件之间温度按固定速率变化，预测按经过的时间折算即可，
+        因此只在队列、目标温度或费率变化后重新计算（一次查询 + 一次遍历）。
+        锁内只复制队列快照，查询与计算在锁外进行，期间队列又变化时结果只用于本次、不进缓存。
+        """
+        with self._lock:
+            key = self._predictions_key_now()
+            if self._predictions is not None and self._predictions_key == key:
+                return self._predictions
+            snapshot = self._prediction_snapshot()
+        predictions = self._compute_predictions(snapshot, now_ts)
+        with self._lock:
+            if self._predictions_key_now() == snapshot[0]:
+                self._predictions, self._predictions_key = predictions, snapshot[0]
+        return predictions
+
+    def _current_predictions_locked(self, now_ts: float) -> Predictions:
+        """
+        持有队列锁时使用的预测（tick 末尾的调度判断）。
+        tick 在加锁前已预热缓存，通常直接命中；只有期间队列恰好变化时才在锁内计算。
+        """
+        if self._predictions is not None and self._predictions_key == self._predictions_key_now():
+            return self._predictions
+        snapshot = self._prediction_snapshot()
+        self._predictions = self._compute_predictions(snapshot, now_ts)
+        self._predictions_key = snapshot[0]
+        return self._predictions
+
+    def _schedule_due(self, now_ts: float) -> bool:
+        """
+        温度 tick 末尾是否需要重新调度。队列状态不变时，默认策略下唯一随时间到来的事件
+        是预测给出的下一次等待超时；此外命令直接入服务队列后可能留下可抢占的等待者（由 tick 兜底）。
+        其他策略、最短服务时长、集中轮转或上次调度未做完时每个 tick 都调度。
+        """
+        tariff = self.tariff_service.current
+        if (
+            self._schedule_incomplete
+            or not self.policy.timeout_driven
+            or tariff.min_service_quantum > 0
+            or tariff.batched_rotation
+        ):
+            return True
+        if not self.waiting_queue:
+            return False
+        if len(self.serving_queue) < self._capacity():
+            return True
+        challenger = self.policy.select_next(now_ts)
+        if challenger is not None and self.policy.select_victim(challenger, now_ts) is not None:
+            return True
+        return now_ts + 1e-6 >= self._current_predictions_locked(now_ts).next_timeout_ts
 
     # --- API ---
 
-    def _add_request_to_queue(self, room: Room):
+    def _add_request_to_queue(self, room: Room, reason: str = "REQUEST"):
         """新增请求入口：包含优先级抢占与等待策略"""
-        req = RoomRequest(roomId=room.id, fanSpeed=room.fan_speed, mode=room.ac_mode, targetTemp=room.target_temp)
         now = clock.now()
-        self._remove_request(self.serving_queue, room.id)
-        self._remove_request(self.waiting_queue, room.id)
+        now_ts = clock.now_ts()
+        self._detach(room.id)
+        req = self._request_for(room, now_ts)
         
         capacity = self._capacity()
 
         # 未满载：直接服务
         if len(self.serving_queue) < capacity:
-            req.servingTime = now
-            self.serving_queue.append(req)
+            self._push_serving(req, now_ts, reason=reason)
             self._mark_serving_db(room.id, now, room.current_temp)
             return
 
-        # 已满载：按风速比较
-        req_speed = self._speed_val(req.fanSpeed)
-        serving_speeds = [self._speed_val(r.fanSpeed) for r in self.serving_queue]
-        min_serving_speed = min(serving_speeds)
-
-        if req_speed > min_serving_speed:
-            # 优先级抢占：踢掉最低风速中服务时间最长的
-            candidates = [r for r in self.serving_queue if self._speed_val(r.fanSpeed) == min_serving_speed]
-            candidates.sort(key=lambda r: -self._get_simulated_duration(r.servingTime, now))
-            victim = candidates[0]
-            print(f"[Schedule] 触发优先级抢占: Room {req.roomId} 抢占 Room {victim.roomId}")
-            self._demote_serving_room(victim, "PRIORITY_PREEMPTION")
-            req.servingTime = now
-            self.serving_queue.append(req)
-            self._mark_serving_db(room.id, now, room.current_temp)
+        # 已满载：由策略决定能否立即抢占（默认：踢掉风速更低者中服务时间最长的，服务未满最短时长的除外）
+        victim = self.policy.select_victim(req, now_ts)
+        if victim is not None:
+            with self._try_lock_rooms(victim.roomId) as locked:
+                if locked:
+                    schedule_log.info("触发优先级抢占: Room %s 抢占 Room %s", req.roomId, victim.roomId,
+                                      extra={"event": "preemption", "room": req.roomId, "victim": victim.roomId})
+                    self._demote_serving_room(victim, "PRIORITY_PREEMPTION")
+                    self._push_serving(req, now_ts, reason=reason)
+                    self._mark_serving_db(room.id, now, room.current_temp)
+                    self.counters["preemptions"] += 1
+                    return
+            # 被抢占房间正在执行命令：先进入等待队列，下一次 tick 的 _schedule_queues 再抢占
+            self._schedule_incomplete = True
         else:
-            # 风速相等或更低：进入等待队列，后续由 _schedule_queues 处理时间片轮转
-            req.waitingTime = now
-            self.waiting_queue.append(req)
-            self._mark_waiting_db(room.id, now)
-            print(f"[Schedule] Room {req.roomId} 进入等待队列 (风速<=最小服务风速)")
+            # 不满足抢占条件：进入等待队列，后续由 _schedule_queues 处理时间片轮转
+            schedule_log.info("Room %s 进入等待队列", req.roomId, extra={"event": "wait", "room": req.roomId})
+        self._push_waiting(req, now_ts, reason=reason)
+        self._mark_waiting_db(room.id, now)
 
     def _mark_serving_db(self, rid, time, temp):
         from ..extensions import db
@@ -629,7 +1099,7 @@ class Scheduler:
         db.session.commit()
 
     def PowerOn(self, RoomId: int, CurrentRoomTemp: float | None) -> str:
-        with self._lock:
+        with self._locked_rooms(RoomId):
             from ..extensions import db
             room = self.room_service.getRoomById(RoomId)
             if not room: return "错误"
@@ -641,12 +1111,11 @@ class Scheduler:
             temp = float(CurrentRoomTemp) if CurrentRoomTemp is not None else float(room.current_temp or 25.0)
             
             # --- 关键: 按次收取房费 ---
-            enable_cycle_fee = current_app.config.get("ENABLE_AC_CYCLE_DAILY_FEE", False)
-            if enable_cycle_fee:
+            if self.tariff_service.current.enable_cycle_fee:
                 fee = room.daily_rate if room.daily_rate is not None else 0.0
                 if fee > 0:
                     # 创建一条“房费”类型的账单
-                    self.bill_detail_service.createBillDetail(
+                    self.bill_detail_service.insertBillDetailIfAbsent(
                         room_id=room.id,
                         ac_mode="NONE",
                         fan_speed="NONE",
@@ -657,7 +1126,7 @@ class Scheduler:
                         customer_id=None, 
                         detail_type="ROOM_FEE"
                     )
-                    print(f"[Scheduler] Room {room.id} 开机: 收取房费 {fee} 元")
+                    log.info("Room %s 开机: 收取房费 %s 元", room.id, fee, extra={"room": room.id, "fee": fee})
 
             db.session.query(Room).filter(Room.id == room.id).update({
                 "ac_on": True, "current_temp": temp, "ac_session_start": now,
@@ -669,11 +1138,12 @@ class Scheduler:
             room.current_temp = temp
             room.last_temp_update = now
             
-            self._add_request_to_queue(room)
+            with self._lock:
+                self._add_request_to_queue(room, "POWER_ON")
             return "空调已开启"
 
     def PowerOff(self, RoomId: int) -> str:
-        with self._lock:
+        with self._locked_rooms(RoomId):
             from ..extensions import db
             room = self.room_service.getRoomById(RoomId)
             if not room: return "未开启"
@@ -703,17 +1173,16 @@ class Scheduler:
             room.billing_start_temp = None
             
             # 3. 移除队列
-            self._remove_request(self.serving_queue, room.id)
-            self._remove_request(self.waiting_queue, room.id)
+            with self._lock:
+                self._remove_request(self.serving_queue, room.id)
+                self._remove_request(self.waiting_queue, room.id)
+                self._transition(room.id, "OFF", "POWER_OFF")
             
             # 4. 关机重置状态：重置温度、风速到默认值
             # 决定重置的默认值
-            mode = (room.ac_mode or "COOLING").upper()
-            if mode == "HEATING":
-                default_target = current_app.config.get("HEATING_DEFAULT_TARGET", 23.0)
-            else:
-                default_target = current_app.config.get("COOLING_DEFAULT_TARGET", 25.0)
-            default_speed = "MEDIUM"  # 风速默认值
+            mode_tariff = self.tariff_service.current.for_mode(room.ac_mode)
+            default_target = mode_tariff.default_target
+            default_speed = mode_tariff.default_speed  # 风速默认值
             # 当前温度重置为房间的默认温度（如果房间有 default_temp，使用它；否则使用 25.0）
             default_current_temp = float(room.default_temp) if room.default_temp is not None else 25.0
 
@@ -736,11 +1205,101 @@ class Scheduler:
             room.fan_speed = default_speed
             room.last_temp_update = None
             
-            self._schedule_queues(force=True)
+            with self._lock:
+                self._schedule_queues(force=True)
             return "空调已关闭"
 
+    def PowerOffMany(self, RoomIds: Optional[Iterable[int]] = None) -> dict:
+        """
+        批量关机（火警、停电、夜间统一关闭）：RoomIds 为空时关闭全酒店所有已开机房间。
+        与逐个 PowerOff 的区别：
+        - 一次查询取出全部房间，温度与结算在内存中一次算完
+        - 详单用一条多行 INSERT（insert-if-absent）写入，房间状态用一次批量 UPDATE 重置
+        - 队列只在最后重新调度一次
+        """
+        from ..extensions import db
+
+        if RoomIds is not None:
+            ids = {int(rid) for rid in RoomIds}
+        else:
+            ids = {rid for (rid,) in db.session.query(Room.id).filter(Room.ac_on.is_(True))}
+        # 按锁顺序先取全部房间锁，再在锁内读取房间行
+        with self._locked_rooms(*ids), self._lock:
+            now = clock.now()
+            query = db.session.query(Room).filter(Room.ac_on.is_(True), Room.id.in_(ids))
+            rooms = query.order_by(Room.id).all() if ids else []
+            requested = len(rooms) if RoomIds is None else len(ids)
+            if not rooms:
+                return {"requested": requested, "poweredOff": [], "settled": 0, "totalCost": 0.0}
+
+            # 入住客人优先取缓存，未命中的房间合并为一次查询
+            from ..services import customer_service
+            customer_ids = customer_service.getCustomerIdsForRooms(rooms)
+
+            tariff = self.tariff_service.current
+            details = []
+            resets = []
+            for room in rooms:
+                # 1. 计算关机时刻的温度
+                end_temp = self._forced_temperature(room, now)
+
+                # 2. 结算当前未完成的服务段
+                if room.serving_start_time and room.billing_start_temp is not None:
+                    settlement = self._settlement_cost(room, end_temp)
+                    if settlement is not None:
+                        mode, rate, cost = settlement
+                        details.append(self.bill_detail_service.detailValues(
+                            room_id=room.id,
+                            ac_mode=mode,
+                            fan_speed=room.fan_speed,
+                            start_time=room.serving_start_time,
+                            end_time=now,
+                            rate=rate,
+                            cost=cost,
+                            customer_id=customer_ids.get(room.id),
+                            detail_type="AC",
+                        ))
+
+                # 3. 关机重置状态（与 PowerOff 一致）
+                mode_tariff = tariff.for_mode(room.ac_mode)
+                resets.append({
+                    "id": room.id,
+                    "ac_on": False,
+                    "serving_start_time": None,
+                    "billing_start_temp": None,
+                    "ac_session_start": None,
+                    "waiting_start_time": None,
+                    "cooling_paused": False,
+                    "pause_start_temp": None,
+                    "current_temp": float(room.default_temp) if room.default_temp is not None else 25.0,
+                    "target_temp": mode_tariff.default_target,
+                    "fan_speed": mode_tariff.default_speed,
+                    "last_temp_update": None,
+                })
+
+            settled = self.bill_detail_service.insertBillDetailsIfAbsent(details)
+            db.session.execute(update(Room), resets)
+            db.session.commit()
+
+            for room in rooms:
+                self._remove_request(self.serving_queue, room.id)
+                self._remove_request(self.waiting_queue, room.id)
+                self._transition(room.id, "OFF", "POWER_OFF")
+
+            self._schedule_queues(force=True)
+            total_cost = sum((d["cost"] for d in details), 0.0)
+            log.info("批量关机 %s 间，新增详单 %s 条，合计 %.2f元", len(rooms), settled, total_cost,
+                     extra={"rooms": len(rooms), "details": settled, "cost": round(total_cost, 2)})
+            return {
+                "requested": requested,
+                "poweredOff": [room.id for room in rooms],
+                "settled": settled,
+                "totalCost": round(total_cost, 2),
+            }
+
     def ChangeTemp(self, RoomId: int, TargetTemp: float) -> str:
-        with self._lock:
+        # 未暂停的房间只改本房间字段，不需要队列锁
+        with self._locked_rooms(RoomId):
             from ..extensions import db
             room = self.room_service.getRoomById(RoomId)
             if not room: return "错误"
@@ -756,29 +1315,26 @@ class Scheduler:
             except (TypeError, ValueError):
                 return "错误"
             
-            mode = (room.ac_mode or "COOLING").upper()
-            if mode == "HEATING":
-                min_t = current_app.config.get("HEATING_MIN_TEMP", 18.0)
-                max_t = current_app.config.get("HEATING_MAX_TEMP", 25.0)
-            else:
-                min_t = current_app.config.get("COOLING_MIN_TEMP", 18.0)
-                max_t = current_app.config.get("COOLING_MAX_TEMP", 28.0)
-            
-            if not (min_t <= target_val <= max_t):
-                return f"温度超限 ({min_t}-{max_t})"
+            mode_tariff = self.tariff_service.current.for_mode(room.ac_mode)
+            if not mode_tariff.accepts(target_val):
+                return f"温度超限 ({mode_tariff.min_temp}-{mode_tariff.max_temp})"
             
             db.session.query(Room).filter(Room.id == room.id).update({"target_temp": target_val})
             db.session.commit()
             room.target_temp = target_val
+            with self._lock:
+                # 目标温度影响到温预测
+                self._queue_version += 1
             
             if room.cooling_paused:
                 db.session.query(Room).filter(Room.id == room.id).update({"cooling_paused": False, "pause_start_temp": None})
                 db.session.commit()
-                self._add_request_to_queue(room)
+                with self._lock:
+                    self._add_request_to_queue(room, "TARGET_CHANGED")
             return "温度已设定"
 
     def ChangeSpeed(self, RoomId: int, FanSpeed: str) -> str:
-        with self._lock:
+        with self._locked_rooms(RoomId):
             from ..extensions import db
             room = self.room_service.getRoomById(RoomId)
             if not room: return "错误"
@@ -788,7 +1344,25 @@ class Scheduler:
             
             new_speed = FanSpeed.upper()
             if room.fan_speed == new_speed: return "未变"
-            now = clock.now()
+            now_ts = clock.now_ts()
+            now = from_ts(now_ts)
+
+            if self._within_coalesce_window(room, "ChangeSpeed", now_ts):
+                # 连续点按调风：窗口内只改风速与请求优先级，不结算、不出入队。
+                # 本段服务在下一次结算时按最终风速记一条详单（费用只取决于温差，不受影响）
+                db.session.query(Room).filter(Room.id == room.id).update({"fan_speed": new_speed})
+                db.session.commit()
+                room.fan_speed = new_speed
+                with self._lock:
+                    req = self._requests.get(room.id)
+                    if req is not None and req.queue != QUEUE_NONE:
+                        req.speed = speed_code(new_speed)
+                        self.policy.reindex(req)
+                        self._queue_version += 1
+                        self._schedule_queues(force=True)
+                    self.counters["coalesced"] += 1
+                self._remember_command(room, "ChangeSpeed", now_ts)
+                return "风速已调整"
             
             # 保存旧的计费起点，用于结算
             old_serving_start_time = room.serving_start_time
@@ -804,8 +1378,9 @@ class Scheduler:
                 # 立即清除计费字段，防止重复结算
                 # 同时设置 cooling_paused，防止温度达到目标时再次结算
                 # 注意：这里先移除队列，然后 _add_request_to_queue 会重新加入（如果需要）
-                self._remove_request(self.serving_queue, room.id)
-                self._remove_request(self.waiting_queue, room.id)
+                with self._lock:
+                    self._remove_request(self.serving_queue, room.id)
+                    self._remove_request(self.waiting_queue, room.id)
                 
                 current_temp = float(room.current_temp or 25.0)
                 db.session.query(Room).filter(Room.id == room.id).update({
@@ -830,7 +1405,8 @@ class Scheduler:
             # 调用 _add_request_to_queue，它会重新设置计费起点（如果需要）
             # 注意：如果房间已经在 serving_queue 中，_add_request_to_queue 会重新设置 serving_start_time
             # 但此时 cooling_paused 已经是 True，所以 _updateRoomTemperature 不会触发 _handle_temp_reached
-            self._add_request_to_queue(room)
+            with self._lock:
+                self._add_request_to_queue(room, "CHANGE_SPEED")
             
             # 如果房间重新进入服务队列，需要清除 cooling_paused 标志
             db.session.refresh(room)
@@ -842,10 +1418,11 @@ class Scheduler:
                 db.session.commit()
                 room.cooling_paused = False
             
+            self._remember_command(room, "ChangeSpeed", now_ts)
             return "风速已调整"
 
     def ChangeMode(self, RoomId: int, Mode: str) -> str:
-        with self._lock:
+        with self._locked_rooms(RoomId):
             from ..extensions import db
             room = self.room_service.getRoomById(RoomId)
             if not room: return "错误"
@@ -872,39 +1449,163 @@ class Scheduler:
                 # 重新设置计费起点
                 self._mark_serving_db(room.id, now, room.current_temp)
 
-            if new_mode == "HEATING":
-                default_target = current_app.config.get("HEATING_DEFAULT_TARGET", 23.0)
-            else:
-                default_target = current_app.config.get("COOLING_DEFAULT_TARGET", 25.0)
+            default_target = self.tariff_service.current.for_mode(new_mode).default_target
             from ..extensions import db
             db.session.query(Room).filter(Room.id == room.id).update({"ac_mode": new_mode, "target_temp": default_target})
             db.session.commit()
             room.ac_mode = new_mode
             room.target_temp = default_target
-            self._add_request_to_queue(room)
+            with self._lock:
+                self._add_request_to_queue(room, "CHANGE_MODE")
             return "模式已切换"
 
+    def _apply_operation(self, op: dict) -> str:
+        action = (op.get("action") or "").lower()
+        room_id = op.get("roomId")
+        value = op.get("value")
+        if room_id is None:
+            raise ValueError("roomId is required")
+        # PowerOff 对不存在的房间也回复"未开启"，这里先排除，免得被当作成功
+        if self.room_service.getRoomById(room_id) is None:
+            raise ValueError(f"房间不存在: {room_id}")
+        if action == "power":
+            if str(value).lower() in ("on", "true", "1"):
+                return self.PowerOn(room_id, None)
+            if str(value).lower() in ("off", "false", "0"):
+                return self.PowerOff(room_id)
+            raise ValueError(f"power 的 value 必须是 on/off: {value}")
+        if action == "temp":
+            return self.ChangeTemp(room_id, value)
+        if action == "speed":
+            if str(value).upper() not in ("LOW", "MEDIUM", "HIGH"):
+                raise ValueError(f"speed 的 value 必须是 LOW/MEDIUM/HIGH: {value}")
+            return self.ChangeSpeed(room_id, str(value))
+        if action == "mode":
+            if str(value).upper() not in ("COOLING", "HEATING"):
+                raise ValueError(f"mode 的 value 必须是 COOLING/HEATING: {value}")
+            return self.ChangeMode(room_id, str(value))
+        raise ValueError(f"不支持的操作: {action}")
+
+    def ApplyBatch(self, Operations: List[dict]) -> List[dict]:
+        """
+        批量控制（团队入住、整层预设）：operations 为 [{roomId, action, value}, ...]，
+        action ∈ power / temp / speed / mode。
+        整批只获取一次锁（涉及的房间锁 + 队列锁），期间推迟队列重调度，结束后统一调度一次；
+        单条失败不影响其他条目，返回与输入一一对应的结果数组。
+        """
+        from ..extensions import db
+        results = []
+        with self._deferred_schedule(op.get("roomId") for op in Operations):
+            for index, op in enumerate(Operations):
+                item = {"index": index, "roomId": op.get("roomId"), "action": op.get("action")}
+                try:
+                    message = self._apply_operation(op)
+                    item["message"] = message
+                    # 控制命令被拒绝时（空调未开、温度越界等）只通过回复表示，不抛异常
+                    item["ok"] = message in COMMAND_OK_MESSAGES
+                    if not item["ok"]:
+                        item["error"] = message
+                except Exception as e:
+                    db.session.rollback()
+                    item["ok"] = False
+                    item["error"] = str(e)
+                results.append(item)
+        return results
+
+    def executeCommands(self, Calls: List[tuple]) -> List[tuple]:
+        """
+        依次执行一批单房间命令 [(方法名, 参数元组), ...]（SchedulerActor 使用），
+        与 ApplyBatch 相同：整批一次加锁、队列只重调度一次。
+        返回与输入一一对应的 ("ok", 返回值) / ("error", 异常)。
+        """
+        from ..extensions import db
+        results = []
+        with self._deferred_schedule(args[0] if args else None for _, args in Calls):
+            for method, args in Calls:
+                if method not in ROOM_COMMANDS:
+                    results.append(("error", ValueError(f"不支持批量执行的命令: {method}")))
+                    continue
+                try:
+                    results.append(("ok", getattr(self, method)(*args)))
+                except Exception as e:
+                    db.session.rollback()
+                    results.append(("error", e))
+        return results
+
+    @contextmanager
+    def _deferred_schedule(self, room_ids: Iterable):
+        """锁住涉及的房间（升序）与队列锁，期间推迟 _schedule_queues，退出时统一调度一次"""
+        ids = set()
+        for rid in room_ids:
+            try:
+                ids.add(int(rid))
+            except (TypeError, ValueError):
+                pass
+        with self._locked_rooms(*ids), self._lock:
+            self._defer_schedule += 1
+            try:
+                yield
+            finally:
+                self._defer_schedule -= 1
+                if not self._defer_schedule and self._schedule_pending:
+                    self._schedule_pending = False
+                    self._schedule_queues(force=True)
+
     # --- 监控 ---
     
     def simulateTemperatureUpdate(self) -> dict:
+        """
+        温度 tick：逐个房间在各自的房间锁下推进温度，最后在队列锁下调度一次；
+        不持有全局锁，房客命令只会与同一房间的 tick 互斥。
+        """
+        from ..extensions import db
         updated = 0
+        history = self.temperature_history
+        # 先记下版本号再查询：之后被命令修改过的房间行需要重新读取
+        versions = dict(self._room_versions)
+        rooms = Room.query.filter_by(ac_on=True).all()
+        # 每个房间单独提交；提交时不让其余已加载的房间过期（否则每个房间都要整行重新 SELECT），
+        # 被命令修改过的房间已由上面的版本号检查重新读取。tick 结束后恢复并整体过期
+        session = db.session()
+        expire_on_commit, session.expire_on_commit = session.expire_on_commit, False
+        # 本轮内达到目标温度等事件引发的重调度推迟到 tick 末尾，只执行一次
         with self._lock:
-            from ..models import Room
-            rooms = Room.query.filter_by(ac_on=True).all()
+            self._defer_schedule += 1
+        try:
             for room in rooms:
-                old = room.current_temp
-                self._updateRoomTemperature(room)
-                if abs((room.current_temp or 0) - (old or 0)) > 0.001:
-                    updated += 1
-            self._schedule_queues()
+                with self._room_lock(room.id):
+                    if self._room_versions.get(room.id) != versions.get(room.id):
+                        # 加锁读取：MySQL 可重复读下普通 SELECT 仍会读到本事务开始时的快照
+                        db.session.refresh(room, with_for_update=True)
+                        if not room.ac_on:
+                            continue
+                    old = room.current_temp
+                    self._updateRoomTemperature(room)
+                    if abs((room.current_temp or 0) - (old or 0)) > 0.001:
+                        updated += 1
+                    if history is not None:
+                        history.record(room.id, clock.now_ts(), room.current_temp)
+        finally:
+            session.expire_on_commit = expire_on_commit
+            session.expire_all()
+            if self.waiting_queue and self.policy.timeout_driven:
+                # 加锁前预热预测缓存，末尾的调度判断不在队列锁内查询数据库
+                self._current_predictions(clock.now_ts())
+            with self._lock:
+                self._defer_schedule -= 1
+                if not self._defer_schedule and (self._schedule_pending or self._schedule_due(clock.now_ts())):
+                    self._schedule_pending = False
+                    self._schedule_queues()
+        if history is not None and history.rollup_enabled:
+            history.flushRollups(clock.now_ts())
         return {"updated": updated}
 
     def RequestState(self, RoomId: int) -> dict:
         """
         状态查询: 动态计算费用，返回房费、空调费分开的数据。
-        加锁防止读取到半更新状态。
+        持有本房间的锁防止读取到半更新状态；不同房间的查询互不阻塞。
         """
-        with self._lock:
+        with self._locked_rooms(RoomId):
             room = self.room_service.getRoomById(RoomId)
             if not room:
                 return {}
@@ -928,8 +1629,7 @@ class Scheduler:
             room_fee = float(room_fee) if room_fee else 0.0
             
             # 如果未开启循环计费，则需要手动加上静态房费
-            enable_cycle_fee = current_app.config.get("ENABLE_AC_CYCLE_DAILY_FEE", False)
-            if not enable_cycle_fee:
+            if not self.tariff_service.current.enable_cycle_fee:
                 room_fee = float(room.daily_rate or 0.0)
             
             # 2. 计算历史空调费（AC 类型的账单总和）
@@ -950,7 +1650,7 @@ class Scheduler:
                     if curr > start: diff = curr - start
 
                 if diff > 0:
-                    ac_fee_pending = diff * 1.0  # 费率恒为1
+                    ac_fee_pending = diff * self._get_rate(room.ac_mode)
             
             ac_fee_total = ac_fee_history + ac_fee_pending
             total_cost = room_fee + ac_fee_total
@@ -962,20 +1662,20 @@ class Scheduler:
             schedule_count = int(schedule_count) if schedule_count else 0
 
             # 5. 获取客户ID
-            customer_id = None
-            if room.status == "OCCUPIED":
-                from ..services import customer_service
-                customer = customer_service.getCustomerByRoomId(room.id)
-                if customer:
-                    customer_id = customer.id
+            from ..services import customer_service
+            customer_id = customer_service.getCustomerIdForRoom(room)
+
+            # 6. 预计开始服务 / 到达目标温度 / 等待超时的剩余逻辑秒数
+            now_ts = clock.now_ts()
+            eta = self._current_predictions(now_ts).for_room(room.id, now_ts)
 
             # 队列状态判定（增强版）
             qs = "IDLE"
             if room.cooling_paused:
                 qs = "PAUSED"
-            elif any(r.roomId == room.id for r in self.serving_queue):
+            elif self._is_serving(room.id):
                 qs = "SERVING"
-            elif any(r.roomId == room.id for r in self.waiting_queue):
+            elif self._is_waiting(room.id):
                 qs = "WAITING"
             else:
                 # 不在任何队列，但空调开着，可能刚达目标温度未设置 cooling_paused
@@ -1002,24 +1702,40 @@ class Scheduler:
                 "room_fee": round(room_fee, 2),
                 "ac_fee": round(ac_fee_total, 2),
                 "schedule_count": schedule_count,
-                "customer_id": customer_id
+                "customer_id": customer_id,
+                **eta,
             }
     
+    def getTemperatureHistory(self, RoomId: int, Since: Optional[float] = None, Rollups: int = 0) -> dict:
+        """房间温度历史（环形缓冲区），Rollups > 0 时附带最近 Rollups 分钟的分钟级汇总"""
+        history = self.temperature_history
+        if history is None:
+            return {"roomId": RoomId, "timestamps": [], "temps": []}
+        result = history.history(RoomId, Since)
+        if Rollups and history.rollup_enabled:
+            result["rollups"] = history.rollups(RoomId, Rollups)
+        return result
+
     def getScheduleStatus(self):
+        now_ts = clock.now_ts()
+        predictions = self._current_predictions(now_ts)
         with self._lock:
-            now = clock.now()
             s_list = []
             for r in self.serving_queue:
-                sec = self._get_simulated_duration(r.servingTime, now)
-                s_list.append({"roomId": r.roomId, "fanSpeed": r.fanSpeed, "servingSeconds": sec, "totalSeconds": sec})
+                sec = max(0.0, now_ts - r.servingTime)
+                s_list.append({"roomId": r.roomId, "fanSpeed": r.fanSpeed, "servingSeconds": sec, "totalSeconds": sec,
+                               **predictions.for_room(r.roomId, now_ts)})
             w_list = []
             for r in self.waiting_queue:
-                sec = self._get_simulated_duration(r.waitingTime, now)
-                w_list.append({"roomId": r.roomId, "fanSpeed": r.fanSpeed, "waitingSeconds": sec})
+                sec = max(0.0, now_ts - r.waitingTime)
+                w_list.append({"roomId": r.roomId, "fanSpeed": r.fanSpeed, "waitingSeconds": sec,
+                               **predictions.for_room(r.roomId, now_ts)})
             
             return {
                 "capacity": self._capacity(),
                 "timeSlice": self._time_slice(),
                 "servingQueue": s_list,
-                "waitingQueue": w_list
+                "waitingQueue": w_list,
+                "policy": self.policy.name,
+                "counters": dict(self.counters),
             }
\ No newline at end of file
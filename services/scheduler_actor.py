@@ -0,0 +1,159 @@
+"""
+调度器命令队列（单写者 Actor 模式）
+入住高峰、早晨集中开机时，每条控制命令都会立即触发一次完整的 _schedule_queues。
+开启 SCHEDULER_ACTOR_ENABLED 后，HTTP 线程只把命令放入队列并等待 Future；
+唯一的工作线程一次取出所有积压的命令，合并为一批执行（整批一次加锁、队列只重调度一次），再逐个完成 Future。
+
+只读/查询类方法（RequestState、getScheduleStatus 等）不经过队列，直接调用调度器，
+保持房间锁带来的并行查询能力。
+
+队列只让控制命令彼此串行：温度 tick 仍在自己的后台线程中运行，照常依靠房间锁与队列锁
+与工作线程互斥，并不经过这里。工作线程在自己的应用上下文与数据库会话中执行命令，
+每批结束后提交或回滚并移除会话；调用方的请求会话不会被工作线程读写或提交。
+调用方若在发出命令前已有未提交的写入，应自行先提交，否则工作线程的写入会等到 busy_timeout。
+"""
+from __future__ import annotations
+
+import queue
+import threading
+from concurrent.futures import Future
+from functools import partial
+from typing import List, Tuple
+
+from ..extensions import db
+from ..utils.log import get_logger
+from .scheduler import ROOM_COMMANDS
+
+log = get_logger("SchedulerActor")
+
+# 经由队列执行的写命令；PowerOffMany / ApplyBatch 本身已是批量命令，单独执行
+QUEUED_COMMANDS = ROOM_COMMANDS | {"PowerOffMany", "ApplyBatch"}
+
+_STOP = object()
+
+
+class SchedulerActor:
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.max_batch = 64
+        self.timeout = 30.0
+        self.thread = None
+        self.running = False
+        self._queue: "queue.Queue" = queue.Queue()
+        self.batches = 0
+        self.commands = 0
+
+    def start(self, app, max_batch: int = 64, timeout: float = 30.0) -> None:
+        if self.running:
+            return
+        self.max_batch = max(1, int(max_batch))
+        self.timeout = timeout
+        self.running = True
+        self.thread = threading.Thread(target=self._run, args=(app,), daemon=True)
+        self.thread.start()
+        log.info("已启动，单批最多 %s 条命令", self.max_batch)
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        self._queue.put(_STOP)
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        log.info("已停止")
+
+    # --- 提交 ---
+
+    def submit(self, method: str, *args) -> Future:
+        future: Future = Future()
+        if not self.running:
+            # 未启动（CLI、测试进程）时退化为直接调用
+            try:
+                future.set_result(getattr(self.scheduler, method)(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self._queue.put((method, args, future))
+        return future
+
+    def _call(self, method: str, *args):
+        if threading.current_thread() is self.thread:
+            # 工作线程内部的嵌套调用直接执行，避免等待自己
+            return getattr(self.scheduler, method)(*args)
+        return self.submit(method, *args).result(timeout=self.timeout)
+
+    def __getattr__(self, name: str):
+        if name in QUEUED_COMMANDS:
+            return partial(self._call, name)
+        # 查询类方法与内部方法直接透传给调度器
+        return getattr(self.scheduler, name)
+
+    # --- 工作线程 ---
+
+    def _drain(self, first) -> List[Tuple[str, tuple, Future]]:
+        pending = [first]
+        while len(pending) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            pending.append(item)
+        return pending
+
+    def _run(self, app) -> None:
+        while self.running:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            pending = self._drain(first)
+            # 每批使用工作线程自己的应用上下文与会话，批末提交残留写入，异常时回滚
+            with app.app_context():
+                try:
+                    self._execute(pending)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    log.warning("批次提交失败: %s", e, extra={"commands": len(pending)})
+                finally:
+                    try:
+                        db.session.remove()
+                    except Exception:
+                        pass
+
+    def _execute(self, pending: List[Tuple[str, tuple, Future]]) -> None:
+        """按提交顺序执行：连续的单房间命令合并为一批，批量命令单独执行"""
+        self.batches += 1
+        self.commands += len(pending)
+        group: List[Tuple[str, tuple, Future]] = []
+        for item in pending:
+            if item[0] in ROOM_COMMANDS:
+                group.append(item)
+                continue
+            self._execute_group(group)
+            group = []
+            method, args, future = item
+            try:
+                future.set_result(getattr(self.scheduler, method)(*args))
+            except Exception as e:
+                db.session.rollback()
+                future.set_exception(e)
+        self._execute_group(group)
+
+    def _execute_group(self, group: List[Tuple[str, tuple, Future]]) -> None:
+        if not group:
+            return
+        try:
+            results = self.scheduler.executeCommands([(method, args) for method, args, _ in group])
+        except Exception as e:
+            db.session.rollback()
+            for _, _, future in group:
+                future.set_exception(e)
+            return
+        for (_, _, future), (status, value) in zip(group, results):
+            if status == "ok":
+                future.set_result(value)
+            else:
+                future.set_exception(value)
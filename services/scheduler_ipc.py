@@ -0,0 +1,257 @@
+"""
+多进程部署下的调度器 IPC
+- SchedulerLeader: 运行在调度主进程 (leader) 中，独占服务/等待队列与温度 tick，
+  监听本地 IPC 地址，在应用上下文中执行 worker 转发来的控制命令。
+- RemoteScheduler: 运行在 HTTP 工作进程 (worker) 中，替代本地 Scheduler，
+  把公开命令原样转发给 leader 并返回结果。
+
+传输层使用 multiprocessing.connection（POSIX 上支持 Unix socket，Windows 上可用 TCP 回环地址），
+并以 authkey 做握手认证。
+
+逻辑时钟只有 leader 一份：每条回复都附带 leader 时钟的锚点，worker 的 clock 以跟随模式采用它，
+另有后台线程定期同步（覆盖只读写本地数据库、不发 IPC 的请求，如入住/退房）；
+worker 上的 /test/time/* 接口经 CLOCK_COMMANDS 转发给 leader 执行。
+"""
+from __future__ import annotations
+
+import os
+import stat
+import threading
+import time
+from functools import partial
+from multiprocessing.connection import Client, Listener
+from typing import Tuple, Union
+
+from ..extensions import db
+from ..utils.log import get_logger
+from ..utils.time_master import clock
+
+log = get_logger("SchedulerLeader")
+
+# 允许跨进程调用的调度器方法（参数与返回值均为基础类型）
+FORWARDED_COMMANDS = frozenset(
+    {
+        "PowerOn",
+        "PowerOff",
+        "PowerOffMany",
+        "ChangeTemp",
+        "ChangeSpeed",
+        "ChangeMode",
+        "ApplyBatch",
+        "RequestState",
+        "getScheduleStatus",
+        "getTemperatureHistory",
+        "simulateTemperatureUpdate",
+        "clearQueues",
+        "dropRoomFromQueues",
+    }
+)
+
+# 逻辑时钟命令：worker 不各自计时，时钟的读取与调整都在 leader 上执行
+CLOCK_COMMANDS = frozenset(
+    {
+        "clockState",
+        "setSpeed",
+        "pauseClock",
+        "resumeClock",
+        "jumpTo",
+        "setManual",
+        "advanceTime",
+    }
+)
+
+Address = Union[str, Tuple[str, int]]
+
+
+def parse_address(text: str) -> Address:
+    """'unix:/tmp/hotel.sock' 或 '/tmp/hotel.sock' -> Unix socket；'127.0.0.1:8765' -> TCP"""
+    if text.startswith("unix:"):
+        return text[len("unix:"):]
+    if "/" in text or "\\" in text:
+        return text
+    host, _, port = text.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def ipc_authkey(config) -> bytes:
+    """
+    取 IPC 握手密钥。连接上的消息是 pickle，知道密钥即可在 leader 中执行任意代码，
+    因此密钥必须显式配置，且不能复用（常见于示例配置中的）SECRET_KEY
+    """
+    authkey = config.get("SCHEDULER_IPC_AUTHKEY") or ""
+    if not authkey:
+        raise RuntimeError("多进程部署必须设置 SCHEDULER_IPC_AUTHKEY")
+    if authkey == config.get("SECRET_KEY"):
+        raise RuntimeError("SCHEDULER_IPC_AUTHKEY 不能与 SECRET_KEY 相同")
+    return authkey.encode("utf-8")
+
+
+def _remove_stale_socket(path: str) -> None:
+    """leader 异常退出后残留的 socket 文件会让 bind 失败，启动前删除（只删除 socket 文件）"""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class SchedulerLeader:
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.listener = None
+        self.thread = None
+        self.running = False
+
+    def start(self, app) -> None:
+        """在后台线程中接受 worker 连接"""
+        if self.running:
+            return
+        address = parse_address(app.config["SCHEDULER_IPC_ADDRESS"])
+        authkey = ipc_authkey(app.config)
+        if isinstance(address, str):
+            _remove_stale_socket(address)
+        self.listener = Listener(address, authkey=authkey)
+        if isinstance(address, str):
+            # 只允许与 leader 同一用户的进程连接
+            os.chmod(address, 0o600)
+        self.running = True
+        self.thread = threading.Thread(target=self._accept_loop, args=(app,), daemon=True)
+        self.thread.start()
+        log.info("已启动，监听 %s", address)
+
+    def _accept_loop(self, app) -> None:
+        while self.running:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                if self.running:
+                    log.warning("接受连接失败: %s", e)
+                continue
+            threading.Thread(target=self._serve, args=(app, conn), daemon=True).start()
+
+    def _serve(self, app, conn) -> None:
+        with conn:
+            while self.running:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                conn.send(self._dispatch(app, method, args))
+
+    def _dispatch(self, app, method: str, args: tuple) -> tuple:
+        """返回 (状态, 结果, leader 时钟锚点)"""
+        if method in FORWARDED_COMMANDS:
+            target = getattr(self.scheduler, method)
+        elif method in CLOCK_COMMANDS:
+            target = self._clock_command(method)
+        else:
+            return ("error", f"不支持的调度命令: {method}", clock.snapshot())
+        with app.app_context():
+            try:
+                result = ("ok", target(*args))
+            except Exception as e:
+                db.session.rollback()
+                result = ("error", str(e))
+            finally:
+                db.session.remove()
+        return result + (clock.snapshot(),)
+
+    @staticmethod
+    def _clock_command(method: str):
+        if method == "advanceTime":
+            # 虚拟时钟推进需同步执行 tick，只能在持有队列的 leader 上进行
+            from . import temperature_scheduler
+
+            return temperature_scheduler.advance
+        return {
+            "clockState": lambda: None,
+            "setSpeed": clock.set_speed,
+            "pauseClock": clock.pause,
+            "resumeClock": clock.resume,
+            "jumpTo": clock.jump_to,
+            "setManual": clock.set_manual,
+        }[method]
+
+    def stop(self) -> None:
+        self.running = False
+        if self.listener is not None:
+            self.listener.close()
+        log.info("已停止")
+
+
+class RemoteScheduler:
+    """worker 进程中的调度器代理，每个线程复用一条到 leader 的连接"""
+
+    def __init__(self, address: Address, authkey: bytes, timeout: float = 30.0):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._local = threading.local()
+        self._clock_thread = None
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, method: str, *args):
+        try:
+            conn = self._connection()
+            conn.send((method, args))
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"调度主进程响应超时: {method}")
+            status, payload, clock_state = conn.recv()
+        except (EOFError, OSError, TimeoutError) as e:
+            # 连接已断开（如 leader 重启），丢弃后下次调用重新连接
+            self._reset()
+            raise RuntimeError(f"无法连接调度主进程: {e}") from e
+        clock.adopt(clock_state)
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+
+    def __getattr__(self, name: str):
+        if name in FORWARDED_COMMANDS or name in CLOCK_COMMANDS:
+            return partial(self._call, name)
+        raise AttributeError(name)
+
+    # --- 逻辑时钟 ---
+
+    def follow_clock(self, interval: float = 1.0) -> None:
+        """本进程的 clock 改为跟随 leader，并每 interval 秒同步一次（leader 未启动时持续重试）"""
+        clock.follow(self)
+        if self._clock_thread is not None:
+            return
+        # 先同步一次，使随后写入的时间（如录制文件头部）已在主进程的时间线上
+        connected = self._sync_clock_once(None)
+        self._clock_thread = threading.Thread(
+            target=self._sync_clock, args=(max(0.05, interval), connected), daemon=True
+        )
+        self._clock_thread.start()
+
+    def _sync_clock_once(self, connected):
+        try:
+            self.clockState()
+        except RuntimeError as e:
+            if connected is not False:
+                log.warning("逻辑时钟同步失败: %s", e)
+            return False
+        if connected is not True:
+            log.info("逻辑时钟已与调度主进程同步")
+        return True
+
+    def _sync_clock(self, interval: float, connected) -> None:
+        while True:
+            time.sleep(interval)
+            connected = self._sync_clock_once(connected)
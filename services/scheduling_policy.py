@@ -0,0 +1,458 @@
+"""
+调度策略（可插拔）
+_schedule_queues 只负责加锁、落库、计数与换入换出上限，"选谁" 由策略对象决定：
+- select_next(now_ts)                 空出服务位时，从等待队列中选出下一个（同时是抢占的挑战者）
+- select_victim(challenger, now_ts)   满载时挑战者可以立即换下的服务者，None 表示不抢占
+- on_timeout(now_ts, limit)           按等待超时/公平性产生的 (挑战者, 被换下者) 轮转对，最多 limit 对
+
+策略在入队/出队时维护自己的堆索引（过期条目惰性删除），每次选择 O(log n)，
+不再每轮对整个队列排序、扫描；服务位扩展到上百台空调时开销不随队列长度线性增长。
+
+内置策略（HOTEL_SCHEDULING_POLICY）：
+- priority: 默认。风速优先抢占 + 等待满一个时间片后轮转（原有规则）
+- aging:    老化防饥饿。等待中的房间每等待 HOTEL_POLICY_AGING_SECONDS 有效优先级升一档，
+            换入后带着这份加成、每服务同样时长降一档；挑战者高出一档以上才换入，不再单独依赖时间片
+- wfq:      加权公平排队。以风速为权重累计"归一化服务时长"（服务秒数 / 权重），
+            累计最少的等待者优先；服务者比挑战者多出一个加权时间片后被换下，长期服务份额与风速成正比
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..models import QUEUE_SERVING, QUEUE_WAITING, SPEED_HIGH, SPEED_LOW, RoomRequest
+from ..utils.time_master import clock
+
+SPEED_LEVELS = tuple(range(SPEED_LOW, SPEED_HIGH + 1))
+
+Entry = Tuple[object, int, RoomRequest]
+
+
+class _LazyHeap:
+    """最小堆 + 惰性删除：条目为 (key, token, req)，token 与策略记录的当前 token 不一致即为过期条目"""
+
+    __slots__ = ("_heap", "_tokens")
+
+    def __init__(self, tokens: Dict[int, int]):
+        self._heap: List[Entry] = []
+        self._tokens = tokens
+
+    def _valid(self, entry: Entry) -> bool:
+        return self._tokens.get(entry[2].roomId) == entry[1]
+
+    def push(self, key, token: int, req: RoomRequest) -> None:
+        heap = self._heap
+        heapq.heappush(heap, (key, token, req))
+        # 过期条目只在到达堆顶时才被丢弃，积压过多时整体压缩一次
+        if len(heap) > 4 * len(self._tokens) + 64:
+            self._heap = [entry for entry in heap if self._valid(entry)]
+            heapq.heapify(self._heap)
+
+    def peek(self) -> Optional[Entry]:
+        heap = self._heap
+        while heap and not self._valid(heap[0]):
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def pop(self) -> Optional[Entry]:
+        entry = self.peek()
+        if entry is not None:
+            heapq.heappop(self._heap)
+        return entry
+
+    def restore(self, entries: List[Entry]) -> None:
+        """放回之前为了查看后续元素而临时弹出的条目"""
+        for entry in entries:
+            heapq.heappush(self._heap, entry)
+
+    def clear(self) -> None:
+        self._heap.clear()
+
+
+class SchedulingPolicy:
+    """策略基类：维护入队 token，子类在 _index 中把请求放进各自的堆"""
+
+    name = "base"
+    # 不发生命令时，下一次换入换出只取决于等待超时时刻（可由 ETA 预测精确给出）
+    timeout_driven = False
+
+    def __init__(self, tariff_service, counters: Dict[str, int]):
+        self.tariff_service = tariff_service
+        self.counters = counters
+        self._seq = itertools.count()
+        # 房间 -> 当前有效的入队 token（不在队列中的房间没有 token）
+        self._tokens: Dict[int, int] = {}
+        self._init_indexes()
+
+    # --- 索引维护（由 Scheduler 在入队/出队时调用，需持有队列锁） ---
+
+    def _init_indexes(self) -> None:
+        raise NotImplementedError
+
+    def _index(self, req: RoomRequest, token: int) -> None:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        self._tokens.clear()
+        self._init_indexes()
+
+    def rebuild(self, serving: List[RoomRequest], waiting: List[RoomRequest]) -> None:
+        self.reset()
+        for req in list(serving) + list(waiting):
+            self.on_enqueue(req)
+
+    def on_enqueue(self, req: RoomRequest) -> None:
+        self.reindex(req)
+
+    def reindex(self, req: RoomRequest) -> None:
+        """请求的键（风速等）原地变化后重新建立索引，旧条目自动过期"""
+        token = next(self._seq)
+        self._tokens[req.roomId] = token
+        self._index(req, token)
+
+    def on_dequeue(self, req: RoomRequest) -> None:
+        self._tokens.pop(req.roomId, None)
+
+    # --- 决策 ---
+
+    def _quantum(self) -> float:
+        return self.tariff_service.current.min_service_quantum
+
+    def _time_slice(self) -> float:
+        return float(self.tariff_service.current.time_slice)
+
+    def preemption_rounds(self, capacity: int) -> int:
+        """单轮调度中优先级抢占的次数上限：每个服务位最多被连续换两次（低→中→高）"""
+        return capacity * (SPEED_HIGH - SPEED_LOW)
+
+    def select_next(self, now_ts: float) -> Optional[RoomRequest]:
+        raise NotImplementedError
+
+    def select_victim(self, challenger: RoomRequest, now_ts: float) -> Optional[RoomRequest]:
+        raise NotImplementedError
+
+    def on_timeout(self, now_ts: float, limit: int) -> List[Tuple[RoomRequest, RoomRequest]]:
+        raise NotImplementedError
+
+    def waiting_rank(self, req: RoomRequest):
+        """等待者的服务先后（越小越先），供 ETA 预测排序"""
+        raise NotImplementedError
+
+    def _scan(self, heap: _LazyHeap, accept: Callable[[RoomRequest], bool], popped: List[Entry]) -> Optional[RoomRequest]:
+        """按堆序查找第一个满足 accept 的请求；查看过的条目记入 popped，调用方负责放回"""
+        while True:
+            entry = heap.pop()
+            if entry is None:
+                return None
+            popped.append(entry)
+            if accept(entry[2]):
+                return entry[2]
+
+
+class PriorityPolicy(SchedulingPolicy):
+    """风速优先 + 时间片轮转（原有调度规则）"""
+
+    name = "priority"
+    timeout_driven = True
+
+    def _init_indexes(self) -> None:
+        # 等待者：风速高、等待早者优先；按风速分桶的等待时间堆用于查找超时者
+        self._waiting = _LazyHeap(self._tokens)
+        self._waiting_by_speed = {speed: _LazyHeap(self._tokens) for speed in SPEED_LEVELS}
+        # 服务者：按风速分桶，桶内服务开始最早者在堆顶
+        self._serving_by_speed = {speed: _LazyHeap(self._tokens) for speed in SPEED_LEVELS}
+
+    def _index(self, req: RoomRequest, token: int) -> None:
+        speed = min(max(req.speed, SPEED_LOW), SPEED_HIGH)
+        if req.queue == QUEUE_WAITING:
+            self._waiting.push((-req.speed, req.waitingTime), token, req)
+            self._waiting_by_speed[speed].push(req.waitingTime, token, req)
+        elif req.queue == QUEUE_SERVING:
+            self._serving_by_speed[speed].push(req.servingTime, token, req)
+
+    def select_next(self, now_ts: float) -> Optional[RoomRequest]:
+        entry = self._waiting.peek()
+        return entry[2] if entry is not None else None
+
+    def waiting_rank(self, req: RoomRequest):
+        return (-req.speed, req.waitingTime)
+
+    def _longest_served(self, max_speed: int, now_ts: float, strict: bool) -> List[Entry]:
+        """风速不高于 max_speed（strict 时严格低于）的各桶中可被换下的堆顶，按风速从低到高"""
+        quantum = self._quantum()
+        heads, held = [], False
+        for speed in SPEED_LEVELS:
+            if speed > max_speed or (strict and speed == max_speed):
+                break
+            head = self._serving_by_speed[speed].peek()
+            if head is None:
+                continue
+            # 桶内堆顶服务最久：堆顶未满最短服务时长，则整个桶都不可换下
+            if quantum > 0 and now_ts - head[2].servingTime < quantum:
+                held = True
+                continue
+            heads.append(head)
+        if held and not heads:
+            self.counters["heldByQuantum"] += 1
+        return heads
+
+    def select_victim(self, challenger: RoomRequest, now_ts: float) -> Optional[RoomRequest]:
+        # 抢占：风速严格更低者中风速最低、服务最久的
+        heads = self._longest_served(challenger.speed, now_ts, strict=True)
+        return heads[0][2] if heads else None
+
+    def on_timeout(self, now_ts: float, limit: int) -> List[Tuple[RoomRequest, RoomRequest]]:
+        """等待满一个时间片的请求按风速从高到低、等待从早到晚依次挑战，最多尝试 limit 个"""
+        deadline = now_ts - self._time_slice()
+        pairs = []
+        popped: List[Tuple[_LazyHeap, Entry]] = []
+        tried = 0
+        try:
+            for speed in reversed(SPEED_LEVELS):
+                heap = self._waiting_by_speed[speed]
+                while tried < limit:
+                    entry = heap.peek()
+                    if entry is None or entry[2].waitingTime > deadline:
+                        break
+                    popped.append((heap, heap.pop()))
+                    tried += 1
+                    challenger = entry[2]
+                    # 被换下者：风速不高于挑战者、服务最久
+                    heads = self._longest_served(challenger.speed, now_ts, strict=False)
+                    if not heads:
+                        continue
+                    victim_entry = min(heads, key=lambda e: (e[2].servingTime, e[1]))
+                    victim = victim_entry[2]
+                    # 同一轮中一个服务者只被换下一次：暂时移出堆
+                    victim_heap = self._serving_by_speed[min(max(victim.speed, SPEED_LOW), SPEED_HIGH)]
+                    popped.append((victim_heap, victim_heap.pop()))
+                    pairs.append((challenger, victim))
+        finally:
+            _restore(popped)
+        return pairs
+
+
+def _restore(popped: List[Tuple[_LazyHeap, Entry]]) -> None:
+    for heap, entry in popped:
+        heap.restore([entry])
+
+
+class _PairwisePolicy(SchedulingPolicy):
+    """
+    以"最优等待者 vs 最差服务者"逐对比较的策略（aging / wfq）：
+    键在入队时确定、之后不随时间变化（时间项对同一堆内所有请求相同，可约去），
+    每产生一对轮转 O(log n)。
+    """
+
+    def _init_indexes(self) -> None:
+        self._waiting = _LazyHeap(self._tokens)
+        self._serving = _LazyHeap(self._tokens)
+
+    def _index(self, req: RoomRequest, token: int) -> None:
+        if req.queue == QUEUE_WAITING:
+            self._waiting.push(self._waiting_key(req), token, req)
+        elif req.queue == QUEUE_SERVING:
+            self._serving.push(self._serving_key(req), token, req)
+
+    def _waiting_key(self, req: RoomRequest):
+        raise NotImplementedError
+
+    def _serving_key(self, req: RoomRequest):
+        raise NotImplementedError
+
+    def _should_swap(self, challenger: RoomRequest, victim: RoomRequest, now_ts: float) -> bool:
+        raise NotImplementedError
+
+    def select_next(self, now_ts: float) -> Optional[RoomRequest]:
+        entry = self._waiting.peek()
+        return entry[2] if entry is not None else None
+
+    def waiting_rank(self, req: RoomRequest):
+        return self._waiting_key(req)
+
+    def _eligible(self, now_ts: float, held: List[bool]) -> Callable[[RoomRequest], bool]:
+        quantum = self._quantum()
+
+        def accept(req: RoomRequest) -> bool:
+            if quantum > 0 and now_ts - req.servingTime < quantum:
+                held[0] = True
+                return False
+            return True
+
+        return accept
+
+    def _worst_serving(self, now_ts: float, popped: List[Tuple[_LazyHeap, Entry]]) -> Optional[RoomRequest]:
+        """最应被换下的服务者（跳过未满最短服务时长者），并将其暂时移出堆，查看过的条目记入 popped"""
+        held = [False]
+        scanned: List[Entry] = []
+        victim = self._scan(self._serving, self._eligible(now_ts, held), scanned)
+        popped.extend((self._serving, entry) for entry in scanned)
+        if victim is None and held[0]:
+            self.counters["heldByQuantum"] += 1
+        return victim
+
+    def select_victim(self, challenger: RoomRequest, now_ts: float) -> Optional[RoomRequest]:
+        popped: List[Tuple[_LazyHeap, Entry]] = []
+        try:
+            victim = self._worst_serving(now_ts, popped)
+        finally:
+            _restore(popped)
+        if victim is not None and self._should_swap(challenger, victim, now_ts):
+            return victim
+        return None
+
+    def on_timeout(self, now_ts: float, limit: int) -> List[Tuple[RoomRequest, RoomRequest]]:
+        pairs = []
+        popped: List[Tuple[_LazyHeap, Entry]] = []
+        try:
+            while len(pairs) < limit:
+                entry = self._waiting.pop()
+                if entry is None:
+                    break
+                popped.append((self._waiting, entry))
+                victim = self._worst_serving(now_ts, popped)
+                if victim is None or not self._should_swap(entry[2], victim, now_ts):
+                    break
+                pairs.append((entry[2], victim))
+        finally:
+            _restore(popped)
+        return pairs
+
+
+class AgingPolicy(_PairwisePolicy):
+    """
+    老化防饥饿：等待者有效优先级 = 风速 + 已等待时长 / A；
+    换入时保留等待积累的加成，服务期间按同样速度衰减：服务者有效优先级 = 风速 + (加成 - 已服务时长) / A。
+    两者乘以 A 后与 now 无关：等待者键 speed*A - waitingTime 越大越优先，
+    服务者键 speed*A + 加成 + servingTime 越小越先被换下。
+    """
+
+    name = "aging"
+
+    def _init_indexes(self) -> None:
+        super()._init_indexes()
+        self._waiting_since: Dict[int, float] = {}
+        # 房间 -> 换入服务时已积累的老化加成（秒）
+        self._boost: Dict[int, float] = {}
+
+    def _aging(self) -> float:
+        return self.tariff_service.current.aging_seconds or self._time_slice()
+
+    def _index(self, req: RoomRequest, token: int) -> None:
+        if req.queue == QUEUE_WAITING:
+            self._waiting_since[req.roomId] = req.waitingTime
+        elif req.queue == QUEUE_SERVING and req.roomId not in self._boost:
+            since = self._waiting_since.pop(req.roomId, req.servingTime)
+            self._boost[req.roomId] = max(0.0, req.servingTime - since)
+        super()._index(req, token)
+
+    def on_dequeue(self, req: RoomRequest) -> None:
+        if req.queue == QUEUE_SERVING:
+            self._boost.pop(req.roomId, None)
+        super().on_dequeue(req)
+
+    def _waiting_key(self, req: RoomRequest):
+        return (-(req.speed * self._aging() - req.waitingTime), req.waitingTime)
+
+    def _serving_key(self, req: RoomRequest):
+        return (req.speed * self._aging() + self._boost.get(req.roomId, 0.0) + req.servingTime, req.servingTime)
+
+    def _effective(self, req: RoomRequest, now_ts: float) -> float:
+        aging = self._aging()
+        if req.queue == QUEUE_SERVING:
+            return req.speed + (self._boost.get(req.roomId, 0.0) - (now_ts - req.servingTime)) / aging
+        # 尚未入队的新请求（_add_request_to_queue 中的抢占判断）按刚开始等待计
+        since = req.waitingTime if req.waitingTime is not None else now_ts
+        return req.speed + (now_ts - since) / aging
+
+    def _should_swap(self, challenger: RoomRequest, victim: RoomRequest, now_ts: float) -> bool:
+        # 至少高出一档才换入，避免相邻两个房间来回换
+        return self._effective(challenger, now_ts) - self._effective(victim, now_ts) >= 1.0
+
+
+class WeightedFairPolicy(_PairwisePolicy):
+    """
+    加权公平排队：权重 = 风速（1/2/3），归一化服务 V = 累计服务秒数 / 权重。
+    服务者的 V 以 1/w 的速度随时间增长，按权重分桶后桶内键不随时间变化；
+    最差服务者取各桶堆顶中 V 最大者，O(桶数 · log n)。
+    """
+
+    name = "wfq"
+
+    def _init_indexes(self) -> None:
+        self._waiting = _LazyHeap(self._tokens)
+        self._serving_by_weight = {speed: _LazyHeap(self._tokens) for speed in SPEED_LEVELS}
+        # 房间 -> 出服务队列时结算的归一化服务；入队者不低于 _vfloor，避免长期空闲的房间回来后独占服务位
+        self._vtime: Dict[int, float] = {}
+        self._vfloor = 0.0
+
+    @staticmethod
+    def _weight(req: RoomRequest) -> int:
+        return min(max(req.speed, SPEED_LOW), SPEED_HIGH)
+
+    def _index(self, req: RoomRequest, token: int) -> None:
+        vtime = max(self._vtime.get(req.roomId, self._vfloor), self._vfloor)
+        self._vtime[req.roomId] = vtime
+        if req.queue == QUEUE_WAITING:
+            self._waiting.push((vtime, req.waitingTime), token, req)
+        elif req.queue == QUEUE_SERVING:
+            self._vfloor = max(self._vfloor, vtime)
+            # 当前 V = vtime + (now - servingTime) / w，桶内按 vtime - servingTime / w 取最大
+            key = -(vtime - req.servingTime / self._weight(req))
+            self._serving_by_weight[self._weight(req)].push((key, req.servingTime), token, req)
+
+    def on_dequeue(self, req: RoomRequest) -> None:
+        if req.queue == QUEUE_SERVING and req.servingTime is not None and req.roomId in self._tokens:
+            served = max(0.0, clock.now_ts() - req.servingTime)
+            self._vtime[req.roomId] = self._vtime.get(req.roomId, self._vfloor) + served / self._weight(req)
+        super().on_dequeue(req)
+
+    def waiting_rank(self, req: RoomRequest):
+        return (self._vtime.get(req.roomId, self._vfloor), req.waitingTime)
+
+    def _current(self, req: RoomRequest, now_ts: float) -> float:
+        vtime = self._vtime.get(req.roomId, self._vfloor)
+        if req.queue == QUEUE_SERVING:
+            vtime += max(0.0, now_ts - req.servingTime) / self._weight(req)
+        return vtime
+
+    def _worst_serving(self, now_ts: float, popped: List[Tuple[_LazyHeap, Entry]]) -> Optional[RoomRequest]:
+        held = [False]
+        accept = self._eligible(now_ts, held)
+        best, best_heap = None, None
+        for heap in self._serving_by_weight.values():
+            scanned: List[Entry] = []
+            candidate = self._scan(heap, accept, scanned)
+            chosen = scanned.pop() if candidate is not None else None
+            heap.restore(scanned)
+            if chosen is None:
+                continue
+            if best is None or self._current(candidate, now_ts) > self._current(best[2], now_ts):
+                if best is not None:
+                    best_heap.restore([best])
+                best, best_heap = chosen, heap
+            else:
+                heap.restore([chosen])
+        if best is None:
+            if held[0]:
+                self.counters["heldByQuantum"] += 1
+            return None
+        # 选中者留在 popped 中（暂时移出堆），同一轮不会再被选中
+        popped.append((best_heap, best))
+        return best[2]
+
+    def _should_swap(self, challenger: RoomRequest, victim: RoomRequest, now_ts: float) -> bool:
+        # 服务者比挑战者多出自己的一个加权时间片才换下：高风速房间每次持有服务位更久
+        margin = self._time_slice() / self._weight(victim)
+        return self._current(victim, now_ts) - self._current(challenger, now_ts) >= margin
+
+
+POLICIES = {policy.name: policy for policy in (PriorityPolicy, AgingPolicy, WeightedFairPolicy)}
+
+
+def create_policy(name: Optional[str], tariff_service, counters: Dict[str, int]) -> SchedulingPolicy:
+    policy_class = POLICIES.get((name or PriorityPolicy.name).lower())
+    if policy_class is None:
+        raise ValueError(f"未知的调度策略: {name}，可选: {', '.join(POLICIES)}")
+    return policy_class(tariff_service, counters)
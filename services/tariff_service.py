@@ -0,0 +1,200 @@
+"""
+空调计费/调度配置缓存
+启动时从 ACConfig 表 + Config 一次性加载为不可变的 Tariff 对象，
+调度热路径只读取该对象，不再每次查 current_app.config 或解析字符串。
+温控范围与默认目标温度始终取自 Config（COOLING_MIN_TEMP 等）；
+ACConfig 行只覆盖计费单价、各风速变温速率与默认风速，缺失时同样回退到 Config。
+reload() 重新加载后整体替换引用（原子切换），修改费率无需重启。
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from flask import current_app
+
+from ..models import ACConfig
+from ..utils.log import get_logger
+
+log = get_logger("TariffService")
+
+# ACConfig.default_speed 存储的是单字母缩写
+_SPEED_ABBR = {"L": "LOW", "M": "MEDIUM", "H": "HIGH"}
+
+
+@dataclass(frozen=True)
+class ModeTariff:
+    """单个模式（制冷/制热）的温控范围与费率"""
+
+    mode: str
+    min_temp: float
+    max_temp: float
+    default_target: float
+    price_per_degree: float  # 计费单价：元/℃
+    low_speed_rate: float  # 变温速率：℃/分钟
+    mid_speed_rate: float
+    high_speed_rate: float
+    default_speed: str
+
+    def speed_rate(self, fan_speed: Optional[str]) -> float:
+        speed = (fan_speed or "MEDIUM").upper()
+        if speed == "HIGH":
+            return self.high_speed_rate
+        if speed == "LOW":
+            return self.low_speed_rate
+        return self.mid_speed_rate
+
+    def accepts(self, target_temp: float) -> bool:
+        return self.min_temp <= target_temp <= self.max_temp
+
+
+@dataclass(frozen=True)
+class Tariff:
+    """调度器使用的全部配置快照（不可变）"""
+
+    version: int
+    capacity: int
+    time_slice: int
+    enable_cycle_fee: bool
+    time_factor: float
+    rewarm_rate: float
+    # 命令合并窗口（逻辑秒）：同一房间同类命令在窗口内连续到达时只保留最后一次的结算
+    coalesce_window: float
+    # 抗抖动：服务不足该逻辑秒数的房间不会被抢占/轮转；每轮调度最多换入换出次数（0 不限）；
+    # 是否只在时间片边界上集中轮转
+    min_service_quantum: float
+    max_swaps_per_tick: int
+    batched_rotation: bool
+    # 调度策略名（见 scheduling_policy.POLICIES）与 aging 策略每升一档所需的等待秒数（0 表示一个时间片）
+    policy: str
+    aging_seconds: float
+    cooling: ModeTariff
+    heating: ModeTariff
+
+    def for_mode(self, mode: Optional[str]) -> ModeTariff:
+        if (mode or "COOLING").upper() == "HEATING":
+            return self.heating
+        return self.cooling
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _positive_int(value, default: int) -> int:
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _positive_float(value, default: float) -> float:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def _non_negative_float(value, default: float) -> float:
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _policy_name(value) -> str:
+    from .scheduling_policy import POLICIES, PriorityPolicy
+
+    name = (value or PriorityPolicy.name).strip().lower()
+    if name not in POLICIES:
+        log.warning("未知的调度策略 %r，使用 %s", value, PriorityPolicy.name)
+        return PriorityPolicy.name
+    return name
+
+
+def _mode_from_config(mode: str, config) -> ModeTariff:
+    prefix = "HEATING" if mode == "HEATING" else "COOLING"
+    fallback_target = 23.0 if mode == "HEATING" else 25.0
+    return ModeTariff(
+        mode=mode,
+        min_temp=float(config.get(f"{prefix}_MIN_TEMP", 18.0)),
+        max_temp=float(config.get(f"{prefix}_MAX_TEMP", 25.0 if mode == "HEATING" else 28.0)),
+        default_target=float(config.get(f"{prefix}_DEFAULT_TARGET", fallback_target)),
+        price_per_degree=1.0,
+        low_speed_rate=float(config.get("BILLING_AC_RATE_LOW", 1.0 / 3.0)),
+        mid_speed_rate=float(config.get("BILLING_AC_RATE_MEDIUM", 0.5)),
+        high_speed_rate=float(config.get("BILLING_AC_RATE_HIGH", 1.0)),
+        default_speed="MEDIUM",
+    )
+
+
+def _mode_from_row(row: ACConfig, base: ModeTariff) -> ModeTariff:
+    """在 Config 给出的温控范围上叠加 ACConfig 的费率（ac_config 中的温度列不参与）"""
+    return ModeTariff(
+        mode=base.mode,
+        min_temp=base.min_temp,
+        max_temp=base.max_temp,
+        default_target=base.default_target,
+        price_per_degree=float(row.rate),
+        low_speed_rate=float(row.low_speed_rate),
+        mid_speed_rate=float(row.mid_speed_rate),
+        high_speed_rate=float(row.high_speed_rate),
+        default_speed=_SPEED_ABBR.get((row.default_speed or "M").upper(), "MEDIUM"),
+    )
+
+
+class TariffService:
+    def __init__(self):
+        self._tariff: Optional[Tariff] = None
+        self._version = 0
+        self._reload_lock = threading.Lock()
+
+    @property
+    def current(self) -> Tariff:
+        """热路径读取入口：未加载时按需加载一次"""
+        tariff = self._tariff
+        if tariff is None:
+            tariff = self.reload()
+        return tariff
+
+    def reload(self) -> Tariff:
+        """从 ACConfig + Config 重新加载，并原子替换当前快照"""
+        with self._reload_lock:
+            tariff = self._load(current_app.config)
+            self._tariff = tariff
+            return tariff
+
+    def _load(self, config) -> Tariff:
+        modes = {
+            "COOLING": _mode_from_config("COOLING", config),
+            "HEATING": _mode_from_config("HEATING", config),
+        }
+        try:
+            for row in ACConfig.query.all():
+                mode = (row.mode or "").upper()
+                if mode in modes:
+                    modes[mode] = _mode_from_row(row, modes[mode])
+        except Exception as e:
+            # 表不存在或数据库不可用时退回 Config 默认值，不阻塞启动
+            from ..extensions import db
+            db.session.rollback()
+            log.warning("读取 ac_config 失败，使用 Config 默认值: %s", e)
+
+        self._version += 1
+        return Tariff(
+            version=self._version,
+            capacity=_positive_int(config.get("HOTEL_AC_TOTAL_COUNT", 3), 3),
+            time_slice=_positive_int(config.get("HOTEL_TIME_SLICE", 120), 120),
+            enable_cycle_fee=bool(config.get("ENABLE_AC_CYCLE_DAILY_FEE", False)),
+            time_factor=_positive_float(config.get("TIME_ACCELERATION_FACTOR", 1.0), 1.0),
+            rewarm_rate=_positive_float(config.get("HOTEL_REWARM_RATE", 0.5), 0.5),
+            coalesce_window=_non_negative_float(config.get("HOTEL_COMMAND_COALESCE_MS", 300), 300.0) / 1000.0,
+            min_service_quantum=_non_negative_float(config.get("HOTEL_MIN_SERVICE_QUANTUM", 0), 0.0),
+            max_swaps_per_tick=int(_non_negative_float(config.get("HOTEL_MAX_SWAPS_PER_TICK", 0), 0.0)),
+            batched_rotation=bool(config.get("HOTEL_ROTATION_BATCHED", False)),
+            policy=_policy_name(config.get("HOTEL_SCHEDULING_POLICY")),
+            aging_seconds=_non_negative_float(config.get("HOTEL_POLICY_AGING_SECONDS", 0), 0.0),
+            cooling=modes["COOLING"],
+            heating=modes["HEATING"],
+        )
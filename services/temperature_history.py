@@ -0,0 +1,173 @@
+"""
+房间温度历史
+rooms 表只保存当前温度，监控页要画温度曲线只能反复拉取全量状态再在前端拼接。
+这里由温度 tick 为每个开机房间写入一个定长环形缓冲区：
+- 时间戳用 array('d')、温度用 array('f')（单精度足够显示 0.1℃），每个采样 12 字节，
+  300 间房 × 240 个采样约 0.8 MB
+- 按 interval 逻辑秒对齐降采样：同一区间内只保留第一个 tick 的温度
+- 可选的分钟级汇总（最低/最高/平均温度）在每个 tick 末尾批量写入 temperature_rollups 表，重启后仍可查询
+
+缓冲区只存在于运行温度 tick 的进程（standalone / leader）中，worker 通过 IPC 读取。
+"""
+from __future__ import annotations
+
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models import TemperatureRollup
+from ..utils.time_master import from_ts
+
+
+class _Ring:
+    __slots__ = ("timestamps", "temps", "head", "size", "bucket")
+
+    def __init__(self, capacity: int):
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.temps = array("f", bytes(4 * capacity))
+        self.head = 0  # 下一个写入位置
+        self.size = 0
+        self.bucket: Optional[int] = None  # 最近一次采样所在的降采样区间
+
+    def append(self, ts: float, temp: float) -> None:
+        self.timestamps[self.head] = ts
+        self.temps[self.head] = temp
+        self.head = (self.head + 1) % len(self.temps)
+        self.size = min(self.size + 1, len(self.temps))
+
+    def items(self, since: Optional[float]) -> Tuple[List[float], List[float]]:
+        """按时间先后取出全部采样（仅返回时间戳大于 since 的部分）"""
+        capacity = len(self.temps)
+        start = (self.head - self.size) % capacity
+        timestamps, temps = [], []
+        for offset in range(self.size):
+            index = (start + offset) % capacity
+            ts = self.timestamps[index]
+            if since is not None and ts <= since:
+                continue
+            timestamps.append(ts)
+            temps.append(round(self.temps[index], 2))
+        return timestamps, temps
+
+
+class TemperatureHistory:
+    def __init__(self):
+        self.size = 240
+        self.interval = 30.0
+        self.rollup_enabled = False
+        self._rings: Dict[int, _Ring] = {}
+        # 房间 -> 当前分钟的汇总 [分钟序号, 最低, 最高, 累加, 采样数]
+        self._minutes: Dict[int, list] = {}
+        # 已结束、待写库的分钟汇总
+        self._pending: List[dict] = []
+        self._lock = threading.Lock()
+
+    def configure(self, size: int = 240, interval: float = 30.0, rollup_enabled: bool = False) -> None:
+        with self._lock:
+            self.size = max(1, int(size))
+            self.interval = max(0.0, float(interval))
+            self.rollup_enabled = bool(rollup_enabled)
+            self._rings.clear()
+            self._minutes.clear()
+            self._pending.clear()
+
+    # --- 写入（温度 tick） ---
+
+    def record(self, room_id: int, ts: float, temp: Optional[float]) -> None:
+        if temp is None:
+            return
+        temp = float(temp)
+        with self._lock:
+            ring = self._rings.get(room_id)
+            if ring is None:
+                ring = self._rings[room_id] = _Ring(self.size)
+            bucket = int(ts // self.interval) if self.interval > 0 else None
+            if bucket is None or bucket != ring.bucket:
+                ring.bucket = bucket
+                ring.append(ts, temp)
+            if self.rollup_enabled:
+                self._accumulate(room_id, ts, temp)
+
+    def _accumulate(self, room_id: int, ts: float, temp: float) -> None:
+        minute = int(ts // 60)
+        current = self._minutes.get(room_id)
+        if current is not None and current[0] != minute:
+            self._pending.append(self._rollup_values(room_id, current))
+            current = None
+        if current is None:
+            self._minutes[room_id] = [minute, temp, temp, temp, 1]
+            return
+        current[1] = min(current[1], temp)
+        current[2] = max(current[2], temp)
+        current[3] += temp
+        current[4] += 1
+
+    @staticmethod
+    def _rollup_values(room_id: int, current: list) -> dict:
+        minute, low, high, total, count = current
+        return {
+            "room_id": room_id,
+            "minute": from_ts(minute * 60.0),
+            "min_temp": low,
+            "max_temp": high,
+            "avg_temp": total / count,
+            "samples": count,
+        }
+
+    def flushRollups(self, now_ts: float) -> int:
+        """把已结束的分钟汇总一次写入数据库（一条多行 INSERT），返回写入行数"""
+        minute = int(now_ts // 60)
+        with self._lock:
+            # 关机等原因不再有 tick 的房间，其最后一分钟也在这里结束
+            for room_id, current in list(self._minutes.items()):
+                if current[0] < minute:
+                    self._pending.append(self._rollup_values(room_id, current))
+                    del self._minutes[room_id]
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        table = TemperatureRollup.__table__
+        try:
+            db.session.execute(table.insert(), rows)
+            db.session.commit()
+            return len(rows)
+        except IntegrityError:
+            # 重启后同一分钟可能已写入过：逐行写入并跳过已存在的分钟
+            db.session.rollback()
+        written = 0
+        for values in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(**values))
+                written += 1
+            except IntegrityError:
+                pass
+        db.session.commit()
+        return written
+
+    # --- 查询 ---
+
+    def history(self, room_id: int, since: Optional[float] = None) -> dict:
+        with self._lock:
+            ring = self._rings.get(room_id)
+            timestamps, temps = ring.items(since) if ring is not None else ([], [])
+        return {
+            "roomId": room_id,
+            "interval": self.interval,
+            "capacity": self.size,
+            "timestamps": timestamps,
+            "temps": temps,
+        }
+
+    def rollups(self, room_id: int, limit: int = 60) -> List[dict]:
+        """最近 limit 分钟的汇总（按时间先后）"""
+        rows = (
+            TemperatureRollup.query.filter_by(room_id=room_id)
+            .order_by(TemperatureRollup.minute.desc())
+            .limit(max(1, int(limit)))
+            .all()
+        )
+        return [row.to_dict() for row in reversed(rows)]
@@ -9,9 +9,13 @@ import time
 from datetime import datetime
 
 from flask import current_app
-from ..extensions import db
+from ..extensions import db, use_bind
+from ..utils.db_pool import BACKGROUND_BIND
+from ..utils.log import get_logger
 from ..utils.time_master import clock
 
+log = get_logger("TemperatureScheduler")
+
 
 class TemperatureScheduler:
     """温度自动更新调度器"""
@@ -21,6 +25,8 @@ class TemperatureScheduler:
         self.running = False
         self.thread = None
         self.update_interval = 1.0  # 每1秒更新一次，确保稳定的时间间隔
+        # 后台线程的每个 tick 与 advance() 都持有此锁，二者不会同时推进温度
+        self._advance_lock = threading.Lock()
         
     def start(self, app):
         """启动后台任务"""
@@ -28,61 +34,86 @@ class TemperatureScheduler:
             return
         
         self.running = True
-        
-        # === 核心修复 1: 动态开启连接池的 Pre-Ping 功能 ===
-        # 这能有效防止 "Packet sequence number wrong" 错误。
-        # 它会在每次获取连接前检查连接活性，如果连接坏了（Packet wrong），
-        # 它可以自动丢弃坏连接并重连，而不是抛出错误给应用层。
-        with app.app_context():
-            try:
-                if db.engine.pool:
-                    # 这是一个 SQLAlchemy 的隐藏开关，通常在 config 中设置
-                    # 这里为了修复现有运行环境，动态开启
-                    db.engine.pool._pre_ping = True
-            except Exception:
-                pass
+        # 连接池的 pre_ping / recycle 已在 Config.SQLALCHEMY_ENGINE_OPTIONS 中配置
         
         def run():
+            # 后台线程使用独立的 "background" 连接池，不与请求线程抢连接
+            use_bind(BACKGROUND_BIND)
             while self.running:
                 try:
-                    with app.app_context():
-                        try:
-                            self.scheduler.simulateTemperatureUpdate()
-                        except Exception as inner_e:
-                            # 业务逻辑报错，尝试回滚
-                            try:
-                                db.session.rollback()
-                            except Exception:
-                                pass 
-                            # 只有真正的逻辑错误才打印，忽略连接层的噪音
-                            if "Packet sequence" not in str(inner_e):
-                                print(f"[TemperatureScheduler] 逻辑错误: {inner_e}")
-                        finally:
-                            # === 核心修复 2: 彻底静默的清理 ===
-                            # 无论连接状态如何，强制尝试归还
-                            try:
-                                db.session.remove()
-                            except Exception:
-                                # 如果这里报错 (如 InterfaceError)，说明连接已经彻底断了
-                                # SQLAlchemy 内部已经将其标记为 invalidate，
-                                # 我们直接忽略异常，防止日志刷屏
-                                pass
-                            
+                    # 与 advance() 互斥：持锁后再判断虚拟时钟模式，避免判断之后刚好切换到虚拟时钟
+                    # （虚拟时钟模式下时间只随 advance() 前进，tick 由 advance() 同步执行）
+                    with self._advance_lock:
+                        if not clock.manual:
+                            self._tick(app)
                 except Exception as e:
                     # 外层捕获，防止线程退出
                     if "Packet sequence" not in str(e):
-                        print(f"[TemperatureScheduler] 线程循环错误: {e}")
+                        log.error("线程循环错误: %s", e)
                 
                 time.sleep(self.update_interval)
         
         self.thread = threading.Thread(target=run, daemon=True)
         self.thread.start()
-        print(f"[TemperatureScheduler] 已启动 (Pre-Ping Enabled)，更新间隔: {self.update_interval}秒")
+        log.info("已启动，更新间隔: %s秒", self.update_interval)
     
+    def _tick(self, app) -> None:
+        with app.app_context():
+            try:
+                self.scheduler.simulateTemperatureUpdate()
+            except Exception as inner_e:
+                # 业务逻辑报错，尝试回滚
+                try:
+                    db.session.rollback()
+                except Exception:
+                    pass 
+                # 只有真正的逻辑错误才打印，忽略连接层的噪音
+                if "Packet sequence" not in str(inner_e):
+                    log.error("逻辑错误: %s", inner_e, exc_info=True)
+            finally:
+                # === 彻底静默的清理 ===
+                # 无论连接状态如何，强制尝试归还
+                try:
+                    db.session.remove()
+                except Exception:
+                    # 如果这里报错 (如 InterfaceError)，说明连接已经彻底断了
+                    # SQLAlchemy 内部已经将其标记为 invalidate，
+                    # 我们直接忽略异常，防止日志刷屏
+                    pass
+
+    def advance(self, seconds: float, step: float | None = None) -> dict:
+        """
+        虚拟时钟模式下推进逻辑时间，并同步执行期间所有到期的 tick（需在应用上下文中调用）。
+        step 为每个 tick 的逻辑秒数，默认与实时模式相同：update_interval * 当前倍速。
+        同样的操作序列 + 同样的起点 => 完全相同的温度与计费结果。
+        worker 进程的时钟跟随 leader，推进与 tick 都转发给 leader 执行。
+        """
+        if clock.remote is not None:
+            return clock.remote.advanceTime(seconds, step)
+        if not clock.manual:
+            raise RuntimeError("仅虚拟时钟模式可用，请先开启 /test/time/manual")
+        seconds = float(seconds)
+        if seconds < 0:
+            raise ValueError("seconds 不能为负数")
+        step = float(step) if step else self.update_interval * clock.speed
+        # _updateRoomTemperature 单次 tick 最多结算 1 逻辑分钟
+        step = min(max(step, 0.001), 60.0)
+
+        ticks = 0
+        with self._advance_lock:
+            remaining = seconds
+            while remaining > 1e-9:
+                delta = min(step, remaining)
+                clock.advance(delta)
+                self.scheduler.simulateTemperatureUpdate()
+                remaining -= delta
+                ticks += 1
+        return {"ticks": ticks, "step": step, "logical_time": clock.now().isoformat()}
+
     def stop(self):
         """停止后台任务"""
         self.running = False
         if self.thread:
             self.thread.join(timeout=2.0)
-        print("[TemperatureScheduler] 已停止")
+        log.info("已停止")
 
@@ -0,0 +1,322 @@
+"""
+控制流量录制与回放
+出现计费争议或调度异常时，需要原样复现当天的操作序列，而不是凭日志猜测：
+- 录制: ac / admin / hotel（及 test）蓝图的每个控制命令（POST）按逻辑时间追加写入 traffic_<pid>.jsonl，
+        每行携带逻辑时间戳、请求路径、请求体、状态码与返回结果；文件首行记录房间初始状态与关键配置
+- 回放: 在独立的 SQLite 内存库 + 虚拟时钟中按原时间间隔重新执行这些命令，
+        命令之间同步推进温度 tick，最后逐条比对返回结果，并对账单（退房结果）做差异报告
+
+多个进程的录制文件只有在时间戳可比时才能合并：头部 clock 为 "leader" 表示该进程的逻辑时钟跟随调度主进程，
+各文件的时间戳处于同一条时间线；否则（单进程或各自计时）拒绝合并。
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from ..utils.log import get_logger
+from ..utils.time_master import clock, from_ts
+
+log = get_logger("TrafficRecorder")
+
+TRAFFIC_FILE_PATTERN = "traffic_*.jsonl"
+# 需要录制的蓝图：房客控制、管理员控制、前台入住/退房，以及测试接口中改写房间状态的命令
+RECORDED_BLUEPRINTS = frozenset({"ac", "admin", "hotel", "test"})
+# 时钟控制命令不录制：它们的效果已体现在每条命令的逻辑时间戳中
+SKIPPED_PATH_PREFIXES = ("/test/time/",)
+RECORDED_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+# 计费比对的数值容差（元）
+BILL_TOLERANCE = 0.01
+# 同一文件内时间戳回退超过该逻辑秒数才视为录制期间的时钟回拨（并发请求完成顺序不同造成的小幅乱序不算）
+JUMP_TOLERANCE = 1.0
+# 头部记录的配置项，回放时原样套用
+_HEADER_CONFIG_KEYS = (
+    "HOTEL_ROOM_COUNT",
+    "HOTEL_DEFAULT_TEMP",
+    "HOTEL_AC_TOTAL_COUNT",
+    "HOTEL_TIME_SLICE",
+    "HOTEL_REWARM_RATE",
+)
+
+
+class TrafficRecorder:
+    def __init__(self):
+        self.path: Optional[Path] = None
+        self._fh = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._fh is not None
+
+    def open(self, directory: str, config) -> None:
+        """打开本进程的录制文件并写入头部（需在应用上下文中调用）"""
+        from ..models import Room
+
+        self.close()
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        # 多个 WSGI 工作进程各写各的文件，回放时按（主进程的）逻辑时间戳合并
+        self.path = directory / f"traffic_{os.getpid()}.jsonl"
+        self._fh = open(self.path, "a", encoding="utf-8")
+        rooms = Room.query.order_by(Room.id).all()
+        self._write({
+            "type": "start",
+            "pid": os.getpid(),
+            # 跟随调度主进程时钟的 worker 与主进程共用时间线，其录制文件可以按时间戳合并
+            "clock": "leader" if clock.remote is not None or config.get("SCHEDULER_ROLE") == "leader" else "local",
+            "ts": clock.now_ts(),
+            "t": clock.now().isoformat(),
+            "speed": clock.speed,
+            "config": {key: config.get(key) for key in _HEADER_CONFIG_KEYS},
+            "rooms": [
+                {
+                    "id": room.id,
+                    "currentTemp": room.current_temp,
+                    "defaultTemp": room.default_temp,
+                    "dailyRate": room.daily_rate,
+                }
+                for room in rooms
+            ],
+        })
+        log.info("控制命令录制到 %s", self.path)
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def record(self, ts: float, method: str, path: str, body, status: int, result) -> None:
+        if self._fh is None:
+            return
+        self._write({
+            "type": "cmd",
+            "ts": ts,
+            "t": from_ts(ts).isoformat(),
+            "method": method,
+            "path": path,
+            "body": body,
+            "status": status,
+            "result": result,
+        })
+
+    def _write(self, line: dict) -> None:
+        data = json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._fh is not None:
+                self._fh.write(data)
+                self._fh.flush()
+
+    def install(self, app) -> None:
+        """在 app 上挂 before/after_request 钩子，只录制 RECORDED_BLUEPRINTS 中的写操作"""
+        from flask import g, request
+
+        def should_record() -> bool:
+            return (
+                self.enabled
+                and request.blueprint in RECORDED_BLUEPRINTS
+                and request.method in RECORDED_METHODS
+                and not request.path.startswith(SKIPPED_PATH_PREFIXES)
+            )
+
+        @app.before_request
+        def _traffic_mark_start():
+            if should_record():
+                # 以命令到达时的逻辑时间为准，回放时据此还原命令之间的时间间隔
+                g.traffic_ts = clock.now_ts()
+                g.traffic_body = request.get_json(silent=True)
+
+        @app.after_request
+        def _traffic_record(response):
+            ts = g.pop("traffic_ts", None)
+            if ts is not None:
+                try:
+                    self.record(
+                        ts,
+                        request.method,
+                        request.full_path.rstrip("?"),
+                        g.pop("traffic_body", None),
+                        response.status_code,
+                        response.get_json(silent=True),
+                    )
+                except Exception as e:
+                    # 录制失败不能影响业务请求
+                    log.warning("写入失败: %s", e)
+            return response
+
+
+def _split_at_jumps(commands: List[dict]) -> List[List[dict]]:
+    """按文件内顺序在时钟回拨处切段，每段内按时间戳稳定排序"""
+    segments: List[List[dict]] = []
+    latest = None
+    for item in commands:
+        if latest is None or item["ts"] < latest - JUMP_TOLERANCE:
+            segments.append([])
+            latest = item["ts"]
+        segments[-1].append(item)
+        latest = max(latest, item["ts"])
+    for segment in segments:
+        segment.sort(key=lambda item: item["ts"])
+    return segments
+
+
+def load_traffic(paths: Iterable[str]) -> Tuple[Optional[dict], List[dict]]:
+    """
+    读取一个或多个录制文件（可传目录），返回 (最早的头部, 按回放顺序排列的命令列表)。
+    单个文件保留录制期间的时钟回拨（回拨前后分段回放）；多个进程的文件只有头部 clock 均为 "leader"
+    （时间戳来自同一个主进程时钟）且不含回拨时才按时间戳合并，否则抛出 ValueError。
+    """
+    files: List[Path] = []
+    for raw in paths:
+        path = Path(raw)
+        files.extend(sorted(path.glob(TRAFFIC_FILE_PATTERN)) if path.is_dir() else [path])
+
+    header = None
+    sources = []
+    for file in files:
+        headers, commands = [], []
+        with open(file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    # 进程中断时最后一行可能只写了一半
+                    break
+                if item.get("type") == "start":
+                    headers.append(item)
+                    if header is None or item["ts"] < header["ts"]:
+                        header = item
+                elif item.get("type") == "cmd":
+                    commands.append(item)
+        if headers or commands:
+            sources.append((file, headers, _split_at_jumps(commands)))
+
+    if len(sources) == 1:
+        return header, [item for segment in sources[0][2] for item in segment]
+
+    for file, headers, segments in sources:
+        if not headers or any(item.get("clock") != "leader" for item in headers):
+            raise ValueError(f"{file.name} 的时间戳来自进程自身的逻辑时钟，不能与其他进程的录制文件合并，请分别回放")
+        if len(segments) > 1:
+            raise ValueError(f"{file.name} 录制期间时钟被回拨，无法与其他进程的录制文件按时间戳合并，请分别回放")
+    # 稳定排序：同一时刻的命令保持文件内原有顺序
+    commands = [item for _, _, segments in sources for segment in segments for item in segment]
+    commands.sort(key=lambda item: item["ts"])
+    return header, commands
+
+
+def _bill_summary(result) -> Optional[dict]:
+    """从退房返回结果中提取账单关键数值"""
+    if not isinstance(result, dict) or not isinstance(result.get("bill"), dict):
+        return None
+    bill = result["bill"]
+    details = result.get("detailBill") or []
+    return {
+        "roomFee": float(bill.get("roomFee") or 0.0),
+        "acFee": float(bill.get("acFee") or 0.0),
+        "details": len(details),
+        "detailFee": round(sum(float(d.get("fee") or 0.0) for d in details), 2),
+    }
+
+
+def _result_text(result):
+    if isinstance(result, dict):
+        return result.get("message") or result.get("error")
+    return None
+
+
+def replay_traffic(paths: Iterable[str], step: Optional[float] = None, speed: Optional[float] = None) -> dict:
+    """
+    离线回放录制的控制命令并与原始结果比对。
+    回放使用独立的 SQLite 内存库和虚拟时钟，不会触碰生产数据库；
+    speed 覆盖录制时的时钟倍速（默认沿用），step 为每个温度 tick 的逻辑秒数（默认 1秒 × 倍速），
+    step 越大回放越快、温度/计费的时间粒度越粗。
+    """
+    from .. import create_app
+    from ..config import SQLiteConfig
+    from ..extensions import db
+    from ..models import Room
+    from ..services import temperature_scheduler
+
+    header, commands = load_traffic(paths)
+    if header is None and not commands:
+        raise ValueError("录制文件为空")
+
+    overrides = {
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "TRAFFIC_RECORD_ENABLED": False,
+        "SCHEDULER_JOURNAL_ENABLED": False,
+        "TEMPERATURE_SCHEDULER_ENABLED": False,
+        "SCHEDULER_ROLE": "standalone",
+        "TIME_ACCELERATION_FACTOR": speed or (header or {}).get("speed") or SQLiteConfig.TIME_ACCELERATION_FACTOR,
+    }
+    for key, value in ((header or {}).get("config") or {}).items():
+        if value is not None:
+            overrides[key] = value
+    replay_config = type("ReplayConfig", (SQLiteConfig,), overrides)
+
+    app = create_app(replay_config, start_background=False)
+    client = app.test_client()
+    report = {"commands": len(commands), "mismatches": [], "bills": []}
+
+    with app.app_context():
+        # 还原录制开始时的房间温度与房价
+        for snapshot in (header or {}).get("rooms", []):
+            room = db.session.get(Room, snapshot["id"])
+            if room is None:
+                continue
+            room.current_temp = snapshot.get("currentTemp")
+            room.default_temp = snapshot.get("defaultTemp")
+            room.daily_rate = snapshot.get("dailyRate")
+        db.session.commit()
+
+        # 从头部与第一条命令中较早的时刻开始，保证第一条命令之前的温度变化也被回放
+        candidates = ([header["ts"]] if header else []) + [c["ts"] for c in commands[:1]]
+        start_ts = min(candidates)
+        clock.set_manual(True, from_ts(start_ts))
+        try:
+            for index, command in enumerate(commands):
+                gap = command["ts"] - clock.now_ts()
+                if gap > 0:
+                    temperature_scheduler.advance(gap, step)
+                elif gap < -JUMP_TOLERANCE:
+                    # 录制期间时钟被回拨（/test/time/jump 等，load_traffic 已按回拨分段），回放同样跳转；
+                    # 更小的负间隔只是同一时刻的并发命令，不调整时钟
+                    clock.jump_to(from_ts(command["ts"]))
+                response = client.open(command["path"], method=command["method"], json=command.get("body"))
+                replayed = response.get_json(silent=True)
+                _compare(report, index, command, response.status_code, replayed)
+        finally:
+            clock.set_manual(False)
+
+    report["matched"] = not report["mismatches"] and all(b["matched"] for b in report["bills"])
+    return report
+
+
+def _compare(report: dict, index: int, command: dict, status: int, replayed) -> None:
+    where = {"index": index, "t": command["t"], "method": command["method"], "path": command["path"]}
+    if status != command["status"]:
+        report["mismatches"].append({**where, "field": "status", "recorded": command["status"], "replayed": status})
+    recorded_bill = _bill_summary(command.get("result"))
+    if recorded_bill is not None:
+        replayed_bill = _bill_summary(replayed) or {}
+        diff = {
+            key: {"recorded": value, "replayed": replayed_bill.get(key)}
+            for key, value in recorded_bill.items()
+            if replayed_bill.get(key) is None or abs(replayed_bill[key] - value) > BILL_TOLERANCE
+        }
+        report["bills"].append({
+            **where,
+            "roomId": (command["result"]["bill"] or {}).get("roomId"),
+            "recorded": recorded_bill,
+            "replayed": replayed_bill or None,
+            "matched": not diff,
+            "diff": diff,
+        })
+        return
+    recorded_text, replayed_text = _result_text(command.get("result")), _result_text(replayed)
+    if recorded_text != replayed_text:
+        report["mismatches"].append({**where, "field": "result", "recorded": recorded_text, "replayed": replayed_text})
@@ -0,0 +1,174 @@
+"""
+房间调度状态迁移日志
+服务 → 等待、到温暂停、回温唤醒、被抢占等迁移原本只体现在 `[Schedule] ...` 的 print 输出中，无法长期分析。
+这里把每次迁移记为 state_transitions 表中的一行（房间、迁移前后状态、原因、风速、逻辑时间）：
+- 调度器持有队列锁时只把记录追加到内存缓冲区，不做任何 I/O
+- 后台线程每 flush_interval 秒（或积压达到 batch_size 条时）取出缓冲区，用多行 INSERT 批量写入
+- 缓冲区达到 max_pending 条（数据库长时间不可用）时丢弃新到的记录并计数，不阻塞调度；
+  已缓冲的记录（包括写入失败待重试的批次）保持原有顺序，入库的历史始终是连续的前缀
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+
+from ..extensions import db, use_bind
+from ..models import StateTransition
+from ..utils.db_pool import BACKGROUND_BIND
+from ..utils.log import get_logger
+from ..utils.time_master import from_ts
+
+log = get_logger("TransitionJournal")
+
+
+class TransitionJournal:
+    def __init__(self):
+        self.batch_size = 200
+        self.flush_interval = 1.0
+        self.max_pending = 10000
+        self.running = False
+        self.thread = None
+        self._app = None
+        self._pending: deque = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.running
+
+    def start(self, app, batch_size: int = 200, flush_interval: float = 1.0, max_pending: int = 10000) -> None:
+        if self.running:
+            return
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.05, float(flush_interval))
+        self.max_pending = max(self.batch_size, int(max_pending))
+        self._app = app
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        log.info("已启动，每 %s 秒或 %s 条批量写入", self.flush_interval, self.batch_size)
+
+    def stop(self) -> None:
+        """停止后台线程，并把缓冲区中剩余的记录写完"""
+        if not self.running:
+            return
+        self.running = False
+        self._wake.set()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        try:
+            with self._app.app_context():
+                self.flush()
+        except Exception as e:
+            log.warning("退出前写入失败: %s", e, extra={"pending": len(self._pending)})
+        log.info("已停止，共写入 %s 条，丢弃 %s 条", self.written, self.dropped,
+                 extra={"written": self.written, "dropped": self.dropped})
+
+    # --- 写入 ---
+
+    def record(
+        self,
+        room_id: int,
+        from_state: str,
+        to_state: str,
+        reason: str,
+        fan_speed: Optional[str],
+        now_ts: float,
+    ) -> None:
+        """追加一条迁移记录（调度器持锁时调用，只操作内存）"""
+        if not self.running:
+            return
+        row = {
+            "room_id": room_id,
+            "from_state": from_state,
+            "to_state": to_state,
+            "reason": reason,
+            "fan_speed": fan_speed,
+            "logical_time": from_ts(now_ts),
+        }
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self) -> None:
+        # 与温度 tick 一样使用独立的后台连接池
+        use_bind(BACKGROUND_BIND)
+        while self.running:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    try:
+                        self.flush()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                log.warning("写入失败: %s", e, extra={"pending": len(self._pending), "dropped": self.dropped})
+
+    def flush(self) -> int:
+        """把缓冲区中的记录按 batch_size 分批写入，返回写入条数（需在应用上下文中调用）"""
+        written = 0
+        while True:
+            with self._lock:
+                if not self._pending:
+                    break
+                count = min(self.batch_size, len(self._pending))
+                rows = [self._pending.popleft() for _ in range(count)]
+            try:
+                db.session.execute(StateTransition.__table__.insert(), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # 先裁剪再放回缓冲区头部，下一轮按原顺序重试：超出 max_pending 的部分
+                # 与 record() 一样丢弃最新的记录（写入期间新到的记录，必要时再到本批次末尾）
+                with self._lock:
+                    excess = len(self._pending) + len(rows) - self.max_pending
+                    while excess > 0 and self._pending:
+                        self._pending.pop()
+                        self.dropped += 1
+                        excess -= 1
+                    if excess > 0:
+                        del rows[-excess:]
+                        self.dropped += excess
+                    self._pending.extendleft(reversed(rows))
+                raise
+            written += len(rows)
+        self.written += written
+        return written
+
+    # --- 查询 ---
+
+    def query(
+        self,
+        room_id: Optional[int] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: int = 500,
+    ) -> List[dict]:
+        """按房间与逻辑时间范围查询（走 (room_id, logical_time) / logical_time 索引），按时间先后返回"""
+        query = StateTransition.query
+        if room_id is not None:
+            query = query.filter(StateTransition.room_id == room_id)
+        if start is not None:
+            query = query.filter(StateTransition.logical_time >= start)
+        if end is not None:
+            query = query.filter(StateTransition.logical_time < end)
+        rows = query.order_by(StateTransition.logical_time, StateTransition.id).limit(max(1, int(limit))).all()
+        return [row.to_dict() for row in rows]
+
+    def status(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {"enabled": self.running, "pending": pending, "written": self.written, "dropped": self.dropped}
@@ -0,0 +1,166 @@
+# hotel/utils/db_pool.py
+"""
+数据库连接池配置与监控
+- TimedQueuePool: 记录每次从连接池取连接的耗时（池耗尽时请求会在此阻塞）
+- apply_engine_options: 根据数据库类型补全 SQLALCHEMY_ENGINE_OPTIONS，并为后台线程配置独立连接池
+- configure_sqlite_engines: 为 SQLite 连接设置 PRAGMA（WAL、busy_timeout）
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+BACKGROUND_BIND = "background"
+
+# 仅 QueuePool 支持的参数，内存 SQLite（StaticPool）需要去掉
+_QUEUE_POOL_ONLY = ("pool_size", "max_overflow", "pool_timeout", "poolclass")
+
+
+class PoolStats:
+    """连接获取等待时间统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, waited: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += waited
+            if waited > self.max_wait:
+                self.max_wait = waited
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            avg = self.total_wait / self.checkouts if self.checkouts else 0.0
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avgWaitMs": round(avg * 1000, 3),
+                "maxWaitMs": round(self.max_wait * 1000, 3),
+                "totalWaitMs": round(self.total_wait * 1000, 3),
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """
+    在公开的 Pool.connect()（Engine 取连接的唯一入口）外层计时，用于暴露连接池等待指标。
+    只覆盖公开接口，不依赖 QueuePool 的私有实现；耗时包含排队等待、新建连接与 pre_ping
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            conn = super().connect()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return conn
+
+    def recreate(self):
+        # dispose()/连接失效时会重建连接池，保留累计统计
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def _is_memory_sqlite(url) -> bool:
+    url = make_url(url)
+    return url.drivername.startswith("sqlite") and url.database in (None, "", ":memory:")
+
+
+def _finalize(options: dict, url) -> dict:
+    options = dict(options)
+    if _is_memory_sqlite(url):
+        for key in _QUEUE_POOL_ONLY:
+            options.pop(key, None)
+    else:
+        options.setdefault("poolclass", TimedQueuePool)
+    return options
+
+
+def apply_engine_options(config) -> None:
+    """
+    在 db.init_app 之前调用：
+    1. 为默认连接池补全 poolclass（内存 SQLite 除外）
+    2. 若配置了 BACKGROUND_POOL_SIZE，为后台线程注册独立的 "background" bind
+    """
+    url = config["SQLALCHEMY_DATABASE_URI"]
+    config["SQLALCHEMY_ENGINE_OPTIONS"] = _finalize(
+        config.get("SQLALCHEMY_ENGINE_OPTIONS", {}), url
+    )
+
+    bg_size = int(config.get("BACKGROUND_POOL_SIZE", 0) or 0)
+    # 内存数据库的每个连接都是独立的库，后台线程必须与请求共用同一个连接
+    if bg_size <= 0 or _is_memory_sqlite(url):
+        return
+    bg_options = dict(config["SQLALCHEMY_ENGINE_OPTIONS"])
+    bg_options.update(
+        url=url,
+        pool_size=bg_size,
+        max_overflow=int(config.get("BACKGROUND_MAX_OVERFLOW", 0)),
+    )
+    binds = dict(config.get("SQLALCHEMY_BINDS") or {})
+    binds.setdefault(BACKGROUND_BIND, bg_options)
+    config["SQLALCHEMY_BINDS"] = binds
+
+
+def configure_sqlite_engines(engines: Dict[Optional[str], object], config) -> None:
+    """
+    在 db.init_app 之后、首次连接之前调用。文件库开启 WAL，使后台温度线程写入时请求线程仍可读取；
+    busy_timeout 让并发写入等待锁释放而不是立即报 database is locked。
+    """
+    journal_mode = config.get("SQLITE_JOURNAL_MODE", "WAL")
+    synchronous = config.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    busy_timeout = int(config.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+    for engine in engines.values():
+        if engine.dialect.name != "sqlite":
+            continue
+        memory = _is_memory_sqlite(engine.url)
+
+        def on_connect(dbapi_connection, connection_record, memory=memory):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+            if not memory:
+                cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+                cursor.execute(f"PRAGMA synchronous = {synchronous}")
+            cursor.close()
+
+        event.listen(engine, "connect", on_connect)
+
+
+def pool_status(engines: Dict[Optional[str], object]) -> dict:
+    """汇总各连接池的实时占用与等待统计"""
+    result = {}
+    for key, engine in engines.items():
+        pool = engine.pool
+        item = {"pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            item.update(
+                size=pool.size(),
+                checkedOut=pool.checkedout(),
+                overflow=pool.overflow(),
+                checkedIn=pool.checkedin(),
+            )
+        stats = getattr(pool, "stats", None)
+        if stats is not None:
+            item.update(stats.to_dict())
+        result[key or "default"] = item
+    return result
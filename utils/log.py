@@ -0,0 +1,186 @@
+# hotel/utils/log.py
+"""
+结构化异步日志
+调度热路径（结算、抢占、轮转、开机等）原本直接 print，在持有 Scheduler._lock 时同步写 stdout，
+终端或日志管道变慢时会拖住整个调度。这里改为标准 logging + 队列：
+- 业务线程只把 LogRecord 放入有界队列（QueueHandler），队列满时丢弃并计数，从不阻塞
+- 单个 QueueListener 线程负责格式化与写出（文本或每行一个 JSON）
+- 按类别采样：高频类别（如 Schedule）的 INFO 及以下每 N 条保留 1 条，WARNING 及以上全部保留
+- 类别即 logger 名 hotel.<类别>，文本格式输出为 "[类别] 消息"，与原 print 的前缀一致
+
+未调用 configure_logging 时 hotel.* 没有处理器，只有 WARNING 及以上会由 logging 默认输出到 stderr。
+"""
+from __future__ import annotations
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime
+from typing import Dict, Optional
+
+ROOT_LOGGER = "hotel"
+
+# LogRecord 自带的属性，其余属性视为 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "category", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["_NonBlockingQueueHandler"] = None
+_sampler: Optional["CategorySampler"] = None
+
+
+def get_logger(category: str) -> logging.Logger:
+    """按类别取 logger，如 get_logger("Schedule") -> hotel.Schedule"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
+
+
+def parse_sample_rates(spec: str) -> Dict[str, int]:
+    """解析 "Schedule=10,Settle=5" 形式的采样配置"""
+    rates = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, _, value = item.partition("=")
+        rates[name.strip()] = max(1, int(value))
+    return rates
+
+
+class CategorySampler(logging.Filter):
+    """按类别采样：rates[类别] = N 表示该类别 INFO 及以下每 N 条保留 1 条"""
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = dict(rates)
+        # itertools.count 的 next() 在 CPython 中是原子的，计数无需加锁
+        self._counters = {name: itertools.count() for name in self.rates}
+        self.skipped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        name = record.name
+        record.category = name[len(ROOT_LOGGER) + 1:] if name.startswith(ROOT_LOGGER + ".") else name
+        if record.levelno >= logging.WARNING:
+            return True
+        counter = self._counters.get(record.category)
+        if counter is None or next(counter) % self.rates[record.category] == 0:
+            return True
+        self.skipped += 1  # 统计值，并发下允许少计
+        return False
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同进程队列无需序列化：消息的 % 格式化留给监听线程，这里只提前渲染异常栈（不持有栈帧）
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """每次写出时取当前的 sys.stdout（兼容脚本中的 redirect_stdout）"""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = f"[{getattr(record, 'category', record.name)}] {record.getMessage()}"
+        if record.levelno >= logging.WARNING:
+            text = f"{record.levelname} {text}"
+        if record.exc_text:
+            text = f"{text}\n{record.exc_text}"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """每行一个 JSON 对象：时间、级别、类别、消息，以及 extra 传入的结构化字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "category": getattr(record, "category", record.name),
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in payload:
+                payload[key] = value
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(
+    level: str = "INFO",
+    fmt: str = "text",
+    sample_rates: Optional[Dict[str, int]] = None,
+    queue_size: int = 10000,
+) -> None:
+    """安装 QueueHandler + QueueListener（可重复调用，后一次替换前一次）"""
+    global _listener, _queue_handler, _sampler
+    shutdown_logging()
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max(1, int(queue_size)))
+    _sampler = CategorySampler(sample_rates or {})
+    _queue_handler = _NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(_sampler)
+
+    output = _StdoutHandler()
+    output.setFormatter(JsonFormatter() if (fmt or "").lower() == "json" else TextFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers = [_queue_handler]
+    root.setLevel((level or "INFO").upper())
+    root.propagate = False
+
+
+def shutdown_logging() -> None:
+    """停止监听线程（会先写完队列中已有的记录）"""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except queue.Full:
+            # 队列已满放不下结束标记：监听线程是守护线程，随进程退出
+            pass
+        _listener = None
+    logging.getLogger(ROOT_LOGGER).handlers = []
+
+
+def logging_status() -> dict:
+    """日志队列积压、因队列满丢弃与因采样跳过的条数"""
+    if _queue_handler is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "level": logging.getLevelName(logging.getLogger(ROOT_LOGGER).level),
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "sampled": _sampler.skipped if _sampler is not None else 0,
+        "sampleRates": dict(_sampler.rates) if _sampler is not None else {},
+    }
+
+
+atexit.register(shutdown_logging)
@@ -2,9 +2,43 @@
 
 from datetime import datetime, timedelta
 import threading
+import time
+from typing import Optional
+
+from .log import get_logger
+
+log = get_logger("TimeMaster")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_ts(value: datetime) -> float:
+    """将逻辑时间 datetime 转换为 clock.now_ts() 同一刻度的浮点秒数"""
+    return (value - _EPOCH).total_seconds()
+
+
+def from_ts(ts: float) -> datetime:
+    """将 clock.now_ts() 刻度的浮点秒数转换回逻辑时间 datetime（精确到微秒）"""
+    return _EPOCH + timedelta(microseconds=round(ts * 1_000_000))
 
 
 class TimeMaster:
+    """
+    逻辑时钟
+    核心只保存两个锚点：上次调整参数时的【单调时钟纳秒数】和对应的【逻辑时间浮点秒】。
+    - now_ts(): 锚点 + 单调时钟流逝 * 倍速，纯浮点运算，不创建 datetime（调度热路径使用）
+    - now():    由 now_ts() 转换出 datetime（写库等持久化场景使用）
+    物理流逝取自 time.monotonic_ns()，NTP 校时或手动修改系统时间不会让逻辑时间跳变；
+    系统墙钟只在初始化时读取一次，作为逻辑时间的起点。
+
+    虚拟时钟模式 (set_manual(True))：逻辑时间完全不随物理时间流逝，只在 advance() 时前进，
+    用于确定性回放/回归测试（配合 TemperatureScheduler.advance 同步执行到期的 tick）。
+
+    跟随模式 (follow(remote))：多进程部署时 worker 不自行计时，直接采用 leader 发布的锚点（snapshot/adopt）。
+    同一主机上 monotonic 时钟在进程间一致，因此相同锚点在各进程算出相同的逻辑时间；
+    调整时钟的方法改为转发给 leader，结果随 IPC 回复同步回来。
+    """
+
     _instance = None
     _lock = threading.Lock()
 
@@ -17,77 +51,136 @@ class TimeMaster:
         return cls._instance
 
     def _init_clock(self):
-        self.speed = 1.0  # 时间流速，1.0为真实时间，6.0为6倍速
-        self.paused = False
-        
-        # 锚点：记录上一次调整参数时的【物理时间】和对应的【逻辑时间】
-        self.anchor_real_time = datetime.utcnow()
-        self.anchor_logical_time = datetime.utcnow()
+        # 锚点：(上一次调整参数时的【物理单调时间 ns】, 对应的【逻辑时间秒】, 倍速, 是否暂停, 是否虚拟时钟)
+        # 整体作为一个元组替换，读取方无需加锁也不会读到新旧混合的锚点
+        self._state = (time.monotonic_ns(), to_ts(datetime.utcnow()), 1.0, False, False)
+        # 每次调整参数递增，跟随方据此忽略乱序到达的旧锚点
+        self._generation = 0
+        self._remote = None
+
+    @property
+    def speed(self) -> float:
+        """时间流速，1.0为真实时间，6.0为6倍速"""
+        return self._state[2]
+
+    @property
+    def paused(self) -> bool:
+        return self._state[3]
+
+    @property
+    def manual(self) -> bool:
+        """是否处于虚拟时钟模式"""
+        return self._state[4]
+
+    @property
+    def remote(self):
+        """跟随模式下的 leader 代理（RemoteScheduler），否则为 None"""
+        return self._remote
+
+    def now_ts(self) -> float:
+        """获取当前逻辑时间的浮点秒数（与 to_ts() 同一刻度）"""
+        anchor_mono_ns, anchor_ts, speed, paused, manual = self._state
+        if paused or manual:
+            return anchor_ts
+        # 逻辑流逝时间 = 物理流逝时间 * 倍速
+        return anchor_ts + (time.monotonic_ns() - anchor_mono_ns) * 1e-9 * speed
 
     def now(self) -> datetime:
         """获取当前的逻辑时间"""
-        if self.paused:
-            return self.anchor_logical_time
-        
-        real_now = datetime.utcnow()
-        real_delta = real_now - self.anchor_real_time
-        # 逻辑流逝时间 = 物理流逝时间 * 倍速
-        logical_delta = real_delta * self.speed
-        return self.anchor_logical_time + logical_delta
+        return from_ts(self.now_ts())
+
+    def _reanchor(self, logical_ts: float, speed: float, paused: bool, manual: Optional[bool] = None) -> None:
+        if manual is None:
+            manual = self.manual
+        self._state = (time.monotonic_ns(), logical_ts, float(speed), paused, manual)
+        self._generation += 1
+
+    # --- 多进程同步 ---
+
+    def snapshot(self) -> tuple:
+        """(版本号, 锚点)，由 leader 随 IPC 回复发布"""
+        with self._lock:
+            return self._generation, self._state
+
+    def adopt(self, snapshot: tuple) -> None:
+        """采用 leader 发布的锚点；版本号不比当前新时忽略"""
+        generation, state = snapshot
+        with self._lock:
+            if generation >= self._generation:
+                self._generation = generation
+                self._state = tuple(state)
+
+    def follow(self, remote) -> None:
+        """worker 进程：以 leader 的时钟为准，本进程不再独立调整时钟"""
+        with self._lock:
+            self._remote = remote
+            # leader 的版本号与本进程此前的版本号无关，第一次同步无条件采用
+            self._generation = -1
 
     def set_speed(self, speed: float):
         """动态调整流速"""
+        if self._remote is not None:
+            self._remote.setSpeed(speed)
+            return
         with self._lock:
-            # 1. 先结算当前时间，更新锚点，防止时间跳变
-            current_logical = self.now()
-            self.anchor_logical_time = current_logical
-            self.anchor_real_time = datetime.utcnow()
-            
-            # 2. 应用新速度
-            self.speed = float(speed)
-            self.paused = False
-            print(f"[TimeMaster] Speed set to {self.speed}x")
+            # 先结算当前时间作为新锚点，防止时间跳变，再应用新速度
+            self._reanchor(self.now_ts(), speed, False)
+            log.info("Speed set to %sx", self.speed, extra={"speed": self.speed})
 
     def pause(self):
         """暂停时间"""
+        if self._remote is not None:
+            self._remote.pauseClock()
+            return
         with self._lock:
             if not self.paused:
-                self.anchor_logical_time = self.now()
-                self.paused = True
-                print("[TimeMaster] Time Paused")
+                self._reanchor(self.now_ts(), self.speed, True)
+                log.info("Time Paused")
 
     def resume(self):
         """恢复时间"""
+        if self._remote is not None:
+            self._remote.resumeClock()
+            return
         with self._lock:
             if self.paused:
-                self.anchor_real_time = datetime.utcnow()
-                self.paused = False
-                print("[TimeMaster] Time Resumed")
+                self._reanchor(self.now_ts(), self.speed, False)
+                log.info("Time Resumed")
 
     def jump_to(self, target_time: datetime):
         """时间跳跃（回到过去或去往未来）"""
+        if self._remote is not None:
+            self._remote.jumpTo(target_time)
+            return
+        with self._lock:
+            self._reanchor(to_ts(target_time), self.speed, self.paused)
+            log.info("Jumped to %s", target_time)
+
+    def set_manual(self, enabled: bool, start: Optional[datetime] = None):
+        """
+        切换虚拟时钟模式。开启后时间只在 advance() 时前进；
+        start 可指定虚拟时间起点，使多次回放的时间戳（以及计费）完全一致。
+        """
+        if self._remote is not None:
+            self._remote.setManual(enabled, start)
+            return
         with self._lock:
-            self.anchor_logical_time = target_time
-            self.anchor_real_time = datetime.utcnow()
-            print(f"[TimeMaster] Jumped to {target_time}")
+            logical_ts = to_ts(start) if start is not None else self.now_ts()
+            self._reanchor(logical_ts, self.speed, False, bool(enabled))
+            log.info("Manual mode %s at %s", "on" if enabled else "off", from_ts(logical_ts))
+
+    def advance(self, seconds: float) -> float:
+        """将逻辑时间向前推进 seconds 秒（虚拟时钟模式下时间前进的唯一方式），返回新的 now_ts"""
+        if seconds < 0:
+            raise ValueError("seconds 不能为负数")
+        if self._remote is not None:
+            # 推进时间必须同时执行 tick，由 leader 的 TemperatureScheduler.advance 完成
+            raise RuntimeError("跟随模式下请通过 TemperatureScheduler.advance 推进时间")
+        with self._lock:
+            logical_ts = self.now_ts() + float(seconds)
+            self._reanchor(logical_ts, self.speed, self.paused)
+            return logical_ts
 
 
 # 全局单例
 clock = TimeMaster()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,16 @@
+"""
+生产环境 WSGI 入口（HTTP 工作进程）
+
+1. 先启动调度主进程（独占调度队列与温度更新）:
+       python scheduler_leader.py
+2. 再启动多个 WSGI 工作进程（在项目父目录执行）:
+       gunicorn -w 4 -b 0.0.0.0:8000 "hotel.wsgi:app"
+
+工作进程不持有调度队列，所有空调控制命令都通过 SCHEDULER_IPC_ADDRESS 转发给主进程，
+因此可以任意扩展进程数而不会出现多个互相矛盾的调度器。
+"""
+from . import create_app
+from .config import WorkerConfig
+
+# 数据库结构由调度主进程负责初始化
+app = create_app(WorkerConfig, setup_database=False)